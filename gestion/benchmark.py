@@ -0,0 +1,514 @@
+"""
+Benchmarks offline de la ingesta y la búsqueda (manage.py benchmark).
+
+AWS se reemplaza por los dobles de fakes_aws (clientes_falsos) con latencia y
+fallas configurables, y Celery corre en modo eager (cada tarea en este mismo
+proceso). Postgres y Redis son los servidores de settings, pero aislados
+(aislado()): una base de pruebas desechable (test_<NAME>, creada con las
+migraciones y borrada al final) y claves de Redis con su propio prefijo. Solo
+con base_actual=True (--base-actual) corre sobre la base configurada. Aun así
+no toca a nadie más: su usuario tiene un nombre único y el lote de embeddings
+solo embebe los documentos del benchmark (embeber_propios), no la cola global.
+
+- ingesta: procesar_archivo_ia de principio a fin (extracción, IA, fragmentos
+  y embeddings), por tipo de archivo: docs/s y latencia por documento.
+- por_tamano: con el usuario de prueba en 10k / 100k / 1M documentos
+  sintéticos, latencia de lista_documentos (listado, búsqueda solo full-text,
+  búsqueda híbrida) y de chat_api (sin y con la caché semántica).
+
+Todo queda bajo un usuario USUARIO-<único> y se borra al terminar (salvo
+conservar=True: se mantiene la base de pruebas y la próxima corrida reutiliza
+los documentos ya creados). ejecutar() devuelve un
+dict serializable a JSON; comparar() lo contrasta con una corrida anterior.
+"""
+import asyncio
+import io
+import json
+import math
+import platform
+import random
+import statistics
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager, nullcontext
+from unittest import mock
+from xml.sax.saxutils import escape
+
+import django
+from celery import current_app
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVector
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import cache_respuestas, chat
+from .busqueda import vector_texto
+from .clientes_aws import clientes_falsos
+from .embeddings import cache_consultas, embeber_documentos, para_embeber
+from .extraccion import NS_DRAWING, NS_EXCEL, NS_WORD
+from .fakes_aws import BedrockFalso, RekognitionFalso, S3Falso, TextractFalso
+from .models import LARGO_PREVIEW, Documento, DocumentoChunk
+from .tasks import procesar_archivo_ia
+from .views import chat_api, lista_documentos
+
+USUARIO = 'benchmark'
+PREFIJO = 'benchmark/'
+# Claves de caché y grupos del channel layer de la corrida aislada
+PREFIJO_REDIS = 'benchmark'
+
+# Solo ASCII y sin paréntesis: el PDF sintético los escribe tal cual
+VOCABULARIO = (
+    'factura', 'proveedor', 'perfume', 'fragancia', 'lote', 'vencimiento', 'bodega', 'despacho',
+    'etiqueta', 'frasco', 'vidrio', 'caja', 'pallet', 'inventario', 'devolucion', 'garantia',
+    'crema', 'locion', 'colonia', 'muestra', 'promocion', 'catalogo', 'precio', 'descuento',
+    'pedido', 'orden', 'compra', 'recepcion', 'calidad', 'reclamo', 'sucursal', 'tienda',
+    'cliente', 'contrato', 'pago', 'transferencia', 'impuesto', 'neto', 'total', 'unidades',
+    'envase', 'tapa', 'atomizador', 'aroma', 'floral', 'citrico', 'amaderado', 'oriental',
+    'temporada', 'navidad',
+)
+
+
+def _texto(azar, palabras):
+    return ' '.join(azar.choice(VOCABULARIO) for _ in range(palabras))
+
+
+def estadisticas(muestras):
+    """ Latencias en ms: media y percentiles """
+    orden = sorted(muestras)
+
+    def percentil(p):
+        return round(orden[min(len(orden) - 1, round(p / 100 * (len(orden) - 1)))] * 1000, 2)
+
+    return {
+        'n': len(orden),
+        'media_ms': round(statistics.fmean(orden) * 1000, 2),
+        'p50_ms': percentil(50),
+        'p95_ms': percentil(95),
+        'p99_ms': percentil(99),
+        'max_ms': round(orden[-1] * 1000, 2),
+    }
+
+
+def medir(funcion, repeticiones, preparar=None):
+    """ Llama funcion(i) CALENTAMIENTO + repeticiones veces; solo se miden las últimas """
+    calentamiento = settings.BENCHMARK['CALENTAMIENTO']
+    muestras = []
+    for i in range(calentamiento + repeticiones):
+        if preparar:
+            preparar(i)
+        inicio = time.perf_counter()
+        funcion(i)
+        if i >= calentamiento:
+            muestras.append(time.perf_counter() - inicio)
+    return estadisticas(muestras)
+
+
+# ==============================================================================
+# ARCHIVOS SINTÉTICOS (uno por tipo, el mismo para todos sus documentos)
+# ==============================================================================
+
+def _zip_office(partes):
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as z:
+        for nombre, xml in partes.items():
+            z.writestr(nombre, xml)
+    return salida.getvalue()
+
+
+def _docx(parrafos):
+    cuerpo = ''.join(f'<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>' for p in parrafos)
+    return _zip_office({'word/document.xml': f'<w:document xmlns:w="{NS_WORD}"><w:body>{cuerpo}</w:body></w:document>'})
+
+
+def _pptx(parrafos, por_diapositiva=5):
+    partes = {}
+    for numero, inicio in enumerate(range(0, len(parrafos), por_diapositiva), start=1):
+        textos = ''.join(f'<a:p><a:r><a:t>{escape(p)}</a:t></a:r></a:p>'
+                         for p in parrafos[inicio:inicio + por_diapositiva])
+        partes[f'ppt/slides/slide{numero}.xml'] = (
+            f'<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" xmlns:a="{NS_DRAWING}">'
+            f'<p:cSld><p:spTree><p:sp><p:txBody>{textos}</p:txBody></p:sp></p:spTree></p:cSld></p:sld>'
+        )
+    return _zip_office(partes)
+
+
+def _xlsx(filas):
+    xml_filas = ''.join(
+        '<row>' + ''.join(f'<c t="inlineStr"><is><t>{escape(celda)}</t></is></c>' for celda in fila) + '</row>'
+        for fila in filas
+    )
+    return _zip_office({'xl/worksheets/sheet1.xml': f'<worksheet xmlns="{NS_EXCEL}"><sheetData>{xml_filas}</sheetData></worksheet>'})
+
+
+def _pdf(paginas):
+    """ PDF mínimo, una página por lista de líneas. Lista vacía = página sin capa de texto (un escaneo). """
+    objetos = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    hojas = []
+    for lineas in paginas:
+        texto = ''.join(f'({linea}) Tj T* ' for linea in lineas)
+        contenido = f'BT /F1 10 Tf 12 TL 40 800 Td {texto}ET' if lineas else ''
+        objetos.append(f'<< /Length {len(contenido)} >>\nstream\n{contenido}\nendstream')
+        objetos.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {len(objetos)} 0 R '
+                       f'/Resources << /Font << /F1 3 0 R >> >> >>')
+        hojas.append(len(objetos))
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(f'{n} 0 R' for n in hojas)}] /Count {len(hojas)} >>"
+
+    salida = b'%PDF-1.4\n'
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(salida))
+        salida += f'{numero} 0 obj\n{objeto}\nendobj\n'.encode('latin-1')
+    inicio_xref = len(salida)
+    salida += f'xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    salida += b''.join(f'{posicion:010d} 00000 n \n'.encode('latin-1') for posicion in posiciones)
+    salida += f'trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n'.encode('latin-1')
+    return salida
+
+
+def _imagen(formato, ancho, alto):
+    """ Ruido: no se comprime, así el peso se parece al de una foto real """
+    salida = io.BytesIO()
+    Image.effect_noise((ancho, alto), 40).convert('RGB').save(salida, formato)
+    return salida.getvalue()
+
+
+# tipo -> (extensión, generador(azar) -> bytes)
+ARCHIVOS = {
+    'txt': ('txt', lambda azar: '\n'.join(_texto(azar, 12) for _ in range(400)).encode('utf-8')),
+    'csv': ('csv', lambda azar: '\n'.join(','.join(_texto(azar, 2) for _ in range(6)) for _ in range(2000)).encode('utf-8')),
+    'docx': ('docx', lambda azar: _docx([_texto(azar, 30) for _ in range(200)])),
+    'pptx': ('pptx', lambda azar: _pptx([_texto(azar, 12) for _ in range(60)])),
+    'xlsx': ('xlsx', lambda azar: _xlsx([[_texto(azar, 2) for _ in range(6)] for _ in range(2000)])),
+    'pdf': ('pdf', lambda azar: _pdf([[_texto(azar, 10) for _ in range(40)] for _ in range(5)])),
+    # Sin capa de texto -> Textract asíncrono
+    'pdf_escaneado': ('pdf', lambda azar: _pdf([[] for _ in range(3)])),
+    # Sobre IA_IMAGEN['UMBRAL_ORIGINAL']: se reduce antes de Textract/Rekognition
+    'jpg': ('jpg', lambda azar: _imagen('JPEG', 3000, 2000)),
+    'png': ('png', lambda azar: _imagen('PNG', 800, 600)),
+}
+
+
+# ==============================================================================
+# ENTORNO: dobles de AWS y Celery en el proceso
+# ==============================================================================
+
+def crear_falsos(latencias, tasa_fallas=0.0, semilla=None, azar=None):
+    """ {servicio: doble} con la latencia de cada uno (settings.BENCHMARK['LATENCIAS']) """
+    azar = azar or random.Random(semilla)
+
+    def simulacion(servicio):
+        return {'latencia': latencias.get(servicio, 0), 'tasa_fallas': tasa_fallas, 'semilla': semilla}
+
+    return {
+        's3': S3Falso(**simulacion('s3')),
+        # Sin IN_PROGRESS: en modo eager la revisión del job corre de inmediato
+        'textract': TextractFalso(lineas=[_texto(azar, 10) for _ in range(60)], revisiones_en_curso=0,
+                                  lineas_por_pagina=1000, **simulacion('textract')),
+        'rekognition': RekognitionFalso(**simulacion('rekognition')),
+        'bedrock_runtime': BedrockFalso(dimensiones=settings.EMBEDDINGS['DIMENSIONES'],
+                                        respuesta=_texto(azar, 60), **simulacion('bedrock')),
+    }
+
+
+@contextmanager
+def celery_en_proceso():
+    conf = current_app.conf
+    anterior = conf.task_always_eager
+    conf.task_always_eager = True
+    try:
+        yield
+    finally:
+        conf.task_always_eager = anterior
+
+
+@contextmanager
+def aislado(conservar=False):
+    """
+    Base de pruebas desechable y Redis con prefijo propio mientras dura el bloque.
+    Sus usuarios pueden repetir ids de usuarios reales: sin el prefijo leerían su
+    caché de respuestas y les mandarían eventos de progreso.
+    conservar=True mantiene la base (keepdb) para la próxima corrida.
+    """
+    # Solo para la base de pruebas: con --base-actual ni se importa
+    from django.test.utils import setup_databases, teardown_databases
+
+    caches_aislados = {alias: dict(config, KEY_PREFIX=PREFIJO_REDIS) for alias, config in settings.CACHES.items()}
+    capas_aisladas = {
+        alias: dict(config, CONFIG=dict(config.get('CONFIG', {}), prefix=PREFIJO_REDIS))
+        for alias, config in settings.CHANNEL_LAYERS.items()
+    }
+    print(f"--> [BENCH] Base de pruebas {'(conservada) ' if conservar else ''}para el benchmark")
+    bases = setup_databases(verbosity=1, interactive=False, keepdb=conservar)
+    try:
+        with override_settings(CACHES=caches_aislados, CHANNEL_LAYERS=capas_aisladas):
+            yield
+    finally:
+        teardown_databases(bases, verbosity=1, keepdb=conservar)
+
+
+def usuario_de_prueba(reutilizar=False):
+    """ Usuario de la corrida, con nombre único (nunca uno real); reutilizar: el de la base conservada """
+    if reutilizar:
+        usuario = User.objects.filter(username__startswith=f"{USUARIO}-").order_by('id').first()
+        if usuario:
+            return usuario
+    return User.objects.create_user(f"{USUARIO}-{uuid.uuid4().hex[:12]}")
+
+
+def embeber_propios(ids):
+    """ El lote de embeddings de la ingesta, solo con estos documentos """
+    docs = list(para_embeber(Documento.objects.filter(id__in=ids, embedding_pendiente=True)).order_by('id'))
+    if docs:
+        embeber_documentos(docs)
+
+
+def uso_cache(antes, despues):
+    """ Aciertos y fallos de una CacheDosNiveles durante la corrida (sus contadores son del proceso) """
+    uso = {clave: despues[clave] - antes[clave] for clave in ('hits_local', 'hits_redis', 'misses', 'errores_redis')}
+    total = uso['hits_local'] + uso['hits_redis'] + uso['misses']
+    uso['tasa_acierto'] = round((uso['hits_local'] + uso['hits_redis']) / total, 3) if total else 0.0
+    return uso
+
+
+def entorno():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'base_de_datos': connection.vendor,
+        'maquina': platform.platform(),
+        'backend_embeddings': settings.EMBEDDINGS['BACKEND'],
+        'metrica_vectorial': settings.BUSQUEDA_VECTORIAL['METRICA'],
+    }
+
+
+# ==============================================================================
+# INGESTA
+# ==============================================================================
+
+def benchmark_ingesta(usuario, s3, tipos, por_tipo, azar):
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    resultados = {}
+    for tipo in tipos:
+        extension, generar = ARCHIVOS[tipo]
+        datos = generar(azar)
+        docs = Documento.objects.bulk_create([
+            Documento(usuario=usuario, titulo=f"{tipo} {i}", estado='pendiente',
+                      archivo=f"{PREFIJO}ingesta/{uuid.uuid4().hex}.{extension}")
+            for i in range(por_tipo)
+        ])
+        for doc in docs:
+            s3.objetos[(bucket, doc.archivo.name)] = datos
+
+        muestras = []
+        inicio = time.perf_counter()
+        # Sin el lote global (en modo eager tomaría pendientes ajenos): se embebe cada documento propio
+        with mock.patch('gestion.tasks.programar_lote_embeddings'):
+            for doc in docs:
+                inicio_doc = time.perf_counter()
+                procesar_archivo_ia(doc.id)
+                embeber_propios([doc.id])
+                muestras.append(time.perf_counter() - inicio_doc)
+        total = time.perf_counter() - inicio
+
+        ids = [doc.id for doc in docs]
+        estados = dict(Documento.objects.filter(id__in=ids).values_list('estado').annotate(n=Count('id')))
+        resultados[tipo] = dict(
+            estadisticas(muestras),
+            bytes=len(datos),
+            docs_por_segundo=round(len(docs) / total, 2),
+            estados=estados,
+            sin_embedding=Documento.objects.filter(id__in=ids, embedding_pendiente=True).count(),
+        )
+    return resultados
+
+
+# ==============================================================================
+# BÚSQUEDA Y CHAT
+# ==============================================================================
+
+def _vector(azar, dimensiones):
+    vector = [azar.gauss(0, 1) for _ in range(dimensiones)]
+    norma = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norma for x in vector]
+
+
+def poblar(usuario, total, azar):
+    """
+    Agrega documentos sintéticos (completos, con un fragmento cada uno) hasta que
+    el usuario tenga 'total'. Los vectores salen de una base de 256 al azar con
+    unas pocas coordenadas cambiadas: todos distintos sin generar 1536 números por fila.
+    """
+    lote = settings.BENCHMARK['LOTE_INSERCION']
+    dimensiones = settings.EMBEDDINGS['DIMENSIONES']
+    sinteticos = Documento.objects.filter(usuario=usuario, archivo__startswith=f"{PREFIJO}sinteticos/")
+    existentes = sinteticos.count()
+    bases = [_vector(azar, dimensiones) for _ in range(256)]
+
+    while existentes < total:
+        docs = []
+        for numero in range(existentes, min(existentes + lote, total)):
+            texto = _texto(azar, 120)
+            vector = list(azar.choice(bases))
+            for posicion in azar.sample(range(dimensiones), 8):
+                vector[posicion] += azar.uniform(-0.1, 0.1)
+            docs.append(Documento(
+                usuario=usuario, titulo=f"{_texto(azar, 3)} {numero}", estado='completado',
+                archivo=f"{PREFIJO}sinteticos/{numero}.pdf",
+                texto_detectado=texto, texto_preview=texto[:LARGO_PREVIEW],
+                tags_ia=azar.sample(VOCABULARIO, 3), embedding=vector,
+            ))
+        with transaction.atomic():
+            docs = Documento.objects.bulk_create(docs)
+            ids = [doc.id for doc in docs]
+            Documento.objects.filter(id__in=ids).update(busqueda=vector_texto())
+            DocumentoChunk.objects.bulk_create([
+                DocumentoChunk(documento=doc, orden=0, texto=doc.texto_detectado, inicio=0,
+                               fin=len(doc.texto_detectado), embedding=doc.embedding)
+                for doc in docs
+            ])
+            DocumentoChunk.objects.filter(documento_id__in=ids).update(
+                busqueda=SearchVector('texto', config=settings.BUSQUEDA_TEXTO['CONFIG'])
+            )
+        existentes += len(docs)
+        print(f"--> [BENCH] {existentes}/{total} documentos sintéticos")
+
+
+def benchmark_busqueda(usuario, repeticiones, azar):
+    """ lista_documentos: listado, búsqueda solo full-text y búsqueda híbrida """
+    factory = RequestFactory()
+    n = settings.BENCHMARK['CALENTAMIENTO'] + repeticiones
+    # Consultas distintas en cada escenario: la caché de embeddings de consultas no debe ayudar
+    consultas_texto = [_texto(azar, 2) for _ in range(n)]
+    consultas_hibridas = [_texto(azar, 2) for _ in range(n)]
+
+    def pedir(parametros):
+        request = factory.get('/', parametros)
+        request.user = usuario
+        respuesta = lista_documentos(request)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"lista_documentos respondió {respuesta.status_code}")
+
+    resultados = {'listado': medir(lambda i: pedir({}), repeticiones)}
+    # Sin vector de la consulta, recuperar() queda solo con la parte full-text
+    with mock.patch('gestion.recuperacion.generar_embedding_consulta', return_value=None):
+        resultados['busqueda_texto'] = medir(lambda i: pedir({'q': consultas_texto[i]}), repeticiones)
+    resultados['busqueda_hibrida'] = medir(lambda i: pedir({'q': consultas_hibridas[i]}), repeticiones)
+    return resultados
+
+
+def benchmark_chat(usuario, repeticiones, azar):
+    """ chat_api de principio a fin: recuperación de fragmentos + Bedrock (el doble) """
+    factory = RequestFactory()
+    preguntas = [f"que dice la {_texto(azar, 3)}" for _ in range(settings.BENCHMARK['CALENTAMIENTO'] + repeticiones)]
+
+    def preguntar(pregunta):
+        request = factory.post('/', json.dumps({'pregunta': pregunta}), content_type='application/json')
+        request.user = usuario
+        respuesta = asyncio.run(chat_api(request))
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"chat_api respondió {respuesta.status_code}")
+
+    return {
+        # Se vacía la caché semántica antes de cada pregunta (fuera de la medición)
+        'chat_api': medir(lambda i: preguntar(preguntas[i]), repeticiones,
+                          preparar=lambda i: cache_respuestas.invalidar_usuario(usuario.id)),
+        # La misma pregunta cada vez: responde la caché semántica
+        'chat_api_cache': medir(lambda i: preguntar(preguntas[0]), repeticiones),
+    }
+
+
+def borrar_datos(usuario):
+    """ Borra los documentos (y fragmentos) del usuario de prueba por partes, y al usuario """
+    while ids := list(Documento.objects.filter(usuario=usuario).values_list('id', flat=True)[:5000]):
+        Documento.objects.filter(id__in=ids).delete()
+    usuario.delete()
+
+
+# ==============================================================================
+# CORRIDA COMPLETA Y COMPARACIÓN
+# ==============================================================================
+
+def ejecutar(tamanos, tipos, por_tipo, repeticiones, latencias, tasa_fallas=0.0,
+             backend=None, semilla=0, conservar=False, base_actual=False):
+    with nullcontext() if base_actual else aislado(conservar):
+        return _ejecutar(tamanos, tipos, por_tipo, repeticiones, latencias, tasa_fallas,
+                         backend, semilla, conservar, base_actual)
+
+
+def _ejecutar(tamanos, tipos, por_tipo, repeticiones, latencias, tasa_fallas,
+              backend, semilla, conservar, base_actual):
+    azar = random.Random(semilla)
+    falsos = crear_falsos(latencias, tasa_fallas, semilla, azar)
+    usuario = usuario_de_prueba(reutilizar=conservar and not base_actual)
+    embeddings = dict(settings.EMBEDDINGS, BACKEND=backend or settings.EMBEDDINGS['BACKEND'])
+
+    resultado = {
+        'version': 1,
+        'fecha': timezone.now().isoformat(),
+        'parametros': {
+            'tamanos': sorted(tamanos), 'tipos': list(tipos), 'docs_por_tipo': por_tipo,
+            'repeticiones': repeticiones, 'latencias': latencias, 'tasa_fallas': tasa_fallas,
+            'semilla': semilla, 'base_actual': base_actual,
+        },
+        'ingesta': {},
+        'por_tamano': {},
+    }
+    cache_antes = cache_consultas.estadisticas()
+    try:
+        with clientes_falsos(**falsos), celery_en_proceso(), override_settings(EMBEDDINGS=embeddings), \
+                mock.patch.object(chat, 'USA_BEDROCK', True):
+            resultado['entorno'] = entorno()
+            if tipos:
+                print(f"--> [BENCH] Ingesta: {', '.join(tipos)} ({por_tipo} de cada uno)")
+                resultado['ingesta'] = benchmark_ingesta(usuario, falsos['s3'], tipos, por_tipo, azar)
+            for tamano in sorted(tamanos):
+                poblar(usuario, tamano, azar)
+                print(f"--> [BENCH] Búsqueda y chat con {tamano} documentos")
+                resultado['por_tamano'][str(tamano)] = dict(
+                    benchmark_busqueda(usuario, repeticiones, azar),
+                    **benchmark_chat(usuario, repeticiones, azar),
+                )
+    finally:
+        # La base de pruebas se borra entera al salir de aislado()
+        if base_actual and not conservar:
+            borrar_datos(usuario)
+
+    # Embeddings de las búsquedas: las repetidas no deberían volver a llamar a Bedrock
+    resultado['cache_embeddings_consultas'] = uso_cache(cache_antes, cache_consultas.estadisticas())
+    resultado['aws'] = {
+        servicio: {'llamadas': len(falso.llamadas), 'fallas_inyectadas': falso.fallas_inyectadas}
+        for servicio, falso in falsos.items()
+    }
+    return resultado
+
+
+def _metricas(resultado):
+    """ {ruta: (valor, mayor_es_mejor)} de las métricas comparables de una corrida """
+    metricas = {}
+    for tipo, datos in resultado.get('ingesta', {}).items():
+        metricas[f"ingesta.{tipo}.docs_por_segundo"] = (datos['docs_por_segundo'], True)
+        metricas[f"ingesta.{tipo}.p95_ms"] = (datos['p95_ms'], False)
+    for tamano, escenarios in resultado.get('por_tamano', {}).items():
+        for escenario, datos in escenarios.items():
+            for percentil in ('p50_ms', 'p95_ms'):
+                metricas[f"por_tamano.{tamano}.{escenario}.{percentil}"] = (datos[percentil], False)
+    return metricas
+
+
+def comparar(anterior, actual, tolerancia):
+    """ Métricas presentes en las dos corridas que empeoraron más que 'tolerancia' (0.2 = 20%) """
+    antes = _metricas(anterior)
+    regresiones = []
+    for ruta, (valor, mayor_es_mejor) in _metricas(actual).items():
+        if ruta not in antes or not antes[ruta][0]:
+            continue
+        cambio = (valor - antes[ruta][0]) / antes[ruta][0]
+        if (-cambio if mayor_es_mejor else cambio) > tolerancia:
+            regresiones.append({'metrica': ruta, 'antes': antes[ruta][0], 'ahora': valor,
+                                'cambio': round(cambio, 3)})
+    return regresiones
@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, TextField
+from django.db.models.functions import Cast, Substr
+from pgvector.django import L2Distance, CosineDistance, MaxInnerProduct
+
+from .models import Documento, DocumentoChunk
+
+# Cada métrica necesita su propio "opclass" en el índice para que Postgres lo use.
+# (Si la métrica de la consulta no coincide con la del índice -> escaneo secuencial)
+METRICAS = {
+    'l2': (L2Distance, 'vector_l2_ops'),
+    'coseno': (CosineDistance, 'vector_cosine_ops'),
+    'producto_interno': (MaxInnerProduct, 'vector_ip_ops'),
+}
+
+
+def config_vectorial(clave):
+    """ Lee un valor de settings.BUSQUEDA_VECTORIAL """
+    return settings.BUSQUEDA_VECTORIAL.get(clave)
+
+
+# Versión de pgvector instalada (se consulta una sola vez por proceso)
+_version_pgvector = None
+
+
+def version_pgvector(cursor):
+    """ Devuelve la versión de la extensión 'vector' como tupla, ej: (0, 8, 0) """
+    global _version_pgvector
+    if _version_pgvector is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        fila = cursor.fetchone()
+        partes = fila[0].split('.') if fila else []
+        _version_pgvector = tuple(int(p) for p in partes if p.isdigit())
+    return _version_pgvector
+
+
+def _ajustar_sesion(cursor, ef_search, probes):
+    # SET LOCAL solo vive dentro de la transacción actual -> no contamina otras consultas
+    if ef_search:
+        cursor.execute("SET LOCAL hnsw.ef_search = %s", [int(ef_search)])
+    if probes:
+        cursor.execute("SET LOCAL ivfflat.probes = %s", [int(probes)])
+
+    # Con filtro por usuario, el índice puede devolver menos de K filas.
+    # El escaneo iterativo (pgvector >= 0.8) sigue leyendo el índice hasta completar K.
+    # En versiones anteriores el parámetro no existe y el SET haría fallar la consulta.
+    iterativo = config_vectorial('ESCANEO_ITERATIVO')
+    if iterativo and version_pgvector(cursor) >= (0, 8):
+        cursor.execute("SET LOCAL hnsw.iterative_scan = %s", [iterativo])
+        cursor.execute("SET LOCAL ivfflat.iterative_scan = %s", ['relaxed_order'])
+
+
+def _mas_cercanos(consulta, vector, k, metrica, distancia_maxima, ef_search, probes):
+    """ Los K registros de 'consulta' más cercanos al vector, con .distancia """
+    k = k or config_vectorial('TOP_K')
+    metrica = metrica or config_vectorial('METRICA')
+    if distancia_maxima is None:
+        distancia_maxima = config_vectorial('DISTANCIA_MAXIMA')
+
+    if metrica not in METRICAS:
+        raise ValueError(f"Métrica no soportada: {metrica}")
+    funcion_distancia = METRICAS[metrica][0]
+
+    # ORDER BY distancia + LIMIT es lo que permite a Postgres usar el índice HNSW/IVFFlat
+    consulta = (
+        consulta
+        .filter(embedding__isnull=False)
+        .annotate(distancia=funcion_distancia('embedding', vector))
+        .order_by('distancia')[:k]
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _ajustar_sesion(
+                cursor,
+                ef_search or config_vectorial('EF_SEARCH'),
+                probes or config_vectorial('PROBES'),
+            )
+        resultados = list(consulta)
+
+    # El escaneo iterativo "relaxed_order" puede devolver filas levemente desordenadas
+    resultados.sort(key=lambda d: d.distancia)
+
+    # El corte por distancia se aplica en Python para no alterar el plan del índice
+    if distancia_maxima is not None:
+        resultados = [d for d in resultados if d.distancia <= distancia_maxima]
+
+    return resultados
+
+
+def buscar_similares(usuario, vector, k=None, metrica=None, distancia_maxima=None,
+                     ef_search=None, probes=None, base=None):
+    """
+    Devuelve los K documentos del usuario más cercanos al vector (lista, no queryset).
+    Cada documento trae el atributo .distancia (menor = más parecido).
+    'base' permite partir de otro queryset (ej: Documento.objects.para_listado()).
+    """
+    base = Documento.objects.all() if base is None else base
+    return _mas_cercanos(base.filter(usuario=usuario), vector, k, metrica,
+                         distancia_maxima, ef_search, probes)
+
+
+def _fragmentos_del_usuario(usuario):
+    # Con el título del documento (para citar la fuente), sin traer su OCR completo
+    return (DocumentoChunk.objects
+            .filter(documento__usuario=usuario)
+            .select_related('documento')
+            .only('id', 'orden', 'texto', 'inicio', 'fin', 'documento', 'documento__titulo'))
+
+
+def buscar_fragmentos_similares(usuario, vector, k=None, metrica=None, distancia_maxima=None,
+                                ef_search=None, probes=None):
+    """ Igual que buscar_similares, pero sobre los fragmentos (índice HNSW de DocumentoChunk) """
+    return _mas_cercanos(_fragmentos_del_usuario(usuario), vector, k, metrica,
+                         distancia_maxima, ef_search, probes)
+
+
+# ==============================================================================
+# BÚSQUEDA FULL-TEXT (tsvector + GIN, reemplaza los icontains)
+# ==============================================================================
+
+def vector_texto():
+    """ Expresión tsvector ponderada: titulo (A) > tags (B) > texto OCR (C) """
+    config = settings.BUSQUEDA_TEXTO['CONFIG']
+    return (
+        SearchVector('titulo', weight='A', config=config)
+        # El cast JSON -> texto se paga una sola vez al guardar, no en cada búsqueda
+        + SearchVector(Cast('tags_ia', TextField()), weight='B', config=config)
+        + SearchVector(
+            Substr('texto_detectado', 1, settings.BUSQUEDA_TEXTO['MAX_CARACTERES']),
+            weight='C', config=config,
+        )
+    )
+
+
+def actualizar_vector_texto(documento_id):
+    """ Recalcula Documento.busqueda en la base (llamar después de guardar titulo/tags/texto) """
+    Documento.objects.filter(pk=documento_id).update(busqueda=vector_texto())
+
+
+def actualizar_vector_fragmentos(documento_id):
+    """ Recalcula DocumentoChunk.busqueda de todos los fragmentos del documento """
+    DocumentoChunk.objects.filter(documento_id=documento_id).update(
+        busqueda=SearchVector('texto', config=settings.BUSQUEDA_TEXTO['CONFIG'])
+    )
+
+
+def _consulta_texto(texto, cualquier_palabra):
+    config = settings.BUSQUEDA_TEXTO['CONFIG']
+    if not cualquier_palabra:
+        # Sintaxis tipo buscador: "frase exacta", -excluir, OR
+        return SearchQuery(texto, config=config, search_type='websearch')
+
+    # Preguntas del chat: basta con que aparezca alguna palabra significativa
+    consulta = None
+    for palabra in texto.split():
+        if len(palabra) > 3:
+            termino = SearchQuery(palabra, config=config, search_type='plain')
+            consulta = termino if consulta is None else consulta | termino
+    return consulta
+
+
+def _por_texto(base, texto, k, cualquier_palabra):
+    consulta = _consulta_texto(texto or '', cualquier_palabra)
+    if consulta is None:
+        return []
+
+    k = k or settings.BUSQUEDA_TEXTO['TOP_K']
+    return list(
+        base
+        .filter(busqueda=consulta)
+        .annotate(rank=SearchRank(F('busqueda'), consulta))
+        .order_by('-rank', '-id')[:k]
+    )
+
+
+def buscar_texto(usuario, texto, k=None, cualquier_palabra=False, base=None):
+    """
+    Devuelve los K documentos del usuario que mejor calzan con el texto (lista).
+    Cada documento trae el atributo .rank (mayor = más relevante).
+    """
+    base = Documento.objects.all() if base is None else base
+    return _por_texto(base.filter(usuario=usuario), texto, k, cualquier_palabra)
+
+
+def buscar_fragmentos_texto(usuario, texto, k=None, cualquier_palabra=False):
+    """ Igual que buscar_texto, pero sobre los fragmentos (índice GIN de DocumentoChunk) """
+    return _por_texto(_fragmentos_del_usuario(usuario), texto, k, cualquier_palabra)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class CacheDosNiveles:
+    """
+    Caché de dos niveles:
+      1. LRU en memoria del proceso (sin red, microsegundos)
+      2. Redis compartido (settings.CACHES['default']) entre web y workers
+
+    Si Redis falla, la caché sigue funcionando solo con el nivel local.
+    """
+
+    def __init__(self, prefijo, ttl, max_local):
+        self.prefijo = prefijo
+        self.ttl = ttl
+        self.max_local = max_local
+        self._local = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+        self._contadores = {'hits_local': 0, 'hits_redis': 0, 'misses': 0, 'errores_redis': 0}
+
+    def _clave_redis(self, clave):
+        return f"{self.prefijo}:{clave}"
+
+    def _contar(self, nombre):
+        with self._lock:
+            self._contadores[nombre] += 1
+
+    def _get_local(self, clave):
+        with self._lock:
+            entrada = self._local.get(clave)
+            if entrada is None:
+                return None
+            expira_en, valor = entrada
+            if expira_en < time.monotonic():
+                del self._local[clave]
+                return None
+            self._local.move_to_end(clave)  # recién usado -> al final
+            return valor
+
+    def _set_local(self, clave, valor):
+        with self._lock:
+            self._local[clave] = (time.monotonic() + self.ttl, valor)
+            self._local.move_to_end(clave)
+            # Desalojo por tamaño: sale el menos usado (el primero)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def get(self, clave):
+        valor = self._get_local(clave)
+        if valor is not None:
+            self._contar('hits_local')
+            return valor
+
+        try:
+            valor = caches['default'].get(self._clave_redis(clave))
+        except Exception as e:
+            print(f"Error leyendo caché Redis: {e}")
+            self._contar('errores_redis')
+            valor = None
+
+        if valor is not None:
+            self._contar('hits_redis')
+            self._set_local(clave, valor)
+            return valor
+
+        self._contar('misses')
+        return None
+
+    def set(self, clave, valor):
+        self._set_local(clave, valor)
+        try:
+            caches['default'].set(self._clave_redis(clave), valor, timeout=self.ttl)
+        except Exception as e:
+            print(f"Error escribiendo caché Redis: {e}")
+            self._contar('errores_redis')
+
+    def delete(self, clave):
+        with self._lock:
+            self._local.pop(clave, None)
+        try:
+            caches['default'].delete(self._clave_redis(clave))
+        except Exception as e:
+            print(f"Error borrando caché Redis: {e}")
+            self._contar('errores_redis')
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['entradas_local'] = len(self._local)
+        total = datos['hits_local'] + datos['hits_redis'] + datos['misses']
+        datos['tasa_acierto'] = round((datos['hits_local'] + datos['hits_redis']) / total, 3) if total else 0.0
+        return datos
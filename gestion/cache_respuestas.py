@@ -0,0 +1,152 @@
+"""
+Caché semántica de respuestas del chatbot, por usuario.
+
+Las mismas preguntas ("¿qué facturas vencen?", "reporte de calidad") llegan una
+y otra vez con distinta redacción. Cada respuesta se guarda junto al embedding
+de la pregunta; una pregunta nueva cuyo vector esté a similitud >= UMBRAL de una
+guardada recibe esa respuesta sin recuperación ni LLM.
+
+El vector se guarda normalizado y en bytes (float32: ~6 KB con 1536 dimensiones,
+contra ~50 KB de una lista de floats de Python), y el coseno queda en un producto
+punto.
+
+Invalidación: cada usuario tiene una versión en Redis que es parte de la clave.
+Cuando un documento suyo termina de procesarse, recibe su embedding o se borra,
+la versión sube (invalidar_usuario) y todas sus entradas anteriores quedan
+inalcanzables, incluso las copias locales de otros procesos. Expiran solas por TTL.
+
+Métricas (aciertos / fallos) en Redis, compartidas por todos los procesos.
+"""
+import math
+import operator
+from array import array
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache import CacheDosNiveles
+from .embeddings import generar_embedding_consulta, normalizar_consulta
+
+cache_respuestas = CacheDosNiveles(
+    prefijo='rag2',  # v2: vectores en bytes
+    ttl=settings.CACHE_RESPUESTAS['TTL'],
+    max_local=settings.CACHE_RESPUESTAS['MAX_LOCAL'],
+)
+
+CLAVE_METRICAS = 'rag_metricas'
+
+
+def _version(usuario_id):
+    try:
+        return caches['default'].get(f"rag_version:{usuario_id}", 0)
+    except Exception as e:
+        print(f"Error leyendo versión caché RAG: {e}")
+        return None  # sin Redis no sabemos si hubo cambios: no se usa la caché
+
+
+def invalidar_usuario(usuario_id):
+    """ Llamar cuando cambian los documentos del usuario (procesado, embedding, borrado) """
+    clave = f"rag_version:{usuario_id}"
+    try:
+        caches['default'].add(clave, 0, timeout=None)
+        caches['default'].incr(clave)
+    except Exception as e:
+        print(f"Error invalidando caché RAG (usuario {usuario_id}): {e}")
+
+
+def _contar(metrica):
+    try:
+        caches['default'].add(f"{CLAVE_METRICAS}:{metrica}", 0, timeout=None)
+        caches['default'].incr(f"{CLAVE_METRICAS}:{metrica}")
+    except Exception:
+        pass  # las métricas nunca rompen el chat
+
+
+def normalizar(vector):
+    """ Vector unitario en float32 (array('f')); vacío si no hay vector o su norma es 0 """
+    norma = math.sqrt(sum(x * x for x in vector or ()))
+    return array('f', (x / norma for x in vector)) if norma else array('f')
+
+
+def similitud(unitario, guardado):
+    """ Coseno entre un vector de normalizar() y los bytes de uno guardado """
+    otro = array('f')
+    otro.frombytes(guardado)
+    return sum(map(operator.mul, unitario, otro))
+
+
+class Consulta:
+    """ Resultado de buscar(): se pasa a guardar() si hubo que generar la respuesta """
+
+    def __init__(self, usuario_id, vector, version, respuesta=None):
+        self.usuario_id = usuario_id
+        self.vector = vector
+        self.version = version
+        self.respuesta = respuesta
+
+
+def buscar(usuario_id, pregunta):
+    """
+    Busca una respuesta guardada para una pregunta parecida (bloqueante: Redis y
+    quizás Bedrock para el embedding). consulta.respuesta = None si no hay.
+    """
+    version = _version(usuario_id)
+    vector = normalizar(generar_embedding_consulta(pregunta) if version is not None else None)
+    consulta = Consulta(usuario_id, vector, version)
+    if not vector:
+        _contar('fallos')
+        return consulta
+
+    clave = f"{usuario_id}:{version}"
+    entradas = cache_respuestas.get(clave) or []
+    umbral = settings.CACHE_RESPUESTAS['UMBRAL_SIMILITUD']
+    mejor, mejor_similitud = None, umbral
+    for entrada in entradas:
+        parecido = similitud(vector, entrada['vector'])
+        if parecido >= mejor_similitud:
+            mejor, mejor_similitud = entrada, parecido
+
+    if mejor is None:
+        _contar('fallos')
+        return consulta
+
+    # LRU dentro del usuario: la usada pasa al frente
+    entradas.remove(mejor)
+    entradas.insert(0, mejor)
+    cache_respuestas.set(clave, entradas)
+    _contar('aciertos')
+    print(f"--> [RAG] Respuesta desde caché (usuario {usuario_id}, similitud {mejor_similitud:.3f})")
+    consulta.respuesta = mejor['respuesta']
+    return consulta
+
+
+def guardar(consulta, pregunta, respuesta):
+    """ Guarda la respuesta generada (respuesta = {'texto', 'acciones', 'docs'}) """
+    if not consulta.vector or consulta.version is None or not normalizar_consulta(pregunta):
+        return
+    clave = f"{consulta.usuario_id}:{consulta.version}"
+    entradas = cache_respuestas.get(clave) or []
+    entradas.insert(0, {
+        'vector': consulta.vector.tobytes(),
+        'respuesta': respuesta,
+    })
+    del entradas[settings.CACHE_RESPUESTAS['MAX_POR_USUARIO']:]
+    cache_respuestas.set(clave, entradas)
+
+
+def metricas():
+    """ Aciertos / fallos de todos los procesos + estadísticas locales de este """
+    try:
+        valores = caches['default'].get_many([f"{CLAVE_METRICAS}:aciertos", f"{CLAVE_METRICAS}:fallos"])
+    except Exception as e:
+        print(f"Error leyendo métricas caché RAG: {e}")
+        valores = {}
+    aciertos = valores.get(f"{CLAVE_METRICAS}:aciertos", 0)
+    fallos = valores.get(f"{CLAVE_METRICAS}:fallos", 0)
+    total = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'tasa_acierto': round(aciertos / total, 3) if total else 0.0,
+        'proceso': cache_respuestas.estadisticas(),
+    }
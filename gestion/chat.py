@@ -0,0 +1,168 @@
+"""
+Generación de respuestas del chatbot RAG, compartida por chat_api (HTTP, async)
+y ChatConsumer (WebSocket, en streaming).
+
+- Con Bedrock: invoke_model_with_response_stream. El EventStream de boto3 es
+  bloqueante, así que se lee en un hilo (pool acotado) y cada trozo de texto se
+  pasa al event loop por una asyncio.Queue apenas llega. También la respuesta
+  entera de chat_api: si se cancela, el hilo lo ve en el próximo evento y suelta
+  la conexión, y el cliente del chat no espera una lectura más que
+  TIMEOUT_GENERACION (así ningún hilo queda colgado de una respuesta abandonada).
+- Sin Bedrock (modo laboratorio): respuesta simulada, también en streaming.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .embeddings import obtener_bedrock
+
+# --- CONFIGURACIÓN DEL CHATBOT ---
+USA_BEDROCK = False
+
+# Llamadas a Bedrock del chat (cada respuesta en curso ocupa un hilo mientras dura)
+_executor_bedrock = ThreadPoolExecutor(
+    max_workers=settings.CHAT['HILOS_BEDROCK'],
+    thread_name_prefix='bedrock_chat',
+)
+
+_FIN = object()
+
+
+def armar_prompt(pregunta, texto_contexto):
+    return f"""Eres un asistente de Retail. Responde usando SOLO este contexto:
+                {texto_contexto}
+
+                Pregunta: {pregunta}
+                """
+
+
+def cuerpo_bedrock(prompt):
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": settings.CHAT['MAX_TOKENS'],
+        "messages": [{"role": "user", "content": prompt}]
+    })
+
+
+def respuesta_simulada(pregunta, docs_contexto):
+    """ (texto, acciones) del modo laboratorio, sin Bedrock """
+    if 'factura' in pregunta or 'vence' in pregunta:
+        texto = (
+            "⚠️ **(Simulación)** Alerta de Tesorería Detectada.\n"
+            "El sistema RAG encontró una factura próxima a vencer en tus documentos."
+        )
+        if docs_contexto:
+            texto += f"\nFuente: {docs_contexto[0].titulo}"
+        acciones = [
+            {'label': '📧 Notificar Contabilidad', 'action': 'notify'},
+            {'label': '💰 Bloquear SAP', 'action': 'block'}
+        ]
+
+    elif 'rot' in pregunta or 'calidad' in pregunta:
+        texto = "🔍 **(Simulación)** Reporte de Calidad: Se detectaron productos dañados en las imágenes analizadas."
+        acciones = [{'label': 'Generar Reclamo', 'action': 'claim'}]
+
+    else:
+        texto = "Modo Laboratorio: No tengo acceso a Bedrock aún, pero busqué en tu base de datos."
+        if docs_contexto:
+            texto += f"\nEncontré estos documentos relacionados: {[d.titulo for d in docs_contexto]}"
+        else:
+            texto += "\nNo encontré documentos que coincidan con tu búsqueda."
+        acciones = []
+
+    return texto, acciones
+
+
+def cliente_chat():
+    """ Bedrock para el chat: ninguna lectura (ni reintento) pasa de TIMEOUT_GENERACION """
+    return obtener_bedrock(
+        read_timeout=settings.CHAT['TIMEOUT_GENERACION'],
+        retries={'max_attempts': 1, 'mode': 'standard'},
+    )
+
+
+async def generar_respuesta(pregunta, texto_contexto, docs_contexto):
+    """ (texto, acciones) completos, sin bloquear el event loop """
+    bedrock_client = cliente_chat() if USA_BEDROCK else None
+    if USA_BEDROCK and bedrock_client:
+        # En streaming aunque se devuelva entera: si wait_for cancela, el hilo se entera
+        partes = [texto async for texto in _stream_en_hilo(bedrock_client, armar_prompt(pregunta, texto_contexto))]
+        return ''.join(partes), [{'label': 'Ver Fuentes', 'action': 'show_sources'}]
+
+    # MODO SIMULACIÓN (la espera no ocupa ningún hilo)
+    await asyncio.sleep(1)
+    return respuesta_simulada(pregunta, docs_contexto)
+
+
+def textos_stream_bedrock(bedrock_client, prompt, cancelado):
+    """ Trozos de texto de la respuesta a medida que Bedrock los genera (bloqueante) """
+    response = bedrock_client.invoke_model_with_response_stream(
+        body=cuerpo_bedrock(prompt),
+        modelId=settings.CHAT['MODELO'],
+        accept='application/json', contentType='application/json'
+    )
+    stream = response['body']
+    try:
+        for evento in stream:
+            if cancelado.is_set():
+                break  # el usuario ya hizo otra pregunta: dejamos de leer
+            parte = evento.get('chunk')
+            if not parte:
+                continue
+            datos = json.loads(parte['bytes'])
+            if datos.get('type') == 'content_block_delta' and datos['delta'].get('type') == 'text_delta':
+                yield datos['delta']['text']
+    finally:
+        stream.close()
+
+
+async def _stream_en_hilo(bedrock_client, prompt):
+    loop = asyncio.get_running_loop()
+    cola = asyncio.Queue()
+    cancelado = threading.Event()
+
+    def producir():
+        try:
+            if cancelado.is_set():
+                return  # se canceló mientras esperaba un hilo libre: ni se llama a Bedrock
+            for texto in textos_stream_bedrock(bedrock_client, prompt, cancelado):
+                loop.call_soon_threadsafe(cola.put_nowait, texto)
+        except Exception as e:
+            loop.call_soon_threadsafe(cola.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(cola.put_nowait, _FIN)
+
+    loop.run_in_executor(_executor_bedrock, producir)
+    try:
+        while True:
+            item = await cola.get()
+            if item is _FIN:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Cancelación (nueva pregunta / socket cerrado / timeout de chat_api): el hilo corta en el próximo evento
+        cancelado.set()
+
+
+async def stream_respuesta(pregunta, texto_contexto, docs_contexto, resultado):
+    """
+    Trozos de la respuesta (async). Al terminar deja en 'resultado' las acciones
+    sugeridas, para mandarlas en el mensaje 'end'.
+    """
+    bedrock_client = cliente_chat() if USA_BEDROCK else None
+    if USA_BEDROCK and bedrock_client:
+        async for texto in _stream_en_hilo(bedrock_client, armar_prompt(pregunta, texto_contexto)):
+            yield texto
+        resultado['acciones'] = [{'label': 'Ver Fuentes', 'action': 'show_sources'}]
+        return
+
+    # MODO SIMULACIÓN: misma experiencia de streaming, palabra por palabra
+    texto, resultado['acciones'] = respuesta_simulada(pregunta, docs_contexto)
+    for palabra in texto.split(' '):
+        await asyncio.sleep(settings.CHAT['PAUSA_SIMULACION'])
+        yield palabra + ' '
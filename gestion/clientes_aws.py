@@ -0,0 +1,117 @@
+"""
+Fábrica de clientes boto3 reutilizables (uno por servicio y por proceso).
+
+Crear un cliente cuesta CPU (carga de modelos JSON de botocore) y cada cliente
+nuevo bota las conexiones keep-alive del anterior. Aquí se crean una sola vez
+por proceso con la configuración de settings.AWS_CLIENTES.
+
+Fork: Celery (prefork) y algunos servidores hacen fork después de importar
+Django. Un cliente heredado compartiría sockets con el proceso padre, así que
+si cambia el PID la caché se descarta y se vuelven a crear.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+_lock = threading.Lock()
+_pid = None
+_sesion = None
+_clientes = {}        # (servicio, opciones) -> cliente
+_falsos = {}          # servicio -> cliente falso (pruebas / benchmarks)
+_contadores = {'creados': {}, 'reinicios': 0}
+
+
+def _config(servicio, opciones):
+    base = dict(settings.AWS_CLIENTES)
+    base.update(opciones)
+    if servicio == 's3':
+        # Igual que django-storages: firma v4 y URLs tipo bucket.s3.amazonaws.com
+        base.setdefault('signature_version', settings.AWS_S3_SIGNATURE_VERSION)
+        base.setdefault('s3', {'addressing_style': settings.AWS_S3_ADDRESSING_STYLE})
+    return Config(**base)
+
+
+def _revisar_fork():
+    """ Si el proceso cambió (fork), los clientes heredados no sirven. Llamar con _lock tomado. """
+    global _pid, _sesion
+    if _pid != os.getpid():
+        if _pid is not None:
+            _contadores['reinicios'] += 1
+        _pid = os.getpid()
+        _clientes.clear()
+        # Las sesiones de boto3 no son thread-safe: una por proceso, usada bajo _lock
+        _sesion = boto3.session.Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            aws_session_token=settings.AWS_SESSION_TOKEN,
+            region_name=settings.AWS_S3_REGION_NAME,
+        )
+
+
+def obtener_cliente(servicio, **opciones):
+    """
+    Cliente cacheado para el servicio ('s3', 'textract', 'rekognition', 'bedrock-runtime').
+    'opciones' sobrescribe la config de botocore (ej: read_timeout=20) y genera
+    un cliente separado para esa combinación.
+    """
+    if servicio in _falsos:
+        return _falsos[servicio]
+
+    clave = (servicio, repr(sorted(opciones.items())))
+    with _lock:
+        _revisar_fork()
+        cliente = _clientes.get(clave)
+        if cliente is None:
+            cliente = _sesion.client(servicio, config=_config(servicio, opciones))
+            _clientes[clave] = cliente
+            _contadores['creados'][servicio] = _contadores['creados'].get(servicio, 0) + 1
+        return cliente
+
+
+def reiniciar_clientes():
+    """ Descarta todos los clientes del proceso (se recrean al pedirlos) """
+    global _pid
+    with _lock:
+        _pid = None
+        _revisar_fork()
+
+
+def precalentar_clientes():
+    """ Crea por adelantado los clientes de settings.AWS_CLIENTES_PRECALENTAR """
+    for servicio in settings.AWS_CLIENTES_PRECALENTAR:
+        try:
+            obtener_cliente(servicio)
+        except Exception as e:
+            print(f"Error creando cliente AWS '{servicio}': {e}")
+
+
+def estadisticas():
+    with _lock:
+        return {
+            'pid': _pid,
+            'creados': dict(_contadores['creados']),
+            'total_creados': sum(_contadores['creados'].values()),
+            'en_cache': len(_clientes),
+            'reinicios_por_fork': _contadores['reinicios'],
+        }
+
+
+@contextmanager
+def clientes_falsos(**falsos):
+    """
+    Reemplaza clientes por dobles locales mientras dura el bloque:
+        with clientes_falsos(textract=TextractFalso()): ...
+    (usar '_' en vez de '-': bedrock_runtime=...)
+    """
+    reemplazos = {servicio.replace('_', '-'): cliente for servicio, cliente in falsos.items()}
+    anteriores = dict(_falsos)
+    _falsos.update(reemplazos)
+    try:
+        yield
+    finally:
+        _falsos.clear()
+        _falsos.update(anteriores)
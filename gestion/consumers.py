@@ -1,11 +1,32 @@
 import json
 import asyncio
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from django.conf import settings
+
+from . import cache_respuestas, progreso
+from .chat import stream_respuesta
+from .recuperacion import contexto_rag_async
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        # Respuesta en curso de ESTE socket (una a la vez)
+        self.respuesta = None
+        self.group_name = None
+        # Eventos de progreso esperando el próximo envío (doc_id -> último evento)
+        self.progreso_pendiente = {}
+        self.envio_progreso = None
+
+        # Sin sesión no hay grupo: AnonymousUser.id es None y todos caerían en "user_None"
+        usuario = self.scope.get("user")
+        if usuario is None or not usuario.is_authenticated:
+            await self.close()
+            return
+
         # 1. Obtener el ID del usuario logueado
-        self.user_id = self.scope["user"].id
+        self.user_id = usuario.id
         self.group_name = f"user_{self.user_id}"
 
         # 2. Unir al usuario a su grupo privado (Ej: "user_1")
@@ -17,6 +38,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        await self.cancelar_respuesta()
+        if self.envio_progreso:
+            self.envio_progreso.cancel()
+        if self.group_name is None:
+            return
         # Salir del grupo al desconectar
         await self.channel_layer.group_discard(
             self.group_name,
@@ -24,28 +50,92 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
     async def receive(self, text_data):
-        # ... (Mantén tu lógica actual del chat aquí) ...
-        # (El código del chat que ya tenías para el streaming)
         text_data_json = json.loads(text_data)
-        mensaje = text_data_json['message']
-        
-        # Simulación de respuesta IA (Streaming)
+        if text_data_json.get('type') == 'sincronizar':
+            # Al (re)conectarse: lo que se perdió desde la última secuencia vista
+            mensaje = await sync_to_async(progreso.resincronizar, thread_sensitive=False)(
+                self.user_id, text_data_json.get('desde')
+            )
+            await self.send(text_data=json.dumps(mensaje))
+            return
+
+        pregunta = (text_data_json.get('message') or '').strip()
+        if not pregunta:
+            return
+
+        # Una pregunta nueva corta la respuesta anterior (si seguía escribiendo)
+        await self.cancelar_respuesta()
+        self.respuesta = asyncio.create_task(self.responder(pregunta))
+
+    async def cancelar_respuesta(self):
+        if self.respuesta and not self.respuesta.done():
+            self.respuesta.cancel()
+            try:
+                await self.respuesta
+            except asyncio.CancelledError:
+                pass
+        self.respuesta = None
+
+    async def responder(self, pregunta):
+        """ Flujo RAG completo: fragmentos relevantes -> LLM en streaming -> start/chunk/end """
         await self.send(text_data=json.dumps({'type': 'start'}))
-        for palabra in f"Analizando solicitud: {mensaje}...".split():
-            await asyncio.sleep(0.05)
-            await self.send(text_data=json.dumps({'type': 'chunk', 'message': palabra + " "}))
-        await self.send(text_data=json.dumps({'type': 'end'}))
-
-    # --- NUEVO MÉTODO PARA RECIBIR SEÑALES DE CELERY ---
-    async def doc_status(self, event):
-        # Este método se activa cuando Celery manda un mensaje tipo "doc.status"
-        datos = event['data']
-        
-        # Reenviamos el mensaje al Javascript
-        await self.send(text_data=json.dumps({
-            'type': 'doc_update',  # Tipo de mensaje para el JS
-            'doc_id': datos['doc_id'],
-            'status': 'listo',
-            'tags': datos['tags'],
-            'texto': datos['texto_preview']
-        }))
+        pregunta = pregunta.lower()
+
+        # PASO 0: pregunta parecida ya respondida -> se manda completa, de una vez
+        consulta = await sync_to_async(cache_respuestas.buscar, thread_sensitive=False)(self.user_id, pregunta)
+        if consulta.respuesta:
+            await self.send(text_data=json.dumps({'type': 'chunk', 'message': consulta.respuesta['texto']}))
+            await self.send(text_data=json.dumps({
+                'type': 'end',
+                'acciones': consulta.respuesta['acciones'],
+                'docs': consulta.respuesta['docs'],
+            }))
+            return
+
+        resultado = {'acciones': []}
+        docs_contexto = []
+        partes = []
+        try:
+            # PASO 1: RETRIEVAL (búsquedas en el pool de hilos, fuera del event loop)
+            texto_contexto, docs_contexto = await contexto_rag_async(self.scope["user"], pregunta)
+
+            # PASO 2: GENERACIÓN, reenviando cada trozo apenas llega
+            async for texto in stream_respuesta(pregunta, texto_contexto, docs_contexto, resultado):
+                partes.append(texto)
+                await self.send(text_data=json.dumps({'type': 'chunk', 'message': texto}))
+
+        except asyncio.CancelledError:
+            await self.send(text_data=json.dumps({'type': 'end', 'cancelado': True}))
+            raise
+        except Exception as e:
+            print(f"Error chat streaming: {e}")
+            await self.send(text_data=json.dumps({'type': 'chunk', 'message': "Error conectando con el cerebro IA."}))
+            partes = None  # los errores no se guardan en la caché
+
+        respuesta = {
+            'texto': ''.join(partes or []).strip(),
+            'acciones': resultado['acciones'],
+            'docs': [d.titulo for d in docs_contexto],
+        }
+        await self.send(text_data=json.dumps(dict(respuesta, type='end')))
+        if partes:
+            await sync_to_async(cache_respuestas.guardar, thread_sensitive=False)(
+                consulta, pregunta, respuesta
+            )
+
+    # --- PROGRESO DE LA INGESTA (eventos de Celery, ver gestion/progreso.py) ---
+    async def doc_progreso(self, event):
+        for evento in event['eventos']:
+            anterior = self.progreso_pendiente.get(evento['doc_id'])
+            if anterior is None or anterior['seq'] < evento['seq']:
+                self.progreso_pendiente[evento['doc_id']] = evento
+        # El primer evento abre una ventana; los que llegan durante ella salen juntos
+        if self.envio_progreso is None:
+            self.envio_progreso = asyncio.create_task(self.enviar_progreso())
+
+    async def enviar_progreso(self):
+        await asyncio.sleep(settings.PROGRESO['INTERVALO_ENVIO'])
+        eventos = sorted(self.progreso_pendiente.values(), key=lambda e: e['seq'])
+        self.progreso_pendiente = {}
+        self.envio_progreso = None
+        await self.send(text_data=json.dumps({'type': 'progreso', 'eventos': eventos}))
@@ -0,0 +1,139 @@
+"""
+Deduplicación por contenido: las tiendas suben una y otra vez las mismas fotos
+de producto y listas de precios. Si ya procesamos un archivo idéntico (mismo
+SHA-256), copiamos su resultado de IA en vez de pagar Textract / Rekognition /
+embedding de nuevo, y opcionalmente reutilizamos el mismo objeto de S3.
+
+El hash se calcula mientras el archivo llega (HashSubidaHandler, primer handler
+de settings.FILE_UPLOAD_HANDLERS), sin una segunda pasada sobre el archivo.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .busqueda import actualizar_vector_texto
+from .cache_respuestas import invalidar_usuario
+from .fragmentos import copiar_fragmentos
+from .models import Documento, LARGO_PREVIEW
+from .progreso import avisar
+
+# Resultado de IA que se copia desde el documento original
+CAMPOS_IA = ('tags_ia', 'texto_detectado', 'embedding', 'confianza_ia')
+# Versiones WebP del mismo contenido: sirven tal cual (si faltan, se generan al mostrarlas)
+CAMPOS_VERSIONES = ('miniatura', 'vista_previa')
+
+# Llamadas a servicios de IA que cuesta procesar cada formato (ver gestion/tasks.py)
+LLAMADAS_POR_FORMATO = {
+    'jpg': {'textract': 1, 'rekognition': 1},
+    'jpeg': {'textract': 1, 'rekognition': 1},
+    'png': {'textract': 1, 'rekognition': 1},
+    'tiff': {'textract': 1},
+    'tif': {'textract': 1},
+    'pdf': {'textract': 1},  # solo si es escaneado; los nativos se leen local
+}
+
+
+class HashSubidaHandler(FileUploadHandler):
+    """
+    Calcula el SHA-256 de cada archivo a medida que llegan los bloques y lo deja en
+    request.hashes_subida[nombre_del_campo]. No guarda nada: pasa los bloques intactos
+    al siguiente handler (memoria / archivo temporal).
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'hashes_subida'):
+            self.request.hashes_subida = {}
+        self.request.hashes_subida[self.field_name] = self.sha256.hexdigest()
+        return None  # el archivo lo arma el handler siguiente
+
+
+def hash_archivo(request, campo):
+    """ Hash del archivo subido en 'campo' (si el handler no corrió, se calcula aquí) """
+    digest = getattr(request, 'hashes_subida', {}).get(campo)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for bloque in request.FILES[campo].chunks():
+        sha256.update(bloque)
+    return sha256.hexdigest()
+
+
+def buscar_original(usuario, hash_contenido):
+    """
+    Primer documento ya procesado del mismo usuario con el mismo contenido (o None).
+    Nunca de otro usuario: se le estaría dando su objeto de S3 y su texto, y la
+    subida instantánea delataría que otro ya subió ese archivo.
+    Sin embedding no sirve de original: la copia quedaría fuera de la búsqueda semántica.
+    """
+    if not hash_contenido:
+        return None
+    return (Documento.objects
+            .filter(usuario=usuario, hash_contenido=hash_contenido, estado='completado',
+                    embedding__isnull=False, embedding_pendiente=False, duplicado_de__isnull=True)
+            .exclude(texto_detectado__startswith='Error de lectura')
+            .order_by('id')
+            .first())
+
+
+def copiar_resultado(documento, original):
+    """ Completa 'documento' (sin guardar aún) con el resultado de IA de 'original' """
+    for campo in CAMPOS_IA + CAMPOS_VERSIONES:
+        setattr(documento, campo, getattr(original, campo))
+    documento.texto_preview = (original.texto_detectado or '')[:LARGO_PREVIEW]
+    documento.duplicado_de = original
+    documento.estado = 'completado'
+    if settings.DEDUPLICACION['REUSAR_OBJETO_S3']:
+        # Asignar el nombre (str) evita que el FileField vuelva a subir el archivo
+        documento.archivo = original.archivo.name
+
+
+def guardar_duplicado(documento, original):
+    copiar_resultado(documento, original)
+    documento.save()
+    # El tsvector no se copia: incluye el título, que puede ser distinto
+    actualizar_vector_texto(documento.id)
+    copiar_fragmentos(original, documento)
+    invalidar_usuario(documento.usuario_id)
+    avisar(documento, 'listo')
+    print(f"--> [DEDUP] Documento {documento.id} reutiliza el resultado de {original.id}")
+
+
+def llamadas_ahorradas(extension):
+    """ Llamadas de IA que se evitó un duplicado de esta extensión (el embedding siempre cuenta) """
+    llamadas = dict(LLAMADAS_POR_FORMATO.get(extension, {}))
+    llamadas['embedding'] = 1
+    return llamadas
+
+
+def reporte():
+    """ Cuántos documentos se deduplicaron y cuántas llamadas de IA se ahorraron """
+    duplicados = Documento.objects.filter(duplicado_de__isnull=False)
+    por_extension = {}
+    objetos_s3_reutilizados = 0
+    for doc in duplicados.select_related('duplicado_de').only('archivo', 'duplicado_de', 'duplicado_de__archivo'):
+        por_extension[doc.extension] = por_extension.get(doc.extension, 0) + 1
+        if doc.archivo.name == doc.duplicado_de.archivo.name:
+            objetos_s3_reutilizados += 1
+
+    llamadas = {}
+    for extension, cantidad in por_extension.items():
+        for servicio, n in llamadas_ahorradas(extension).items():
+            llamadas[servicio] = llamadas.get(servicio, 0) + n * cantidad
+
+    return {
+        'documentos_deduplicados': sum(por_extension.values()),
+        'por_extension': por_extension,
+        'llamadas_ia_ahorradas': llamadas,
+        'total_llamadas_ia_ahorradas': sum(llamadas.values()),
+        'objetos_s3_reutilizados': objetos_s3_reutilizados,
+        'originales_con_duplicados': duplicados.values('duplicado_de').distinct().count(),
+    }
@@ -0,0 +1,422 @@
+"""
+Servicio de embeddings.
+
+- Backend intercambiable (settings.EMBEDDINGS['BACKEND']):
+    'titan' -> Amazon Titan en Bedrock (una llamada por texto)
+    'local' -> vector determinístico derivado del texto, sin red (demo, pruebas, benchmarks)
+- Consultas del buscador: un texto, con caché de dos niveles.
+- Ingesta: micro-lotes. Los documentos quedan con embedding_pendiente=True y una
+  sola tarea (procesar_lote_embeddings) junta hasta TAMANO_LOTE, los embebe con
+  concurrencia acotada y control de tasa adaptativo (AIMD: sube de a poco con
+  cada éxito, baja a la mitad con cada throttling) y los guarda con bulk_update.
+  Los fragmentos (DocumentoChunk) del documento van en el mismo lote.
+  Cada lote reclama sus filas (SKIP LOCKED); un documento al que le faltó algún
+  vector se reintenta con espera creciente y sale de la cola tras MAX_INTENTOS.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, Min, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .cache import CacheDosNiveles
+from .clientes_aws import obtener_cliente
+from .models import Documento, DocumentoChunk
+
+MODELO_EMBEDDINGS = "amazon.titan-embed-text-v1"
+
+# Códigos de error de Bedrock que significan "bájale a la velocidad"
+CODIGOS_LIMITACION = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+
+
+def obtener_bedrock(**opciones):
+    """ Cliente Bedrock compartido del proceso (None si no se puede crear); opciones: ver obtener_cliente """
+    try:
+        return obtener_cliente('bedrock-runtime', **opciones)
+    except Exception as e:
+        print(f"Error creando cliente Bedrock: {e}")
+        return None
+
+
+def _invocar_titan(bedrock_client, texto):
+    body = json.dumps({"inputText": texto})
+    response = bedrock_client.invoke_model(
+        body=body,
+        modelId=MODELO_EMBEDDINGS,
+        accept="application/json",
+        contentType="application/json"
+    )
+    response_body = json.loads(response.get("body").read())
+    return response_body.get("embedding")
+
+
+# ==============================================================================
+# BACKENDS
+# ==============================================================================
+class BackendTitan:
+    modelo = MODELO_EMBEDDINGS
+
+    def __init__(self):
+        # El cliente se pide aquí (hilo principal), no dentro de los hilos del lote
+        self.cliente = obtener_cliente('bedrock-runtime')
+
+    def embeber(self, texto):
+        return _invocar_titan(self.cliente, texto)
+
+
+class BackendLocal:
+    """ Mismo texto -> mismo vector (normalizado), sin llamar a AWS """
+    modelo = "local-sha256"
+
+    def __init__(self):
+        self.dimensiones = settings.EMBEDDINGS['DIMENSIONES']
+
+    def embeber(self, texto):
+        semilla = hashlib.sha256(texto.encode('utf-8')).digest()
+        generador = random.Random(semilla)
+        vector = [generador.uniform(-1.0, 1.0) for _ in range(self.dimensiones)]
+        norma = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norma for x in vector]
+
+
+BACKENDS = {
+    'titan': BackendTitan,
+    'local': BackendLocal,
+}
+
+
+def obtener_backend(nombre=None):
+    return BACKENDS[nombre or settings.EMBEDDINGS['BACKEND']]()
+
+
+def es_limitacion(e):
+    """ True si el error de botocore es un throttling de Bedrock """
+    codigo = getattr(e, 'response', {}).get('Error', {}).get('Code')
+    return codigo in CODIGOS_LIMITACION
+
+
+# ==============================================================================
+# CONSULTAS (buscador y chat)
+# ==============================================================================
+
+# Los usuarios repiten las mismas búsquedas ("factura", "perfume rojo"...) todo el día
+cache_consultas = CacheDosNiveles(
+    prefijo='emb',
+    ttl=settings.CACHE_EMBEDDINGS['TTL'],
+    max_local=settings.CACHE_EMBEDDINGS['MAX_LOCAL'],
+)
+
+
+def normalizar_consulta(texto):
+    """ 'Perfume  ROJO ' y 'perfume rojo' deben compartir la misma entrada de caché """
+    texto = unicodedata.normalize('NFC', texto or '')
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+def clave_consulta(texto, modelo=MODELO_EMBEDDINGS):
+    # Hash para que la clave de Redis tenga largo fijo aunque la consulta sea enorme
+    digest = hashlib.sha256(normalizar_consulta(texto).encode('utf-8')).hexdigest()
+    return f"{modelo}:{digest}"
+
+
+def generar_embedding_consulta(texto):
+    """ Convierte la búsqueda del usuario en un Vector con el backend configurado (con caché) """
+    if not normalizar_consulta(texto):
+        return None
+
+    try:
+        backend = obtener_backend()
+    except Exception as e:
+        print(f"Error creando backend de embeddings: {e}")
+        return None
+
+    clave = clave_consulta(texto, backend.modelo)
+    vector = cache_consultas.get(clave)
+    if vector is not None:
+        return vector
+
+    try:
+        vector = backend.embeber(normalizar_consulta(texto))
+    except Exception as e:
+        print(f"Error generando vector consulta: {e}")
+        return None
+
+    # Los errores no se guardan: el próximo intento vuelve a preguntar a Bedrock
+    if vector:
+        cache_consultas.set(clave, vector)
+    return vector
+
+
+# ==============================================================================
+# LOTES (ingesta)
+# ==============================================================================
+class ControlTasa:
+    """
+    Limita las llamadas por segundo, compartido por los hilos del lote.
+    Aumento aditivo con cada éxito, disminución multiplicativa con cada throttling.
+    """
+
+    def __init__(self, config):
+        self.tasa = config['TASA_INICIAL']
+        self.tasa_minima = config['TASA_MINIMA']
+        self.tasa_maxima = config['TASA_MAXIMA']
+        self.incremento = config['INCREMENTO_TASA']
+        self.factor_baja = config['FACTOR_BAJA']
+        self.limitaciones = 0
+        self._proximo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        """ Reserva el siguiente turno y duerme hasta que llegue """
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._proximo)
+            self._proximo = turno + 1.0 / self.tasa
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+    def exito(self):
+        with self._lock:
+            self.tasa = min(self.tasa_maxima, self.tasa + self.incremento)
+
+    def limitado(self):
+        with self._lock:
+            self.tasa = max(self.tasa_minima, self.tasa * self.factor_baja)
+            self.limitaciones += 1
+            # Pausa para todos los hilos antes del próximo intento
+            self._proximo = max(self._proximo, time.monotonic() + 1.0 / self.tasa)
+
+
+# Uno por proceso: la tasa aprendida se mantiene entre un lote y el siguiente
+_control = None
+_control_lock = threading.Lock()
+
+
+def control_tasa():
+    global _control
+    with _control_lock:
+        if _control is None:
+            _control = ControlTasa(settings.EMBEDDINGS)
+        return _control
+
+
+def generar_embeddings(textos, backend=None, control=None, concurrencia=None):
+    """
+    Vectores para una lista de textos (None en la posición de los que fallaron).
+    Textos repetidos se embeben una sola vez.
+    """
+    config = settings.EMBEDDINGS
+    backend = backend or obtener_backend()
+    control = control or control_tasa()
+    unicos = list(dict.fromkeys(textos))
+    vectores = {}
+
+    def embeber(texto):
+        for _ in range(config['REINTENTOS'] + 1):
+            control.esperar()
+            try:
+                vector = backend.embeber(texto)
+            except Exception as e:
+                if es_limitacion(e):
+                    control.limitado()
+                    continue
+                print(f"Error generando embedding: {e}")
+                return
+            control.exito()
+            vectores[texto] = vector
+            return
+        print(f"Embedding descartado: Bedrock siguió limitando tras {config['REINTENTOS']} reintentos")
+
+    with ThreadPoolExecutor(max_workers=concurrencia or config['CONCURRENCIA'], thread_name_prefix='embeddings') as executor:
+        list(executor.map(embeber, unicos))
+
+    return [vectores.get(texto) for texto in textos]
+
+
+def texto_para_embedding(doc):
+    """ Lo que se embebe de un documento: título, etiquetas y el comienzo del texto """
+    partes = [doc.titulo or '', ' '.join(doc.tags_ia or []), doc.texto_corto or '']
+    return '\n'.join(parte for parte in partes if parte).strip() or (doc.titulo or '')
+
+
+def texto_fragmento(titulo, fragmento):
+    # El título ayuda a ubicar un fragmento suelto ("Contrato arriendo ..." + cláusula)
+    return f"{titulo or ''}\n{fragmento.texto}".strip()
+
+
+def para_embeber(queryset):
+    """ Solo lo que se embebe de cada documento (el comienzo del OCR, no textos de megas) """
+    return (queryset
+            .only('id', 'titulo', 'tags_ia', 'usuario_id', 'embedding_intentos')
+            .annotate(texto_corto=Substr('texto_detectado', 1, settings.EMBEDDINGS['MAX_CARACTERES_TEXTO']),
+                      tiene_embedding=ExpressionWrapper(Q(embedding__isnull=False), output_field=BooleanField())))
+
+
+def embeber_documentos(docs, backend=None, reemplazar=False, concurrencia=None):
+    """
+    Genera y guarda (bulk_update) los vectores de estos documentos (de para_embeber)
+    y de sus fragmentos. Un documento deja de estar pendiente solo si todos sus
+    vectores quedaron listos.
+
+    reemplazar=False: solo lo que no tiene vector (el flujo normal; un documento
+    al que solo le faltan fragmentos conserva el suyo).
+    reemplazar=True: todos (cambio de modelo). Lo que falle queda en None y el
+    documento pendiente, así el lote normal lo completa después con el modelo nuevo.
+
+    Devuelve {usuario_id: [documentos completos]} de los usuarios con vectores nuevos.
+    """
+    titulos = {doc.id: doc.titulo for doc in docs}
+    fragmentos = DocumentoChunk.objects.filter(documento_id__in=titulos)
+    if not reemplazar:
+        fragmentos = fragmentos.filter(embedding__isnull=True)
+    fragmentos = list(fragmentos.only('id', 'documento_id', 'texto'))
+
+    por_embeber = [doc for doc in docs if reemplazar or not doc.tiene_embedding]
+    inicio = time.monotonic()
+    textos = [texto_para_embedding(doc) for doc in por_embeber]
+    textos += [texto_fragmento(titulos[f.documento_id], f) for f in fragmentos]
+    vectores = generar_embeddings(textos, backend, concurrencia=concurrencia)
+    vectores_docs = dict(zip((doc.id for doc in por_embeber), vectores))
+
+    fragmentos_listos = []
+    incompletos = set()
+    for fragmento, vector in zip(fragmentos, vectores[len(por_embeber):]):
+        if not vector:
+            incompletos.add(fragmento.documento_id)
+            if not reemplazar:
+                continue
+        # Sin vector nuevo, el viejo (de otro modelo) tampoco sirve
+        fragmento.embedding = vector or None
+        fragmentos_listos.append(fragmento)
+
+    ahora = timezone.now()
+    listos, sin_vector = [], []
+    for doc in docs:
+        vector = vectores_docs.get(doc.id)
+        if doc.id in vectores_docs and not vector:
+            incompletos.add(doc.id)
+        if vector or (reemplazar and doc.id in vectores_docs):
+            doc.embedding = vector or None
+            listos.append(doc)
+        else:
+            sin_vector.append(doc)
+        # Si le faltó algún vector sigue pendiente: el próximo lote embebe solo esos
+        doc.embedding_pendiente = doc.id in incompletos
+        _anotar_intento(doc, ahora)
+
+    intentos = ['embedding_pendiente', 'embedding_intentos', 'embedding_reintento']
+    with transaction.atomic():
+        DocumentoChunk.objects.bulk_update(fragmentos_listos, ['embedding'], batch_size=500)
+        Documento.objects.bulk_update(listos, ['embedding'] + intentos)
+        Documento.objects.bulk_update(sin_vector, intentos)
+
+    usuarios = {}
+    con_vectores_nuevos = {doc.id for doc in listos} | {f.documento_id for f in fragmentos_listos}
+    for doc in docs:
+        if doc.id not in con_vectores_nuevos:
+            continue
+        completos = usuarios.setdefault(doc.usuario_id, [])
+        if doc.id not in incompletos:
+            completos.append(doc)
+    total_completos = sum(len(completos) for completos in usuarios.values())
+    print(f"--> [EMB] Lote: {total_completos}/{len(docs)} documentos, "
+          f"{sum(1 for f in fragmentos_listos if f.embedding is not None)}/{len(fragmentos)} "
+          f"fragmentos en {time.monotonic() - inicio:.1f}s (tasa {control_tasa().tasa:.1f}/s)")
+    return usuarios
+
+
+def _anotar_intento(doc, ahora):
+    """ Completo: se limpia la cuenta. Incompleto: espera creciente y, tras MAX_INTENTOS, sale de la cola. """
+    config = settings.EMBEDDINGS
+    if not doc.embedding_pendiente:
+        doc.embedding_intentos, doc.embedding_reintento = 0, None
+        return
+    doc.embedding_intentos += 1
+    if doc.embedding_intentos >= config['MAX_INTENTOS']:
+        # Ya no ocupa la cabeza de cada lote; sigue apareciendo en la búsqueda por texto
+        doc.embedding_pendiente, doc.embedding_reintento = False, None
+        print(f"--> [EMB] Documento {doc.id} sin embedding completo tras {doc.embedding_intentos} intentos: "
+              f"sale de la cola (manage.py reprocesar --modo embeddings lo rehace)")
+        return
+    espera = min(config['ESPERA_REINTENTO_MAXIMA'], config['ESPERA_REINTENTO'] * 2 ** (doc.embedding_intentos - 1))
+    doc.embedding_reintento = ahora + timedelta(seconds=espera)
+
+
+def _disponibles(ahora):
+    """ Pendientes que se pueden tomar ya (sin espera de reintento ni otro lote que los tenga) """
+    return Documento.objects.filter(embedding_pendiente=True).filter(
+        Q(embedding_reintento__isnull=True) | Q(embedding_reintento__lte=ahora)
+    )
+
+
+def reclamar_pendientes(tamano_lote):
+    """
+    Ids de hasta tamano_lote documentos disponibles, reclamados para este lote:
+    SELECT ... FOR UPDATE SKIP LOCKED y embedding_reintento = ahora + TIMEOUT_LOTE.
+    Dos lotes simultáneos nunca toman las mismas filas, aunque la marca de Redis
+    haya expirado; si el worker muere, el reclamo vence solo.
+    Primero los que nunca fallaron: los que fallan no tapan la cola.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            _disponibles(ahora)
+            .order_by('embedding_intentos', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:tamano_lote]
+        )
+        Documento.objects.filter(id__in=ids).update(
+            embedding_reintento=ahora + timedelta(seconds=settings.EMBEDDINGS['TIMEOUT_LOTE'])
+        )
+    return ids
+
+
+def embeber_pendientes(tamano_lote=None, backend=None):
+    """
+    Reclama un lote de documentos con embedding_pendiente y los embebe (embeber_documentos).
+    Devuelve (listos, tomados, {usuario_id: [documentos completos]}).
+    """
+    tamano_lote = tamano_lote or settings.EMBEDDINGS['TAMANO_LOTE']
+    ids = reclamar_pendientes(tamano_lote)
+    if not ids:
+        return 0, 0, {}
+
+    docs = list(para_embeber(Documento.objects.filter(id__in=ids)).order_by('id'))
+    try:
+        usuarios = embeber_documentos(docs, backend)
+    except Exception:
+        # Un lote que revienta cuenta como intento fallido de todos sus documentos
+        ahora = timezone.now()
+        for doc in docs:
+            doc.embedding_pendiente = True
+            _anotar_intento(doc, ahora)
+        Documento.objects.bulk_update(docs, ['embedding_pendiente', 'embedding_intentos', 'embedding_reintento'])
+        raise
+    return sum(len(completos) for completos in usuarios.values()), len(docs), usuarios
+
+
+def espera_siguiente_lote(tomados):
+    """
+    Segundos hasta el próximo lote, o None si la cola está vacía. Si solo quedan
+    documentos esperando su reintento, hasta que venza el primero.
+    """
+    config = settings.EMBEDDINGS
+    ahora = timezone.now()
+    if _disponibles(ahora).exists():
+        # Lote lleno: probablemente quedan más en cola, se sigue de inmediato
+        return 0 if tomados >= config['TAMANO_LOTE'] else config['ESPERA_LOTE']
+    proximo = Documento.objects.filter(embedding_pendiente=True).aggregate(proximo=Min('embedding_reintento'))['proximo']
+    if proximo is None:
+        return None
+    return max(0.0, (proximo - ahora).total_seconds())
@@ -0,0 +1,399 @@
+"""
+Extracción de texto en streaming, con un registro de extractores por formato.
+
+Nada se carga completo en memoria: el archivo de S3 se baja por bloques a un
+SpooledTemporaryFile (RAM hasta SPOOL_MAX_MEMORIA, después disco), los XML de
+Office se recorren con iterparse soltando cada nodo ya leído, y el texto
+acumulado tiene un tope (MAX_CARACTERES). La memoria del worker queda plana
+sin importar el tamaño del documento.
+
+Cada extractor declara sus extensiones / MIME y si puede resolver el archivo
+localmente (es_local). Los que no, dependen de un servicio de AWS (Textract).
+"""
+import codecs
+import csv
+import mimetypes
+import re
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+from django.conf import settings
+from pypdf import PdfReader
+
+from .clientes_aws import obtener_cliente
+
+# Namespaces oficiales de Office Open XML
+NS_WORD = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+NS_EXCEL = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_DRAWING = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+
+def config_extraccion(clave):
+    return settings.EXTRACCION[clave]
+
+
+class AcumuladorTexto:
+    """ Junta fragmentos de texto hasta un máximo de caracteres """
+
+    def __init__(self, limite=None, separador="\n"):
+        self.limite = limite or config_extraccion('MAX_CARACTERES')
+        self.separador = separador
+        self.partes = []
+        self.largo = 0
+        self.truncado = False
+
+    @property
+    def lleno(self):
+        return self.largo >= self.limite
+
+    def agregar(self, fragmento):
+        """ Devuelve False cuando ya no cabe más texto (el llamador puede dejar de leer) """
+        if self.lleno:
+            self.truncado = True
+            return False
+        if self.partes:
+            self.largo += len(self.separador)
+        restante = self.limite - self.largo
+        if len(fragmento) > restante:
+            fragmento = fragmento[:restante]
+            self.truncado = True
+        self.partes.append(fragmento)
+        self.largo += len(fragmento)
+        return not self.lleno
+
+    def texto(self):
+        return self.separador.join(self.partes)
+
+
+def recortar(texto):
+    """ Aplica MAX_CARACTERES a un texto ya armado (ej: OCR de Textract) """
+    return texto[:config_extraccion('MAX_CARACTERES')]
+
+
+def descargar_a_spool(client_s3, bucket_name, file_name):
+    """ Baja el objeto de S3 por bloques a un archivo temporal acotado en RAM """
+    spool = tempfile.SpooledTemporaryFile(max_size=config_extraccion('SPOOL_MAX_MEMORIA'))
+    obj = client_s3.get_object(Bucket=bucket_name, Key=file_name)
+    for bloque in obj['Body'].iter_chunks(config_extraccion('TAMANO_BLOQUE')):
+        spool.write(bloque)
+    spool.seek(0)
+    return spool
+
+
+def recorrer_xml(archivo_xml):
+    """
+    Recorre un XML en streaming. Entrega (nodo, padre) al cerrarse cada nodo y
+    luego lo desprende del padre, así el árbol en memoria nunca crece.
+    (Ojo: cuando se entrega un nodo, sus hijos ya fueron desprendidos.)
+    """
+    padres = []
+    for evento, nodo in ET.iterparse(archivo_xml, events=('start', 'end')):
+        if evento == 'start':
+            padres.append(nodo)
+            continue
+        padres.pop()
+        padre = padres[-1] if padres else None
+        yield nodo, padre
+        if padre is not None:
+            padre.remove(nodo)
+
+
+def textos_xml(archivo_xml, etiqueta):
+    """ Texto de cada nodo 'etiqueta' del XML (en streaming) """
+    for nodo, _ in recorrer_xml(archivo_xml):
+        if nodo.tag == etiqueta and nodo.text:
+            yield nodo.text
+
+
+def _partes_numeradas(z, patron):
+    """ Miembros del ZIP que calzan con el patrón, en orden numérico (slide2 antes que slide10) """
+    miembros = []
+    for nombre in z.namelist():
+        calce = re.fullmatch(patron, nombre)
+        if calce:
+            miembros.append((int(calce.group(1)), nombre))
+    return [nombre for _, nombre in sorted(miembros)]
+
+
+def lineas_texto(client_s3, bucket_name, file_name):
+    """ Líneas de un archivo de texto UTF-8 de S3, decodificadas de a bloques """
+    obj = client_s3.get_object(Bucket=bucket_name, Key=file_name)
+    cuerpo = obj['Body']
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pendiente = ""
+    try:
+        for bloque in cuerpo.iter_chunks(config_extraccion('TAMANO_BLOQUE')):
+            pendiente += decoder.decode(bloque)
+            lineas = pendiente.splitlines(keepends=True)
+            # La última línea puede venir cortada: se completa con el bloque siguiente
+            pendiente = lineas.pop() if lineas and not lineas[-1].endswith(('\n', '\r')) else ""
+            yield from lineas
+        pendiente += decoder.decode(b'', final=True)
+        if pendiente:
+            yield pendiente
+    finally:
+        cuerpo.close()
+
+
+# ==============================================================================
+# REGISTRO DE EXTRACTORES
+# ==============================================================================
+REGISTRO_EXTENSIONES = {}
+REGISTRO_MIME = {}
+
+
+def registrar(clase):
+    """ Decorador: agrega el extractor al registro por extensión y MIME """
+    for ext in clase.extensiones:
+        REGISTRO_EXTENSIONES[ext] = clase
+    for mime in clase.mimetypes:
+        REGISTRO_MIME[mime] = clase
+    return clase
+
+
+def obtener_extractor(client_s3, bucket_name, file_name, mimetype=None):
+    """ Instancia el extractor adecuado para el archivo, o None si el formato no está soportado """
+    ext = file_name.split('.')[-1].lower()
+    clase = REGISTRO_EXTENSIONES.get(ext)
+    if clase is None:
+        mimetype = mimetype or mimetypes.guess_type(file_name)[0]
+        clase = REGISTRO_MIME.get(mimetype)
+    return clase(client_s3, bucket_name, file_name) if clase else None
+
+
+class Extractor:
+    extensiones = ()
+    mimetypes = ()
+    nombre = ''
+
+    def __init__(self, client_s3, bucket_name, file_name):
+        self.client_s3 = client_s3
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    @property
+    def spool(self):
+        """ Copia local del archivo (se baja una sola vez, la primera vez que se pide) """
+        if self._spool is None:
+            self._spool = descargar_a_spool(self.client_s3, self.bucket_name, self.file_name)
+        self._spool.seek(0)
+        return self._spool
+
+    def cerrar(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def es_local(self):
+        """ True si el texto se puede sacar aquí mismo, sin servicios de AWS """
+        return True
+
+    def extraer(self):
+        raise NotImplementedError
+
+
+@registrar
+class ExtractorTxt(Extractor):
+    extensiones = ('txt',)
+    mimetypes = ('text/plain',)
+    nombre = 'TXT'
+
+    def extraer(self):
+        # Leemos por bloques, sin copiar el archivo completo a memoria
+        acumulador = AcumuladorTexto(separador="")
+        for linea in lineas_texto(self.client_s3, self.bucket_name, self.file_name):
+            if not acumulador.agregar(linea):
+                break  # llegamos al tope: no seguimos bajando el archivo
+        return acumulador.texto()
+
+
+@registrar
+class ExtractorCsv(Extractor):
+    extensiones = ('csv',)
+    mimetypes = ('text/csv',)
+    nombre = 'CSV'
+
+    def extraer(self):
+        acumulador = AcumuladorTexto()
+        lineas = lineas_texto(self.client_s3, self.bucket_name, self.file_name)
+        primera = next(lineas, '')
+        try:
+            dialecto = csv.Sniffer().sniff(primera, delimiters=',;\t|')
+        except csv.Error:
+            dialecto = csv.excel
+
+        def todas():
+            yield primera
+            yield from lineas
+
+        for fila in csv.reader(todas(), dialecto):
+            celdas = [celda.strip() for celda in fila if celda.strip()]
+            if celdas and not acumulador.agregar("\t".join(celdas)):
+                break
+        return acumulador.texto()
+
+
+@registrar
+class ExtractorDocx(Extractor):
+    extensiones = ('docx',)
+    mimetypes = ('application/vnd.openxmlformats-officedocument.wordprocessingml.document',)
+    nombre = 'DOCX'
+
+    def extraer(self):
+        # El .docx es en realidad un ZIP con XMLs adentro: leemos las etiquetas <w:t>
+        acumulador = AcumuladorTexto()
+        with zipfile.ZipFile(self.spool) as z, z.open('word/document.xml') as xml:
+            for texto in textos_xml(xml, f'{{{NS_WORD}}}t'):
+                if not acumulador.agregar(texto):
+                    break
+        return acumulador.texto()
+
+
+@registrar
+class ExtractorPptx(Extractor):
+    extensiones = ('pptx',)
+    mimetypes = ('application/vnd.openxmlformats-officedocument.presentationml.presentation',)
+    nombre = 'PPTX'
+
+    def extraer(self):
+        # Cada diapositiva es ppt/slides/slideN.xml; el texto va en <a:t>
+        acumulador = AcumuladorTexto()
+        with zipfile.ZipFile(self.spool) as z:
+            for parte in _partes_numeradas(z, r'ppt/slides/slide(\d+)\.xml'):
+                with z.open(parte) as xml:
+                    for texto in textos_xml(xml, f'{{{NS_DRAWING}}}t'):
+                        if not acumulador.agregar(texto):
+                            return acumulador.texto()
+        return acumulador.texto()
+
+
+@registrar
+class ExtractorXlsx(Extractor):
+    extensiones = ('xlsx',)
+    mimetypes = ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',)
+    nombre = 'XLSX'
+
+    def _textos_compartidos(self, z):
+        """ xl/sharedStrings.xml: las celdas de texto guardan solo un índice a esta lista """
+        if 'xl/sharedStrings.xml' not in z.namelist():
+            return []
+        textos, actual, largo = [], [], 0
+        with z.open('xl/sharedStrings.xml') as xml:
+            for nodo, _ in recorrer_xml(xml):
+                if nodo.tag == f'{{{NS_EXCEL}}}t' and nodo.text:
+                    actual.append(nodo.text)
+                elif nodo.tag == f'{{{NS_EXCEL}}}si':
+                    # Sobre el tope de texto ya no sirve guardar más (no se va a usar)
+                    texto = "".join(actual) if largo < config_extraccion('MAX_CARACTERES') else ""
+                    largo += len(texto)
+                    textos.append(texto)
+                    actual = []
+        return textos
+
+    def extraer(self):
+        acumulador = AcumuladorTexto()
+        with zipfile.ZipFile(self.spool) as z:
+            compartidos = self._textos_compartidos(z)
+            for parte in _partes_numeradas(z, r'xl/worksheets/sheet(\d+)\.xml'):
+                fila = []
+                with z.open(parte) as xml:
+                    for nodo, padre in recorrer_xml(xml):
+                        if nodo.tag == f'{{{NS_EXCEL}}}v' and nodo.text:
+                            # padre = <c t="s"> cuando el valor es un índice de texto compartido
+                            if padre.get('t') == 's':
+                                indice = int(nodo.text)
+                                fila.append(compartidos[indice] if indice < len(compartidos) else "")
+                            else:
+                                fila.append(nodo.text)
+                        elif nodo.tag == f'{{{NS_EXCEL}}}t' and nodo.text:
+                            fila.append(nodo.text)  # texto en línea (<is><t>)
+                        elif nodo.tag == f'{{{NS_EXCEL}}}row':
+                            celdas = [c for c in fila if c]
+                            fila = []
+                            if celdas and not acumulador.agregar("\t".join(celdas)):
+                                return acumulador.texto()
+        return acumulador.texto()
+
+
+@registrar
+class ExtractorPdf(Extractor):
+    """
+    PDF nativo (exportado desde Word, SAP...) -> trae capa de texto: lo leemos local.
+    PDF escaneado (solo imágenes) -> no es local, va a Textract asíncrono.
+    """
+    extensiones = ('pdf',)
+    mimetypes = ('application/pdf',)
+    nombre = 'PDF'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lector = None
+
+    @property
+    def lector(self):
+        if self._lector is None:
+            self._lector = PdfReader(self.spool)
+        return self._lector
+
+    def es_local(self):
+        config = settings.EXTRACCION
+        try:
+            paginas = self.lector.pages[:config['PDF_PAGINAS_MUESTRA']]
+            if not paginas:
+                return False
+            caracteres = sum(len((pagina.extract_text() or '').strip()) for pagina in paginas)
+        except Exception as e:
+            print(f"PDF sin capa de texto legible ({e}): se envía a Textract")
+            return False
+        return caracteres / len(paginas) >= config['PDF_MIN_CARACTERES_PAGINA']
+
+    def extraer(self):
+        acumulador = AcumuladorTexto()
+        for pagina in self.lector.pages:
+            texto = (pagina.extract_text() or '').strip()
+            if texto and not acumulador.agregar(texto):
+                break
+        return acumulador.texto()
+
+    def cerrar(self):
+        self._lector = None
+        super().cerrar()
+
+
+@registrar
+class ExtractorImagen(Extractor):
+    """ Imágenes -> OCR con Textract síncrono (no es local) """
+    extensiones = ('jpg', 'jpeg', 'png', 'tiff', 'tif')
+    mimetypes = ('image/jpeg', 'image/png', 'image/tiff')
+    nombre = 'IMAGEN'
+
+    def es_local(self):
+        return False
+
+    def extraer(self):
+        client_textract = obtener_cliente(
+            'textract',
+            read_timeout=settings.IA_IMAGEN['TIMEOUT_OCR'],
+            retries={'max_attempts': 2, 'mode': 'standard'},
+        )
+        return ocr_imagen(imagen_s3(self.bucket_name, self.file_name), client_textract)
+
+
+def imagen_s3(bucket_name, file_name):
+    """ Parámetro Document/Image de Textract y Rekognition que apunta al objeto en S3 """
+    return {'S3Object': {'Bucket': bucket_name, 'Name': file_name}}
+
+
+def ocr_imagen(imagen, client_textract):
+    """ Textract síncrono: líneas de texto de una imagen ({'S3Object': ...} o {'Bytes': ...}) """
+    response = client_textract.detect_document_text(Document=imagen)
+    lineas = [item['Text'] for item in response['Blocks'] if item['BlockType'] == 'LINE']
+    return recortar("\n".join(lineas))
@@ -0,0 +1,266 @@
+"""
+Dobles locales de los servicios AWS, para probar el flujo sin tocar la nube.
+
+Implementan solo los métodos (y campos de respuesta) que usa gestion. Todos
+aceptan latencia= y tasa_fallas= (ServicioFalso) para simular la red en los
+benchmarks (manage.py benchmark).
+"""
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+
+class ServicioFalso:
+    """
+    Base de los dobles: registra cada llamada y, si se pide, simula la red.
+
+    - latencia: segundos por llamada, o (mínimo, máximo) para una espera al azar.
+    - tasa_fallas: probabilidad (0 a 1) de que la llamada falle con un ClientError
+      'codigo_falla', como un error 5xx de AWS.
+    """
+    codigo_falla = 'ServiceUnavailable'
+
+    def __init__(self, latencia=0, tasa_fallas=0.0, semilla=None):
+        self.latencia = latencia
+        self.tasa_fallas = tasa_fallas
+        self.llamadas = []
+        self.fallas_inyectadas = 0
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def _llamada(self, metodo, dato=None, red=True):
+        """ Registra la llamada y devuelve su número; red=False para lo que boto3 hace local (firmar URLs) """
+        with self._lock:
+            self.llamadas.append((metodo, dato))
+            numero = len(self.llamadas)
+            if not red:
+                return numero
+            espera = self._azar.uniform(*self.latencia) if isinstance(self.latencia, (tuple, list)) else self.latencia
+            fallar = self._azar.random() < self.tasa_fallas
+            if fallar:
+                self.fallas_inyectadas += 1
+        if espera:
+            time.sleep(espera)
+        if fallar:
+            raise ClientError({'Error': {'Code': self.codigo_falla, 'Message': 'Falla inyectada'}}, metodo)
+        return numero
+
+    def contar(self, metodo):
+        return sum(1 for nombre, _ in self.llamadas if nombre == metodo)
+
+
+class TextractFalso(ServicioFalso):
+    """
+    Textract asíncrono en memoria.
+
+    - Cada job responde IN_PROGRESS las primeras 'revisiones_en_curso' consultas.
+    - Luego SUCCEEDED, con las líneas repartidas en páginas de 'lineas_por_pagina'
+      enlazadas por NextToken (igual que la API real).
+    """
+
+    def __init__(self, lineas=None, revisiones_en_curso=1, lineas_por_pagina=2, estado_final='SUCCEEDED',
+                 **simulacion):
+        super().__init__(**simulacion)
+        self.lineas = lineas if lineas is not None else ["Factura 001", "Total: $10.000", "Vence: 30/01"]
+        self.revisiones_en_curso = revisiones_en_curso
+        self.lineas_por_pagina = lineas_por_pagina
+        self.estado_final = estado_final
+        self.jobs = {}  # job_id -> {'parametros': ..., 'consultas': n}
+
+    def start_document_text_detection(self, **parametros):
+        self._llamada('start_document_text_detection', parametros)
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {'parametros': parametros, 'consultas': 0}
+        return {'JobId': job_id}
+
+    def get_document_text_detection(self, JobId, NextToken=None, MaxResults=None):
+        self._llamada('get_document_text_detection', {'JobId': JobId, 'NextToken': NextToken})
+        job = self.jobs[JobId]
+
+        if NextToken is None:
+            job['consultas'] += 1
+            if job['consultas'] <= self.revisiones_en_curso:
+                return {'JobStatus': 'IN_PROGRESS'}
+            if self.estado_final != 'SUCCEEDED':
+                return {'JobStatus': self.estado_final}
+
+        inicio = int(NextToken or 0)
+        fin = inicio + self.lineas_por_pagina
+        respuesta = {
+            'JobStatus': 'SUCCEEDED',
+            'Blocks': [{'BlockType': 'PAGE'}] + [
+                {'BlockType': 'LINE', 'Text': texto} for texto in self.lineas[inicio:fin]
+            ],
+        }
+        if fin < len(self.lineas):
+            respuesta['NextToken'] = str(fin)
+        return respuesta
+
+    def detect_document_text(self, Document=None, **kwargs):
+        self._llamada('detect_document_text', Document)
+        return {'Blocks': [{'BlockType': 'LINE', 'Text': texto} for texto in self.lineas]}
+
+
+class S3Falso(ServicioFalso):
+    """ Bucket(s) en memoria: {(bucket, key): bytes} """
+
+    def __init__(self, objetos=None, **simulacion):
+        super().__init__(**simulacion)
+        self.objetos = dict(objetos or {})
+        self.multipart = {}  # upload_id -> {'bucket', 'key', 'partes': {n: (etag, bytes)}}
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self._llamada('put_object', Key)
+        datos = Body.read() if hasattr(Body, 'read') else Body
+        self.objetos[(Bucket, Key)] = datos
+        return {'ETag': '"falso"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        # Como boto3: lee el stream por bloques, sin pedir su tamaño
+        self._llamada('upload_fileobj', Key)
+        self.objetos[(Bucket, Key)] = b''.join(iter(lambda: Fileobj.read(1024 * 1024), b''))
+
+    def _objeto(self, Bucket, Key):
+        if (Bucket, Key) not in self.objetos:
+            raise KeyError(f"NoSuchKey: {Bucket}/{Key}")
+        return self.objetos[(Bucket, Key)]
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._llamada('get_object', Key)
+        datos = self._objeto(Bucket, Key)
+        return {'Body': StreamingBody(io.BytesIO(datos), len(datos)), 'ContentLength': len(datos)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._llamada('head_object', Key)
+        return {'ContentLength': len(self._objeto(Bucket, Key))}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._llamada('delete_object', Key)
+        self.objetos.pop((Bucket, Key), None)
+        return {}
+
+    # --- URLs prefirmadas (el navegador sube con subir_post / upload_part) ---
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        self._llamada('generate_presigned_post', Key, red=False)
+        return {'url': f"https://{Bucket}.s3.falso/", 'fields': dict(Fields or {}, key=Key)}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        self._llamada('generate_presigned_url', Params.get('Key'), red=False)
+        consulta = '&'.join(f"{k}={v}" for k, v in sorted(Params.items()) if k not in ('Bucket', 'Key'))
+        return f"https://{Params['Bucket']}.s3.falso/{Params['Key']}?{consulta}&X-Amz-Expires={ExpiresIn}"
+
+    def subir_post(self, url, campos, datos):
+        """ Lo que haría el navegador con el POST prefirmado """
+        bucket = url.split('//')[1].split('.s3.')[0]
+        return self.put_object(Bucket=bucket, Key=campos['key'], Body=datos)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._llamada('create_multipart_upload', Key)
+        upload_id = uuid.uuid4().hex
+        self.multipart[upload_id] = {'bucket': Bucket, 'key': Key, 'partes': {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b'', **kwargs):
+        self._llamada('upload_part', Key)
+        datos = Body.read() if hasattr(Body, 'read') else Body
+        etag = f'"{uuid.uuid4().hex}"'
+        self.multipart[UploadId]['partes'][PartNumber] = (etag, datos)
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._llamada('complete_multipart_upload', Key)
+        # Como S3: si una parte no coincide, el multipart sigue abierto
+        subida = self.multipart[UploadId]
+        datos = b''
+        for parte in MultipartUpload['Parts']:
+            etag, bloque = subida['partes'][parte['PartNumber']]
+            if etag != parte['ETag']:
+                raise ValueError(f"InvalidPart: {parte['PartNumber']}")
+            datos += bloque
+        del self.multipart[UploadId]
+        self.objetos[(Bucket, Key)] = datos
+        return {'ETag': '"falso-multipart"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._llamada('abort_multipart_upload', Key)
+        self.multipart.pop(UploadId, None)
+        return {}
+
+
+class RekognitionFalso(ServicioFalso):
+    """ detect_labels con etiquetas fijas (las primeras MaxLabels) """
+
+    def __init__(self, etiquetas=None, **simulacion):
+        super().__init__(**simulacion)
+        self.etiquetas = etiquetas if etiquetas is not None else ["Bottle", "Perfume", "Cosmetics", "Glass"]
+
+    def detect_labels(self, Image=None, MaxLabels=None, MinConfidence=None, **kwargs):
+        self._llamada('detect_labels', Image)
+        return {'Labels': [{'Name': nombre, 'Confidence': 99.0} for nombre in self.etiquetas[:MaxLabels]]}
+
+
+def vector_de_texto(texto, dimensiones):
+    """ Vector determinístico del texto: textos distintos dan vectores distintos """
+    generador = random.Random(hashlib.sha256(texto.encode('utf-8')).digest())
+    return [generador.uniform(-1.0, 1.0) for _ in range(dimensiones)]
+
+
+class BedrockFalso(ServicioFalso):
+    """
+    invoke_model de Titan en memoria. Devuelve un vector de 'dimensiones' derivado
+    del hash de inputText (mismo texto -> mismo vector, como el backend 'local') y
+    responde ThrottlingException en las llamadas indicadas por 'limitar_cada'
+    (ej: 3 -> una de cada tres), para probar el control de tasa. Con un cuerpo
+    de mensajes (chat de Claude) responde 'respuesta'.
+    """
+
+    def __init__(self, dimensiones=1536, limitar_cada=0, respuesta="Respuesta simulada del modelo.", **simulacion):
+        super().__init__(**simulacion)
+        self.dimensiones = dimensiones
+        self.limitar_cada = limitar_cada
+        self.respuesta = respuesta
+
+    def invoke_model(self, body=None, modelId=None, **kwargs):
+        numero = self._llamada('invoke_model', modelId)
+        if self.limitar_cada and numero % self.limitar_cada == 0:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'InvokeModel')
+        cuerpo = json.loads(body or '{}')
+        if 'messages' in cuerpo:
+            respuesta = {'content': [{'type': 'text', 'text': self.respuesta}]}
+        else:
+            respuesta = {'embedding': vector_de_texto(cuerpo.get('inputText', ''), self.dimensiones)}
+        datos = json.dumps(respuesta).encode('utf-8')
+        return {'body': StreamingBody(io.BytesIO(datos), len(datos))}
+
+    def invoke_model_with_response_stream(self, body=None, modelId=None, **kwargs):
+        """ Mensajes de Claude en streaming: un content_block_delta por palabra """
+        self._llamada('invoke_model_with_response_stream', modelId)
+        eventos = [{'type': 'message_start'}] + [
+            {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': palabra + ' '}}
+            for palabra in self.respuesta.split()
+        ] + [{'type': 'message_stop'}]
+        return {'body': StreamFalso([{'chunk': {'bytes': json.dumps(e).encode('utf-8')}} for e in eventos])}
+
+
+class StreamFalso:
+    """ EventStream de botocore: iterable de eventos con close() """
+
+    def __init__(self, eventos):
+        self.eventos = eventos
+        self.cerrado = False
+
+    def __iter__(self):
+        for evento in self.eventos:
+            if self.cerrado:
+                return
+            yield evento
+
+    def close(self):
+        self.cerrado = True
@@ -0,0 +1,151 @@
+"""
+Fragmentos (chunks) de texto para el chat RAG.
+
+Un contrato o una factura larga se corta en pedazos de ~TAMANO caracteres que se
+solapan SOLAPAMIENTO caracteres (una frase partida en el borde queda completa en
+alguno de los dos). Los cortes se buscan en límites naturales: párrafo, línea,
+fin de oración o espacio. Cada fragmento tiene su embedding; el chat arma el
+contexto con los mejores fragmentos hasta un presupuesto de tokens.
+"""
+import math
+
+from django.conf import settings
+from django.db import transaction
+
+from .busqueda import actualizar_vector_fragmentos
+from .models import DocumentoChunk
+
+# Preferencia de corte, del más natural al menos natural
+SEPARADORES = ('\n\n', '\n', '. ', ' ')
+
+
+def config_fragmentos(clave):
+    return settings.FRAGMENTOS[clave]
+
+
+def estimar_tokens(texto):
+    """ Aproximación barata (sin tokenizador): ~4 caracteres por token en español """
+    return math.ceil(len(texto) / config_fragmentos('CARACTERES_POR_TOKEN'))
+
+
+def _mejor_corte(texto, desde, hasta):
+    """ Posición de corte en texto[desde:hasta], lo más atrás posible en un separador natural """
+    for separador in SEPARADORES:
+        posicion = texto.rfind(separador, desde, hasta)
+        if posicion != -1:
+            return posicion + len(separador)
+    return hasta
+
+
+def fragmentar(texto, tamano=None, solapamiento=None, maximo=None):
+    """ Rangos [(inicio, fin)] que cubren el texto, con solapamiento entre vecinos """
+    tamano = tamano or config_fragmentos('TAMANO')
+    solapamiento = config_fragmentos('SOLAPAMIENTO') if solapamiento is None else solapamiento
+    maximo = maximo or config_fragmentos('MAX_POR_DOCUMENTO')
+    largo = len(texto)
+
+    rangos = []
+    inicio = 0
+    while inicio < largo and len(rangos) < maximo:
+        fin = min(largo, inicio + tamano)
+        if fin < largo:
+            # No cortamos antes de la mitad del tamaño, aunque no haya separador
+            fin = _mejor_corte(texto, inicio + tamano // 2, fin)
+        if texto[inicio:fin].strip():
+            rangos.append((inicio, fin))
+        if fin >= largo:
+            break
+        # El siguiente arranca SOLAPAMIENTO antes, en un comienzo de palabra
+        siguiente = max(fin - solapamiento, inicio + 1)
+        espacio = texto.find(' ', siguiente, fin)
+        inicio = espacio + 1 if espacio != -1 else siguiente
+    return rangos
+
+
+def crear_fragmentos(documento):
+    """ Reemplaza los fragmentos del documento (sin embedding: los llena el micro-lote) """
+    texto = documento.texto_detectado or ''
+    nuevos = [
+        DocumentoChunk(documento=documento, orden=orden, texto=texto[inicio:fin], inicio=inicio, fin=fin)
+        for orden, (inicio, fin) in enumerate(fragmentar(texto))
+    ]
+    with transaction.atomic():
+        DocumentoChunk.objects.filter(documento=documento).delete()
+        DocumentoChunk.objects.bulk_create(nuevos, batch_size=500)
+        actualizar_vector_fragmentos(documento.id)
+    return len(nuevos)
+
+
+def copiar_fragmentos(original, documento):
+    """ Para duplicados: mismos fragmentos y embeddings que el original """
+    copias = [
+        DocumentoChunk(documento=documento, orden=f.orden, texto=f.texto,
+                       inicio=f.inicio, fin=f.fin, embedding=f.embedding)
+        for f in original.chunks.all()
+    ]
+    with transaction.atomic():
+        DocumentoChunk.objects.bulk_create(copias, batch_size=500)
+        actualizar_vector_fragmentos(documento.id)
+
+
+def _partes_nuevas(inicio, fin, ocupados):
+    """
+    Rangos de [inicio, fin) que no cubre ningún rango ya elegido. Sirve en las dos
+    direcciones: un fragmento posterior más grande que contiene a uno elegido
+    aporta solo lo que está antes y después de él.
+    """
+    partes = [(inicio, fin)]
+    for otro_inicio, otro_fin in ocupados:
+        restantes = []
+        for parte_inicio, parte_fin in partes:
+            if otro_fin <= parte_inicio or parte_fin <= otro_inicio:
+                restantes.append((parte_inicio, parte_fin))  # no se tocan
+                continue
+            if parte_inicio < otro_inicio:
+                restantes.append((parte_inicio, otro_inicio))
+            if otro_fin < parte_fin:
+                restantes.append((otro_fin, parte_fin))
+        partes = restantes
+    return partes
+
+
+def armar_contexto(fragmentos, presupuesto_tokens=None):
+    """
+    Junta los mejores fragmentos (ya ordenados por relevancia) hasta el presupuesto
+    de tokens. Lo que se solapa con un fragmento ya elegido del mismo documento no se
+    repite. El resultado se agrupa por documento y en el orden del texto original.
+    Devuelve (texto_contexto, documentos_usados).
+    """
+    presupuesto = presupuesto_tokens or config_fragmentos('PRESUPUESTO_TOKENS')
+    elegidos = {}   # documento_id -> [(inicio, fin, texto)]
+    documentos = {}  # documento_id -> Documento (en orden de relevancia)
+    usados = 0
+
+    for fragmento in fragmentos:
+        ocupados = [(inicio, fin) for inicio, fin, _ in elegidos.get(fragmento.documento_id, [])]
+        piezas = []
+        for inicio, fin in _partes_nuevas(fragmento.inicio, fragmento.fin, ocupados):
+            texto = fragmento.texto[inicio - fragmento.inicio:fin - fragmento.inicio].strip()
+            if texto:
+                piezas.append((inicio, fin, texto))
+
+        tokens = sum(estimar_tokens(texto) for _, _, texto in piezas)
+        if not piezas or usados + tokens > presupuesto:
+            continue  # puede que uno más corto todavía quepa
+        usados += tokens
+        elegidos.setdefault(fragmento.documento_id, []).extend(piezas)
+        documentos.setdefault(fragmento.documento_id, fragmento.documento)
+
+    bloques = []
+    for documento_id, documento in documentos.items():
+        piezas = []
+        ultimo_fin = None
+        for inicio, fin, texto in sorted(elegidos[documento_id]):
+            # Piezas contiguas se leen de corrido; si hay un salto se marca con [...]
+            if ultimo_fin is not None and inicio > ultimo_fin:
+                piezas.append('[...]')
+            piezas.append(texto)
+            ultimo_fin = fin
+        bloques.append(f"\n- DOC '{documento.titulo}':\n" + "\n".join(piezas))
+
+    return "".join(bloques), list(documentos.values())
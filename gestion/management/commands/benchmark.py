@@ -0,0 +1,102 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.benchmark import ARCHIVOS, comparar, ejecutar
+from gestion.embeddings import BACKENDS
+
+
+def _latencia(valor):
+    """ 'servicio=segundos' o 'servicio=mínimo-máximo' """
+    try:
+        servicio, segundos = valor.split('=', 1)
+        if '-' in segundos:
+            return servicio, [float(s) for s in segundos.split('-', 1)]
+        return servicio, float(segundos)
+    except ValueError:
+        raise CommandError(f"Latencia inválida: {valor} (ej: textract=0.8 o textract=0.4-1.2)")
+
+
+def _lista_enteros(valor):
+    try:
+        return [int(n) for n in valor.split(',') if n]
+    except ValueError:
+        raise CommandError(f"Lista inválida: {valor} (ej: 10000,100000)")
+
+
+class Command(BaseCommand):
+    help = ("Benchmark offline de ingesta, buscador y chat con AWS simulado. "
+            "Corre en una base de pruebas desechable (test_<NAME>) salvo con --base-actual.")
+
+    def add_arguments(self, parser):
+        config = settings.BENCHMARK
+        parser.add_argument('--tamanos', type=_lista_enteros, default=config['TAMANOS'],
+                            help="Documentos sintéticos para buscador y chat (ej: 10000,100000,1000000)")
+        parser.add_argument('--tipos', default=','.join(ARCHIVOS),
+                            help=f"Tipos para la ingesta, separados por coma ({', '.join(ARCHIVOS)}); vacío = sin ingesta")
+        parser.add_argument('--docs-por-tipo', type=int, default=config['DOCS_POR_TIPO'])
+        parser.add_argument('--repeticiones', type=int, default=config['REPETICIONES'])
+        parser.add_argument('--latencia', action='append', type=_latencia, default=[],
+                            help="Latencia de un servicio falso (s3, textract, rekognition, bedrock); se puede repetir")
+        parser.add_argument('--sin-latencia', action='store_true', help="Todos los servicios falsos responden al instante")
+        parser.add_argument('--tasa-fallas', type=float, default=0.0,
+                            help="Probabilidad (0 a 1) de que cada llamada a AWS falle")
+        parser.add_argument('--backend', choices=list(BACKENDS), default='titan',
+                            help="Backend de embeddings (titan = Bedrock falso, con su latencia)")
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borra la base de pruebas ni los documentos sintéticos "
+                                 "(la próxima corrida los reutiliza)")
+        parser.add_argument('--base-actual', action='store_true',
+                            help="Corre sobre la base configurada en vez de una de pruebas "
+                                 "(con un usuario propio; sus datos se borran al terminar)")
+        parser.add_argument('--salida', help="Guarda el resultado (JSON) en este archivo")
+        parser.add_argument('--comparar', help="Resultado JSON de una corrida anterior: informa las regresiones")
+        parser.add_argument('--tolerancia', type=float, default=config['TOLERANCIA'],
+                            help="Empeoramiento permitido al comparar (0.2 = 20%%)")
+
+    def handle(self, *args, **opciones):
+        tipos = [tipo for tipo in opciones['tipos'].split(',') if tipo]
+        desconocidos = set(tipos) - set(ARCHIVOS)
+        if desconocidos:
+            raise CommandError(f"Tipos desconocidos: {', '.join(sorted(desconocidos))}")
+        if not 0 <= opciones['tasa_fallas'] <= 1:
+            raise CommandError("--tasa-fallas debe estar entre 0 y 1.")
+
+        anterior = None
+        if opciones['comparar']:
+            anterior = json.loads(Path(opciones['comparar']).read_text())
+
+        latencias = {} if opciones['sin_latencia'] else dict(settings.BENCHMARK['LATENCIAS'])
+        latencias.update(opciones['latencia'])
+
+        resultado = ejecutar(
+            tamanos=opciones['tamanos'],
+            tipos=tipos,
+            por_tipo=opciones['docs_por_tipo'],
+            repeticiones=opciones['repeticiones'],
+            latencias=latencias,
+            tasa_fallas=opciones['tasa_fallas'],
+            backend=opciones['backend'],
+            semilla=opciones['semilla'],
+            conservar=opciones['conservar'],
+            base_actual=opciones['base_actual'],
+        )
+        if anterior is not None:
+            resultado['regresiones'] = comparar(anterior, resultado, opciones['tolerancia'])
+
+        salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if opciones['salida']:
+            Path(opciones['salida']).write_text(salida)
+            self.stdout.write(self.style.SUCCESS(f"Resultado guardado en {opciones['salida']}"))
+        else:
+            self.stdout.write(salida)
+
+        if resultado.get('regresiones'):
+            for regresion in resultado['regresiones']:
+                self.stderr.write(f"  {regresion['metrica']}: {regresion['antes']} -> {regresion['ahora']} "
+                                  f"({regresion['cambio']:+.0%})")
+            raise CommandError(f"{len(resultado['regresiones'])} métricas empeoraron más de "
+                               f"{opciones['tolerancia']:.0%} respecto de {opciones['comparar']}.")
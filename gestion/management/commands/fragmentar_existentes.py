@@ -0,0 +1,56 @@
+"""
+Corta en fragmentos (DocumentoChunk) los documentos procesados antes de que
+existieran, por lotes y sin bloquear el deploy (la migración 0012 solo crea la tabla).
+
+    python manage.py fragmentar_existentes --lote 200
+
+Recorre por id y solo toma documentos sin fragmentos: si la corrida se corta,
+volver a lanzarla sigue donde quedó. Los documentos quedan pendientes de
+embedding y el micro-lote embebe solo los fragmentos (conserva el vector del documento).
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.fragmentos import crear_fragmentos
+from gestion.models import Documento
+from gestion.tasks import programar_lote_embeddings
+
+
+class Command(BaseCommand):
+    help = "Corta en fragmentos, por lotes, los documentos ya procesados que no tienen"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=settings.FRAGMENTOS['LOTE_EXISTENTES'],
+                            help="Documentos por lote")
+
+    def handle(self, *args, **opciones):
+        lote = opciones['lote']
+        if lote < 1:
+            raise CommandError("--lote debe ser mayor que cero.")
+
+        sin_fragmentos = (Documento.objects
+                          .filter(estado='completado', texto_detectado__isnull=False, chunks__isnull=True)
+                          .only('id', 'texto_detectado')
+                          .order_by('id'))
+        ultimo_id = 0
+        documentos = fragmentados = 0
+        while True:
+            docs = list(sin_fragmentos.filter(id__gt=ultimo_id)[:lote])
+            if not docs:
+                break
+            ultimo_id = docs[-1].id
+
+            con_fragmentos = [doc.id for doc in docs if crear_fragmentos(doc)]
+            # Pendiente sin tocar el vector del documento: el lote solo pide los de los fragmentos
+            Documento.objects.filter(id__in=con_fragmentos).update(
+                embedding_pendiente=True, embedding_intentos=0, embedding_reintento=None,
+            )
+            if con_fragmentos:
+                # Sin esto nadie agenda el lote: estos documentos no pasan por etapa_finalizar
+                programar_lote_embeddings()
+
+            documentos += len(docs)
+            fragmentados += len(con_fragmentos)
+            self.stdout.write(f"--> Hasta id {ultimo_id}: {fragmentados}/{documentos} documentos fragmentados")
+
+        self.stdout.write(self.style.SUCCESS(f"Listo: {fragmentados} documentos fragmentados."))
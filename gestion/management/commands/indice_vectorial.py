@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from gestion.busqueda import METRICAS
+from gestion.models import Documento
+
+ABREVIATURAS = {'l2': 'l2', 'coseno': 'cos', 'producto_interno': 'ip'}
+
+
+class Command(BaseCommand):
+    help = "Construye o reconstruye el índice ANN (HNSW / IVFFlat) sobre Documento.embedding"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo', choices=['hnsw', 'ivfflat'], default='hnsw')
+        parser.add_argument('--metrica', choices=list(METRICAS), default='l2')
+        parser.add_argument('--m', type=int, default=16, help="HNSW: conexiones por nodo")
+        parser.add_argument('--ef-construction', type=int, default=64, help="HNSW: calidad de construcción")
+        parser.add_argument('--lists', type=int, default=None,
+                            help="IVFFlat: número de listas (por defecto filas/1000, mínimo 10)")
+        parser.add_argument('--memoria', default='512MB', help="maintenance_work_mem para la construcción")
+        parser.add_argument('--reconstruir', action='store_true', help="Borra el índice existente y lo vuelve a crear")
+
+    def handle(self, *args, **opciones):
+        if connection.vendor != 'postgresql':
+            raise CommandError("El índice vectorial requiere PostgreSQL con pgvector.")
+
+        tipo = opciones['tipo']
+        metrica = opciones['metrica']
+        opclass = METRICAS[metrica][1]
+        tabla = Documento._meta.db_table
+        # Mismo nombre que el índice declarado en Documento.Meta para (hnsw, l2)
+        nombre = f"gestion_doc_emb_{tipo}_{ABREVIATURAS[metrica]}"
+
+        if tipo == 'hnsw':
+            parametros = f"m = {opciones['m']}, ef_construction = {opciones['ef_construction']}"
+        else:
+            lists = opciones['lists']
+            if not lists:
+                total = Documento.objects.filter(embedding__isnull=False).count()
+                lists = max(10, total // 1000)
+            parametros = f"lists = {lists}"
+
+        # CONCURRENTLY: no bloquea las escrituras de Celery mientras se construye
+        with connection.cursor() as cursor:
+            cursor.execute("SET maintenance_work_mem = %s", [opciones['memoria']])
+
+            if opciones['reconstruir']:
+                self.stdout.write(f"--> Borrando índice {nombre}...")
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{nombre}"')
+
+            self.stdout.write(f"--> Construyendo {nombre} ({tipo}, {opclass}, {parametros})...")
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{nombre}" ON "{tabla}" '
+                f'USING {tipo} ("embedding" {opclass}) WITH ({parametros})'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Índice {nombre} listo."))
+        if metrica != 'l2' or tipo != 'hnsw':
+            self.stdout.write(
+                f"Recuerda usar BUSQUEDA_VECTORIAL['METRICA'] = '{metrica}' para que las consultas usen este índice."
+            )
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from gestion.deduplicacion import reporte
+
+
+class Command(BaseCommand):
+    help = "Muestra cuántos documentos se deduplicaron y cuántas llamadas de IA se ahorraron"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Salida en JSON")
+
+    def handle(self, *args, **opciones):
+        datos = reporte()
+        if opciones['json']:
+            self.stdout.write(json.dumps(datos, indent=2))
+            return
+
+        self.stdout.write(f"Documentos deduplicados: {datos['documentos_deduplicados']}")
+        for extension, cantidad in sorted(datos['por_extension'].items()):
+            self.stdout.write(f"  .{extension}: {cantidad}")
+        self.stdout.write(f"Originales reutilizados: {datos['originales_con_duplicados']}")
+        self.stdout.write(f"Objetos S3 reutilizados: {datos['objetos_s3_reutilizados']}")
+        self.stdout.write(f"Llamadas de IA ahorradas: {datos['total_llamadas_ia_ahorradas']}")
+        for servicio, cantidad in sorted(datos['llamadas_ia_ahorradas'].items()):
+            self.stdout.write(f"  {servicio}: {cantidad}")
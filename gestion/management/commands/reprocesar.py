@@ -0,0 +1,222 @@
+"""
+Reprocesa en masa documentos ya cargados, sin traerlos todos a memoria.
+
+    python manage.py reprocesar --modo embeddings
+    python manage.py reprocesar --modo pipeline --extension pdf --desde 2024-01-01
+
+- embeddings: vuelve a generar los vectores del documento y de TODOS sus
+  fragmentos en este proceso (cambio de modelo) y los guarda con bulk_update.
+  Siempre con EMBEDDINGS['BACKEND']: el mismo que usan el lote de ingesta y las
+  consultas, para que ningún vector quede en otro espacio.
+- pipeline: vuelve a pasar los documentos por procesar_archivo_ia (arreglo de
+  un extractor), de a --lote documentos en vuelo en Celery.
+
+Las filas se recorren por id con .iterator() y después de cada lote terminado
+se guarda el último id en un checkpoint (JSON). Si la corrida muere, la misma
+orden sigue desde ahí; --reiniciar empieza de cero.
+"""
+import json
+import os
+import time
+from datetime import date
+from functools import partial
+from itertools import islice
+from pathlib import Path
+
+from celery import group
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from gestion.cache_respuestas import invalidar_usuario
+from gestion.embeddings import embeber_documentos, obtener_backend, para_embeber
+from gestion.models import Documento
+from gestion.progreso import evento, notificar
+from gestion.tasks import procesar_archivo_ia
+
+EN_CURSO = ('pendiente', 'procesando')
+
+
+def _fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {valor} (formato AAAA-MM-DD)")
+
+
+def _lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+class Checkpoint:
+    """ Último id terminado de una corrida, en un JSON que se reemplaza de forma atómica """
+
+    def __init__(self, ruta, parametros):
+        self.ruta = Path(ruta)
+        self.parametros = parametros
+        self.ultimo_id = 0
+        self.procesados = 0
+        self.terminado = False
+
+    def cargar(self):
+        if not self.ruta.exists():
+            return False
+        datos = json.loads(self.ruta.read_text())
+        if datos['parametros'] != self.parametros:
+            raise CommandError(
+                f"El checkpoint {self.ruta} es de una corrida con otros parámetros "
+                f"({datos['parametros']}). Usa --reiniciar o --checkpoint con otra ruta."
+            )
+        self.ultimo_id = datos['ultimo_id']
+        self.procesados = datos['procesados']
+        self.terminado = datos['terminado']
+        return True
+
+    def guardar(self):
+        temporal = self.ruta.with_name(self.ruta.name + '.tmp')
+        temporal.write_text(json.dumps({
+            'parametros': self.parametros,
+            'ultimo_id': self.ultimo_id,
+            'procesados': self.procesados,
+            'terminado': self.terminado,
+        }, indent=2))
+        os.replace(temporal, self.ruta)
+
+
+class Command(BaseCommand):
+    help = "Vuelve a generar embeddings o a pasar por el pipeline de IA muchos documentos, retomable"
+
+    def add_arguments(self, parser):
+        config = settings.REPROCESO
+        parser.add_argument('--modo', choices=['embeddings', 'pipeline'], required=True)
+        parser.add_argument('--estado', default='completado',
+                            choices=[valor for valor, _ in Documento.OPCIONES_ESTADO])
+        parser.add_argument('--extension', action='append', default=[],
+                            help="Solo archivos con esta extensión (se puede repetir)")
+        parser.add_argument('--desde', type=_fecha, help="Subidos desde esta fecha (AAAA-MM-DD)")
+        parser.add_argument('--hasta', type=_fecha, help="Subidos hasta esta fecha, inclusive")
+        parser.add_argument('--lote', type=int, default=None,
+                            help=f"Documentos por lote (por defecto {config['LOTE_EMBEDDINGS']} en embeddings, "
+                                 f"{config['LOTE_PIPELINE']} en vuelo en pipeline)")
+        parser.add_argument('--concurrencia', type=int, default=None,
+                            help="embeddings: llamadas simultáneas al modelo (por defecto EMBEDDINGS['CONCURRENCIA'])")
+        parser.add_argument('--chunk-size', type=int, default=config['CHUNK_SIZE'],
+                            help="Filas por lectura del cursor")
+        parser.add_argument('--limite', type=int, default=None, help="Procesar como máximo esta cantidad")
+        parser.add_argument('--checkpoint', default=None,
+                            help="Archivo de checkpoint (por defecto reprocesar_<modo>.json)")
+        parser.add_argument('--reiniciar', action='store_true', help="Ignora el checkpoint y empieza de cero")
+
+    def handle(self, *args, **opciones):
+        modo = opciones['modo']
+        lote = opciones['lote'] or settings.REPROCESO['LOTE_PIPELINE' if modo == 'pipeline' else 'LOTE_EMBEDDINGS']
+        if lote < 1 or opciones['chunk_size'] < 1:
+            raise CommandError("--lote y --chunk-size deben ser mayores que cero.")
+
+        parametros = {
+            'modo': modo,
+            'estado': opciones['estado'],
+            'extensiones': sorted(ext.lower().lstrip('.') for ext in opciones['extension']),
+            'desde': opciones['desde'] and opciones['desde'].isoformat(),
+            'hasta': opciones['hasta'] and opciones['hasta'].isoformat(),
+            'backend': settings.EMBEDDINGS['BACKEND'] if modo == 'embeddings' else None,
+        }
+        ruta = opciones['checkpoint'] or Path(settings.REPROCESO['DIRECTORIO_CHECKPOINT']) / f"reprocesar_{modo}.json"
+        checkpoint = Checkpoint(ruta, parametros)
+        if not opciones['reiniciar'] and checkpoint.cargar():
+            if checkpoint.terminado:
+                self.stdout.write(f"La corrida de {ruta} ya terminó ({checkpoint.procesados} documentos). "
+                                  f"Usa --reiniciar para hacerla de nuevo.")
+                return
+            self.stdout.write(f"--> Retomando desde el id {checkpoint.ultimo_id} "
+                              f"({checkpoint.procesados} ya procesados)")
+
+        docs = self._consulta(parametros).filter(id__gt=checkpoint.ultimo_id)
+        if modo == 'embeddings':
+            docs = para_embeber(docs)
+            procesar = partial(self._embeber, backend=obtener_backend(),
+                               concurrencia=opciones['concurrencia'])
+        else:
+            docs = docs.only('id', 'titulo', 'usuario_id')
+            procesar = self._pipeline
+        if opciones['limite']:
+            docs = docs[:opciones['limite']]
+        total = docs.count()
+        self.stdout.write(f"--> {total} documentos por reprocesar ({modo}, lotes de {lote})")
+
+        inicio = time.monotonic()
+        hechos = 0
+        try:
+            for docs_lote in _lotes(docs.iterator(chunk_size=opciones['chunk_size']), lote):
+                inicio_lote = time.monotonic()
+                procesar(docs_lote)
+
+                # Solo después de terminar el lote: si se corta antes, se repite entero
+                checkpoint.ultimo_id = docs_lote[-1].id
+                checkpoint.procesados += len(docs_lote)
+                checkpoint.guardar()
+
+                hechos += len(docs_lote)
+                transcurrido = time.monotonic() - inicio
+                self.stdout.write(
+                    f"--> {hechos}/{total} ({hechos * 100 // max(total, 1)}%) hasta id {checkpoint.ultimo_id}: "
+                    f"{len(docs_lote) / max(time.monotonic() - inicio_lote, 1e-6):.1f} docs/s en el lote, "
+                    f"{hechos / max(transcurrido, 1e-6):.1f} docs/s promedio"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"Interrumpido. La misma orden sigue desde el id {checkpoint.ultimo_id}."
+            ))
+            return
+
+        # Con --limite puede quedar más: la próxima corrida sigue desde aquí
+        checkpoint.terminado = not opciones['limite'] or hechos < opciones['limite']
+        checkpoint.guardar()
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {hechos} documentos en {time.monotonic() - inicio:.1f}s "
+            f"({checkpoint.procesados} en total en esta corrida)."
+        ))
+
+    def _consulta(self, parametros):
+        docs = Documento.objects.filter(estado=parametros['estado']).order_by('id')
+        if parametros['extensiones']:
+            filtro = Q()
+            for ext in parametros['extensiones']:
+                filtro |= Q(archivo__iendswith=f'.{ext}')
+            docs = docs.filter(filtro)
+        if parametros['desde']:
+            docs = docs.filter(fecha__date__gte=parametros['desde'])
+        if parametros['hasta']:
+            docs = docs.filter(fecha__date__lte=parametros['hasta'])
+        return docs
+
+    def _embeber(self, docs, backend, concurrencia):
+        usuarios = embeber_documentos(docs, backend, reemplazar=True, concurrencia=concurrencia)
+        for usuario_id in usuarios:
+            # Las respuestas cacheadas del chat se armaron con los vectores viejos
+            invalidar_usuario(usuario_id)
+
+    def _pipeline(self, docs):
+        """ Manda el lote a Celery y espera a que salga entero de pendiente/procesando """
+        config = settings.REPROCESO
+        ids = [doc.id for doc in docs]
+        Documento.objects.filter(id__in=ids).update(estado='pendiente', textract_job_id=None)
+
+        eventos = {}
+        for doc in docs:
+            eventos.setdefault(doc.usuario_id, []).append(evento(doc, 'en_cola'))
+        for usuario_id, eventos_usuario in eventos.items():
+            notificar(usuario_id, eventos_usuario)
+        group(procesar_archivo_ia.s(documento_id) for documento_id in ids).apply_async()
+
+        limite = time.monotonic() + config['TIMEOUT_LOTE_PIPELINE']
+        while en_curso := Documento.objects.filter(id__in=ids, estado__in=EN_CURSO).count():
+            if time.monotonic() > limite:
+                self.stdout.write(self.style.WARNING(
+                    f"{en_curso} documentos del lote siguen en proceso tras "
+                    f"{config['TIMEOUT_LOTE_PIPELINE']}s; se sigue con el siguiente lote."
+                ))
+                return
+            time.sleep(config['ESPERA_PIPELINE'])
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+import pgvector.django.extensions
+import pgvector.django.indexes
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('gestion', '0005_documento_embedding'),
+    ]
+
+    operations = [
+        pgvector.django.extensions.VectorExtension(),
+        AddIndexConcurrently(
+            model_name='documento',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='gestion_doc_emb_hnsw_l2', opclasses=['vector_l2_ops']),
+        ),
+    ]
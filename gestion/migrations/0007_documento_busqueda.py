@@ -0,0 +1,39 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:41
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def llenar_busqueda(apps, schema_editor):
+    # Documentos ya procesados: calculamos su tsvector una sola vez
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models import TextField
+    from django.db.models.functions import Cast, Substr
+
+    Documento = apps.get_model('gestion', 'Documento')
+    Documento.objects.update(busqueda=(
+        SearchVector('titulo', weight='A', config='spanish')
+        + SearchVector(Cast('tags_ia', TextField()), weight='B', config='spanish')
+        + SearchVector(Substr('texto_detectado', 1, 200000), weight='C', config='spanish')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_documento_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(llenar_busqueda, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='documento',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='gestion_doc_busqueda_gin'),
+        ),
+    ]
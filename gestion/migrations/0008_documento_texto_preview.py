@@ -0,0 +1,32 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+def llenar_preview(apps, schema_editor):
+    from django.db.models.functions import Substr
+
+    Documento = apps.get_model('gestion', 'Documento')
+    Documento.objects.filter(texto_detectado__isnull=False).update(
+        texto_preview=Substr('texto_detectado', 1, 300)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_documento_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='texto_preview',
+            field=models.CharField(blank=True, max_length=300, null=True),
+        ),
+        migrations.RunPython(llenar_preview, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['usuario', '-id'], name='gestion_doc_usuario_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_documento_texto_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='textract_job_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
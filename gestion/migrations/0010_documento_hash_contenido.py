@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_documento_textract_job_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='duplicado_de',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicados', to='gestion.documento'),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='hash_contenido',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['usuario', 'hash_contenido'], name='gestion_doc_usuario_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+def marcar_pendientes(apps, schema_editor):
+    # Hasta ahora ningún documento se embebió con un backend real: los vectores
+    # guardados son aleatorios (MODO_LABORATORIO_BEDROCK) o copias de ellos
+    # (deduplicación). Se borran y todo lo procesado vuelve a la cola; lo toma el
+    # próximo micro-lote (o a mano: procesar_lote_embeddings.delay()).
+    Documento = apps.get_model('gestion', 'Documento')
+    Documento.objects.filter(estado='completado').update(embedding=None, embedding_pendiente=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_documento_hash_contenido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='embedding_pendiente',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='embedding_intentos',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='embedding_reintento',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(marcar_pendientes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(condition=models.Q(('embedding_pendiente', True)), fields=['id'], name='gestion_doc_emb_pendiente_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:55
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+import pgvector.django.indexes
+import pgvector.django.vector
+
+# Los documentos ya procesados se cortan después, por lotes y sin bloquear el deploy:
+#   python manage.py fragmentar_existentes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_documento_embedding_pendiente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveIntegerField()),
+                ('texto', models.TextField()),
+                ('inicio', models.PositiveIntegerField()),
+                ('fin', models.PositiveIntegerField()),
+                ('embedding', pgvector.django.vector.VectorField(blank=True, dimensions=1536, null=True)),
+                ('busqueda', django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True)),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='gestion.documento')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='gestion_chunk_busqueda_gin'), pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='gestion_chunk_emb_hnsw_l2', opclasses=['vector_l2_ops'])],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='documentochunk',
+            constraint=models.UniqueConstraint(fields=('documento', 'orden'), name='gestion_chunk_doc_orden_uniq'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_documentochunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='lote',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['lote'], name='gestion_doc_lote_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_documento_lote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='miniatura',
+            field=models.CharField(blank=True, editable=False, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='vista_previa',
+            field=models.CharField(blank=True, editable=False, max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,159 @@
+"""
+Versiones reducidas (WebP) de las imágenes subidas.
+
+Las tarjetas del buscador miden 140 px y cargaban el original (fotos de
+teléfono de varios MB cada una). etapa_versiones (tasks.py) baja el original
+una vez, lo decodifica con Pillow ya rotado según EXIF y sube una versión por
+cada entrada de VERSIONES_IMAGEN['TAMANOS'] bajo VERSIONES_IMAGEN['PREFIJO'].
+Las keys quedan en Documento.miniatura / Documento.vista_previa.
+
+Las filas anteriores a esto se generan en forma perezosa: las vistas llaman a
+tasks.pedir_versiones() con los documentos que van a mostrar.
+
+Lo mismo sirve antes de la IA (imagenes_para_ia): una foto de 20 megapíxeles
+se reduce a IA_IMAGEN['LADO_MAXIMO_OCR'] y se manda como bytes a Textract y
+Rekognition, en vez de que ellos analicen el original desde S3.
+"""
+import io
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .extraccion import descargar_a_spool, imagen_s3
+
+# GIF queda fuera: la versión WebP perdería la animación
+EXTENSIONES_IMAGEN = ('jpg', 'jpeg', 'png', 'webp', 'tif', 'tiff')
+
+
+class ImagenIlegible(Exception):
+    """ Pillow no pudo decodificar el archivo (dañado, formato raro, demasiado grande) """
+
+
+def tiene_versiones(file_name):
+    return file_name.rsplit('.', 1)[-1].lower() in EXTENSIONES_IMAGEN
+
+
+def abrir_imagen(archivo, lado_maximo=None):
+    """
+    Decodifica la imagen rotada según EXIF, en RGB (o RGBA si tiene transparencia).
+    Con lado_maximo, los JPEG se decodifican directo a una escala menor (draft),
+    mucho más rápido que decodificar 20 megapíxeles para después reducir.
+    """
+    try:
+        imagen = Image.open(archivo)
+        if lado_maximo and max(imagen.size) > lado_maximo:
+            escala = lado_maximo / max(imagen.size)
+            # draft garantiza al menos este tamaño: el lado mayor nunca queda bajo lado_maximo
+            imagen.draft(None, (int(imagen.width * escala) + 1, int(imagen.height * escala) + 1))
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ('RGB', 'RGBA'):
+            transparente = imagen.mode in ('LA', 'PA') or 'transparency' in imagen.info
+            imagen = imagen.convert('RGBA' if transparente else 'RGB')
+        return imagen
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImagenIlegible(str(e))
+
+
+def reducir(imagen, lado_maximo):
+    """ Copia con el lado mayor <= lado_maximo (nunca agranda) """
+    copia = imagen.copy()
+    copia.thumbnail((lado_maximo, lado_maximo), Image.Resampling.LANCZOS)
+    return copia
+
+
+def a_webp(imagen, calidad):
+    salida = io.BytesIO()
+    imagen.save(salida, 'WEBP', quality=calidad, method=4)
+    return salida.getvalue()
+
+
+def a_jpeg(imagen, calidad):
+    """ JPEG (lo que aceptan Textract y Rekognition). La transparencia queda sobre blanco. """
+    if imagen.mode == 'RGBA':
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        imagen = fondo
+    salida = io.BytesIO()
+    imagen.save(salida, 'JPEG', quality=calidad)
+    return salida.getvalue()
+
+
+def key_version(file_name, campo):
+    return f"{settings.VERSIONES_IMAGEN['PREFIJO']}{file_name}.{campo}.webp"
+
+
+def generar_versiones(client_s3, bucket_name, file_name):
+    """ Sube las versiones WebP del original y devuelve {campo: key} """
+    config = settings.VERSIONES_IMAGEN
+    # De la más grande a la más chica: cada una se reduce desde la anterior
+    tamanos = sorted(config['TAMANOS'].items(), key=lambda t: -t[1])
+    claves = {}
+
+    with descargar_a_spool(client_s3, bucket_name, file_name) as spool:
+        imagen = abrir_imagen(spool, tamanos[0][1])
+        for campo, lado in tamanos:
+            imagen = reducir(imagen, lado)
+            datos = a_webp(imagen, config['CALIDAD'])
+            claves[campo] = key_version(file_name, campo)
+            client_s3.put_object(Bucket=bucket_name, Key=claves[campo], Body=datos, ContentType='image/webp')
+            print(f"--> [IMG] {campo} de {file_name}: {imagen.width}x{imagen.height}, {len(datos) // 1024} KB")
+
+    return claves
+
+
+def lados_s3(client_s3, bucket_name, file_name):
+    """
+    (ancho, alto) leyendo solo la cabecera (los primeros IA_IMAGEN['BYTES_CABECERA']):
+    Image.open no decodifica los píxeles. None si ahí no alcanza a leerse.
+    """
+    rango = f"bytes=0-{settings.IA_IMAGEN['BYTES_CABECERA'] - 1}"
+    try:
+        cabecera = client_s3.get_object(Bucket=bucket_name, Key=file_name, Range=rango)['Body'].read()
+        return Image.open(io.BytesIO(cabecera)).size
+    except Exception:
+        return None
+
+
+def imagenes_para_ia(client_s3, bucket_name, file_name):
+    """
+    {'ocr': ..., 'etiquetas': ...} listos para Document= / Image= de Textract y
+    Rekognition. Cada uno va como el original en S3 salvo que pase el lado
+    máximo o el límite de bytes de esa API; solo entonces se reduce y va como
+    bytes JPEG, y únicamente si queda más liviano que el original. Lo que cuenta
+    también es el lado mayor: un PNG plano de 12000x9000 pesa poco pero igual
+    hay que bajarlo. Si algo de eso falla, se usa el original.
+    """
+    config = settings.IA_IMAGEN
+    limites = {
+        'ocr': (config['LADO_MAXIMO_OCR'], config['MAX_BYTES_OCR']),
+        'etiquetas': (config['LADO_MAXIMO_ETIQUETAS'], config['MAX_BYTES_ETIQUETAS']),
+    }
+    original = imagen_s3(bucket_name, file_name)
+    entradas = {nombre: original for nombre in limites}
+
+    tamano = client_s3.head_object(Bucket=bucket_name, Key=file_name)['ContentLength']
+    lados = lados_s3(client_s3, bucket_name, file_name)
+    # Sin cabecera legible no se sabe el lado: se intenta reducir
+    a_reducir = [nombre for nombre, (lado, limite) in limites.items()
+                 if tamano > limite or lados is None or max(lados) > lado]
+    if not a_reducir:
+        return entradas
+
+    try:
+        with descargar_a_spool(client_s3, bucket_name, file_name) as spool:
+            imagen = abrir_imagen(spool, max(limites[nombre][0] for nombre in a_reducir))
+    except ImagenIlegible as e:
+        print(f"No se pudo reducir {file_name}, va el original: {e}")
+        return entradas
+
+    for nombre in a_reducir:
+        lado, limite = limites[nombre]
+        # Textract necesita resolución para las letras chicas de las etiquetas;
+        # Rekognition reconoce objetos igual de bien con bastante menos
+        version = reducir(imagen, lado)
+        datos = a_jpeg(version, config['CALIDAD_JPEG'])
+        if len(datos) <= limite and len(datos) < tamano:
+            entradas[nombre] = {'Bytes': datos}
+            print(f"--> [IMG] {nombre} con {version.width}x{version.height} ({len(datos) // 1024} KB) "
+                  f"en vez del original ({tamano // 1024} KB)")
+    return entradas
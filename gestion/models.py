@@ -1,7 +1,22 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models import JSONField
-from pgvector.django import VectorField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from pgvector.django import VectorField, HnswIndex
+
+# Columnas grandes que los listados nunca muestran (OCR completo, vector de 1536 floats...)
+CAMPOS_PESADOS = ('texto_detectado', 'embedding', 'busqueda')
+
+# Largo del resumen que se muestra en las tarjetas (2 líneas)
+LARGO_PREVIEW = 300
+
+
+class DocumentoQuerySet(models.QuerySet):
+    def para_listado(self):
+        """ Solo lo que pintan las tarjetas: sin OCR completo ni embedding """
+        return self.defer(*CAMPOS_PESADOS)
+
 
 class Documento(models.Model):
     titulo = models.CharField(max_length=200, blank=True, null=True)
@@ -26,10 +41,65 @@ class Documento(models.Model):
     # guardamos texto detectado (OCR) o descripciones
     texto_detectado = models.TextField(null=True, blank=True)
 
+    # primeros caracteres del texto, para no cargar el OCR completo en los listados
+    texto_preview = models.CharField(max_length=LARGO_PREVIEW, null=True, blank=True)
+
     # porcentaje de confianza (ej: 0.98 o 98% )
     confianza_ia = models.FloatField(null=True, blank=True)
     
     embedding = VectorField(dimensions=1536, null=True, blank=True)
+    # True mientras espera su micro-lote de embeddings (ver gestion/embeddings.py)
+    embedding_pendiente = models.BooleanField(default=False, editable=False)
+    # Lotes en que le faltó algún vector (se reintenta con espera creciente, ver EMBEDDINGS)
+    embedding_intentos = models.PositiveSmallIntegerField(default=0, editable=False)
+    # No tomarlo antes de esta hora: espera tras un fallo, o el lote que lo reclamó lo tiene
+    embedding_reintento = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Job asíncrono de Textract en curso (PDFs). Vacío cuando no hay nada pendiente.
+    textract_job_id = models.CharField(max_length=100, null=True, blank=True)
+
+    # Texto indexado para búsqueda full-text (titulo > tags > OCR). Lo llena Celery.
+    busqueda = SearchVectorField(null=True, blank=True, editable=False)
+
+    # SHA-256 del archivo: si llega uno idéntico, se copia el resultado en vez de reprocesar
+    hash_contenido = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # Documento del que se copió el resultado de IA (None = procesado de verdad)
+    duplicado_de = models.ForeignKey(
+        'self', null=True, blank=True, editable=False,
+        on_delete=models.SET_NULL, related_name='duplicados',
+    )
+    # Versiones WebP reducidas en S3 (gestion/miniaturas.py). None = aún no generadas,
+    # '' = no aplica (no es imagen o no se pudo leer)
+    miniatura = models.CharField(max_length=500, null=True, blank=True, editable=False)
+    vista_previa = models.CharField(max_length=500, null=True, blank=True, editable=False)
+
+    # Carga masiva (ZIP / varios archivos) a la que pertenece; sirve para su progreso
+    lote = models.UUIDField(null=True, blank=True, editable=False)
+
+    objects = DocumentoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listados paginados por usuario ordenados por -id (paginación keyset)
+            models.Index(fields=['usuario', '-id'], name='gestion_doc_usuario_id_idx'),
+            GinIndex(name='gestion_doc_busqueda_gin', fields=['busqueda']),
+            models.Index(fields=['usuario', 'hash_contenido'], name='gestion_doc_usuario_hash_idx'),
+            models.Index(fields=['lote'], name='gestion_doc_lote_idx'),
+            # Parcial: solo la cola de documentos que esperan embedding (pocas filas)
+            models.Index(
+                fields=['id'],
+                condition=models.Q(embedding_pendiente=True),
+                name='gestion_doc_emb_pendiente_idx',
+            ),
+            # Índice ANN para la búsqueda semántica (métrica L2, la de BUSQUEDA_VECTORIAL)
+            HnswIndex(
+                name='gestion_doc_emb_hnsw_l2',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_l2_ops'],
+            ),
+        ]
 
     # --- PROPIEDADES (LÓGICA) ---
     # Fíjate que @property y def están alineados verticalmente
@@ -40,6 +110,16 @@ class Documento(models.Model):
         nombre = self.archivo.name.lower()
         return nombre.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp'))
     
+    @property
+    def url_miniatura(self):
+        """Miniatura para las tarjetas (el original mientras no exista)"""
+        return self.archivo.storage.url(self.miniatura) if self.miniatura else self.archivo.url
+
+    @property
+    def url_vista_previa(self):
+        """Versión mediana para el visor (el original mientras no exista)"""
+        return self.archivo.storage.url(self.vista_previa) if self.vista_previa else self.archivo.url
+
     @property
     def extension(self):
         """Devuelve la extensión limpia (pdf, xlsx, docx)"""
@@ -50,3 +130,36 @@ class Documento(models.Model):
 
     def __str__(self):
         return f"Documento {self.id} ({self.estado})"
+
+
+class DocumentoChunk(models.Model):
+    """ Fragmento del texto de un documento, con su propio embedding (contexto del chat RAG) """
+    documento = models.ForeignKey(Documento, on_delete=models.CASCADE, related_name='chunks')
+    # Posición del fragmento dentro del documento (0, 1, 2...)
+    orden = models.PositiveIntegerField()
+    texto = models.TextField()
+    # Rango [inicio, fin) en Documento.texto_detectado: fragmentos vecinos se solapan
+    inicio = models.PositiveIntegerField()
+    fin = models.PositiveIntegerField()
+
+    # Vacío = pendiente; lo llena el micro-lote de embeddings junto con el del documento
+    embedding = VectorField(dimensions=1536, null=True, blank=True)
+    busqueda = SearchVectorField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['documento', 'orden'], name='gestion_chunk_doc_orden_uniq'),
+        ]
+        indexes = [
+            GinIndex(name='gestion_chunk_busqueda_gin', fields=['busqueda']),
+            HnswIndex(
+                name='gestion_chunk_emb_hnsw_l2',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_l2_ops'],
+            ),
+        ]
+
+    def __str__(self):
+        return f"Fragmento {self.orden} del documento {self.documento_id}"
@@ -0,0 +1,62 @@
+"""
+Paginación keyset (por cursor) para los listados de documentos.
+
+En vez de OFFSET (que obliga a Postgres a recorrer todas las filas anteriores)
+el cursor guarda la última fila vista y la siguiente página parte desde ahí.
+"""
+from django.conf import settings
+
+
+def paginar_por_id(queryset, cursor, tamano):
+    """
+    Página ordenada por -id. El cursor es el id de la última fila vista.
+    Devuelve (filas, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    try:
+        ultimo_id = int(cursor) if cursor else None
+    except ValueError:
+        ultimo_id = None  # cursor inválido -> primera página
+
+    if ultimo_id is not None:
+        queryset = queryset.filter(id__lt=ultimo_id)
+
+    # Pedimos una fila extra solo para saber si hay página siguiente
+    filas = list(queryset.order_by('-id')[:tamano + 1])
+    siguiente = str(filas[tamano - 1].id) if len(filas) > tamano else None
+    return filas[:tamano], siguiente
+
+
+def _leer_cursor_resultados(cursor):
+    # Formato: "<puntaje>:<id>"
+    try:
+        puntaje, ultimo_id = cursor.split(':')
+        return float(puntaje), int(ultimo_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def paginar_resultados(buscar, cursor, tamano):
+    """
+    Página de resultados ordenados por relevancia (.puntaje desc, id desc).
+
+    'buscar(k)' debe devolver los k mejores resultados ya ordenados. Siempre se
+    piden los mismos RECUPERACION['MAX_RESULTADOS'] candidatos (lo que venga en
+    la URL no cambia el costo) y el cursor guarda (puntaje, id) del último
+    resultado visto: la página siguiente es lo que viene después en esa lista.
+    """
+    posicion = _leer_cursor_resultados(cursor)
+
+    resultados = buscar(settings.RECUPERACION['MAX_RESULTADOS'])
+    if posicion:
+        puntaje, ultimo_id = posicion
+        resultados = [
+            r for r in resultados
+            if (-r.puntaje, -r.id) > (-puntaje, -ultimo_id)
+        ]
+
+    pagina = resultados[:tamano]
+    siguiente = None
+    if len(resultados) > tamano:
+        ultimo = pagina[-1]
+        siguiente = f"{ultimo.puntaje!r}:{ultimo.id}"
+    return pagina, siguiente
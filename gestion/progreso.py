@@ -0,0 +1,130 @@
+"""
+Progreso de la ingesta en vivo, por el mismo WebSocket del chat (grupo user_<id>).
+
+Celery y las vistas publican eventos por documento y etapa con notificar():
+    en_cola -> extrayendo | vision -> embedding -> listo   (o error)
+
+- Cada evento lleva un número de secuencia por usuario (INCR en Redis) y se
+  guarda con TTL bajo su propia clave, así se puede volver a entregar.
+- ChatConsumer junta los eventos que llegan seguidos (el último por documento
+  gana) y los manda cada PROGRESO['INTERVALO_ENVIO'] segundos: una carga
+  masiva de 500 archivos no inunda el socket.
+- Al reconectarse, el navegador manda la última secuencia que vio y recibe lo
+  que se perdió (delta). Si el hueco es muy grande o ya expiró, recibe una foto
+  del estado actual armada desde la base de datos (snapshot).
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Documento
+
+ETAPAS = {
+    'en_cola': 'En cola',
+    'extrayendo': 'Extrayendo texto',
+    'vision': 'Analizando imagen',
+    'embedding': 'Indexando',
+    'listo': 'Completado',
+    'error': 'Error',
+}
+
+# Imágenes que van a etapa_imagen (Textract + Rekognition); tasks.py usa esta misma lista
+EXT_VISION = ('jpg', 'jpeg', 'png')
+
+
+def _clave_seq(usuario_id):
+    return f"progreso_seq:{usuario_id}"
+
+
+def _clave_evento(usuario_id, seq):
+    return f"progreso_evento:{usuario_id}:{seq}"
+
+
+def evento(doc, etapa, **datos):
+    return dict(datos, doc_id=doc.id, titulo=doc.titulo, etapa=etapa, etiqueta=ETAPAS[etapa])
+
+
+def notificar(usuario_id, eventos):
+    """ Numera, guarda y manda al grupo del usuario una lista de eventos (una sola vez) """
+    if not eventos:
+        return
+    try:
+        cache.add(_clave_seq(usuario_id), 0, timeout=None)
+        ultimo = cache.incr(_clave_seq(usuario_id), len(eventos))
+        for seq, datos in enumerate(eventos, start=ultimo - len(eventos) + 1):
+            datos['seq'] = seq
+        cache.set_many(
+            {_clave_evento(usuario_id, datos['seq']): datos for datos in eventos},
+            timeout=settings.PROGRESO['TTL_EVENTOS'],
+        )
+    except Exception as e:
+        # Sin secuencia el navegador no los podría ordenar: se recupera con el snapshot
+        print(f"Error Redis (progreso usuario {usuario_id}): {e}")
+        return
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            f"user_{usuario_id}", {'type': 'doc.progreso', 'eventos': eventos}
+        )
+    except Exception as e:
+        print(f"Error enviando progreso (usuario {usuario_id}): {e}")
+
+
+def avisar(doc, etapa, **datos):
+    """ Atajo para un solo documento """
+    notificar(doc.usuario_id, [evento(doc, etapa, **datos)])
+
+
+def coalescer(eventos):
+    """ El último evento de cada documento, en orden de secuencia """
+    ultimos = {}
+    for datos in sorted(eventos, key=lambda d: d['seq']):
+        ultimos[datos['doc_id']] = datos
+    return sorted(ultimos.values(), key=lambda d: d['seq'])
+
+
+def etapa_actual(doc):
+    """ Etapa deducida de la base de datos (para el snapshot) """
+    if doc.estado == 'pendiente':
+        return 'en_cola'
+    if doc.estado == 'procesando':
+        return 'vision' if doc.extension in EXT_VISION else 'extrayendo'
+    if doc.estado == 'completado':
+        return 'embedding' if doc.embedding_pendiente else 'listo'
+    return 'error'
+
+
+def snapshot(usuario_id):
+    # La secuencia se lee ANTES de consultar: cualquier evento posterior la supera
+    try:
+        seq = cache.get(_clave_seq(usuario_id), 0)
+    except Exception as e:
+        print(f"Error Redis (snapshot progreso): {e}")
+        seq = 0
+    docs = (Documento.objects.filter(usuario_id=usuario_id)
+            .order_by('-id')
+            .only('id', 'titulo', 'archivo', 'estado', 'embedding_pendiente')
+            [:settings.PROGRESO['MAX_SNAPSHOT']])
+    return {
+        'type': 'progreso_snapshot',
+        'seq': seq,
+        'eventos': [evento(doc, etapa_actual(doc), seq=seq) for doc in docs],
+    }
+
+
+def resincronizar(usuario_id, desde):
+    """ Mensaje para un navegador que vio hasta la secuencia 'desde': delta si se puede, si no snapshot """
+    try:
+        actual = cache.get(_clave_seq(usuario_id), 0)
+        if desde is None or not 0 <= actual - desde <= settings.PROGRESO['MAX_DELTA']:
+            return snapshot(usuario_id)
+        claves = [_clave_evento(usuario_id, seq) for seq in range(desde + 1, actual + 1)]
+        eventos = cache.get_many(claves)
+    except Exception as e:
+        print(f"Error Redis (resincronizar progreso): {e}")
+        return snapshot(usuario_id)
+
+    if len(eventos) < len(claves):
+        return snapshot(usuario_id)  # alguno expiró o todavía se está guardando
+    return {'type': 'progreso', 'seq': actual, 'eventos': coalescer(eventos.values())}
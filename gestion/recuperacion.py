@@ -0,0 +1,151 @@
+"""
+Motor de recuperación híbrido (full-text + vectorial) compartido por el
+buscador (lista_documentos, por documento) y el chatbot RAG (chat_api, por
+fragmento: ver gestion/fragmentos.py).
+
+Las dos búsquedas de candidatos corren en paralelo y se fusionan con
+Reciprocal Rank Fusion (RRF): puntaje = suma de peso / (K_RRF + posición).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+from .busqueda import (
+    buscar_fragmentos_similares, buscar_fragmentos_texto, buscar_similares, buscar_texto,
+)
+from .embeddings import generar_embedding_consulta
+from .fragmentos import armar_contexto
+from .models import Documento
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.RECUPERACION['HILOS'],
+    thread_name_prefix='recuperacion',
+)
+
+
+def _en_hilo(funcion, *args, **kwargs):
+    # Cada hilo abre su propia conexión a Postgres; la cerramos al terminar
+    # para no dejar conexiones colgando fuera del ciclo request/response.
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def _candidatos_vectoriales(usuario, consulta, k, base):
+    vector = generar_embedding_consulta(consulta)
+    if not vector:
+        return []  # Sin Bedrock -> solo queda la parte full-text
+    return buscar_similares(usuario, vector, k=k, base=base)
+
+
+def fusionar_rrf(listas, pesos, k_rrf):
+    """ Fusiona listas de documentos ya ordenadas. Devuelve [(doc, puntaje)] de mayor a menor. """
+    puntajes = {}
+    documentos = {}
+    for lista, peso in zip(listas, pesos):
+        for posicion, doc in enumerate(lista, start=1):
+            puntajes[doc.id] = puntajes.get(doc.id, 0.0) + peso / (k_rrf + posicion)
+            if doc.id in documentos:
+                # Mismo documento en ambas listas: conservamos rank y distancia
+                for atributo in ('rank', 'distancia'):
+                    if hasattr(doc, atributo):
+                        setattr(documentos[doc.id], atributo, getattr(doc, atributo))
+            else:
+                documentos[doc.id] = doc
+
+    orden = sorted(puntajes, key=lambda doc_id: (-puntajes[doc_id], -doc_id))
+    return [(documentos[doc_id], puntajes[doc_id]) for doc_id in orden]
+
+
+def recuperar(usuario, consulta, k=None, cualquier_palabra=False, ligero=False):
+    """
+    Devuelve los K documentos más relevantes del usuario (lista), cada uno con
+    el atributo .puntaje (RRF). Una sola ronda: las dos consultas van en paralelo.
+    Con ligero=True no se cargan las columnas pesadas (para listados).
+    """
+    config = settings.RECUPERACION
+    k = k or config['TOP_K']
+    candidatos = max(k, config['CANDIDATOS'])
+    base = Documento.objects.para_listado() if ligero else Documento.objects.all()
+
+    # Full-text en otro hilo mientras este calcula el embedding y consulta el índice ANN
+    futuro_texto = _executor.submit(
+        _en_hilo, buscar_texto, usuario, consulta, candidatos, cualquier_palabra, base
+    )
+    try:
+        vectoriales = _candidatos_vectoriales(usuario, consulta, candidatos, base)
+    except Exception as e:
+        print(f"Error en búsqueda vectorial: {e}")
+        vectoriales = []
+    textuales = futuro_texto.result()
+
+    fusionados = fusionar_rrf(
+        [textuales, vectoriales],
+        [config['PESO_TEXTO'], config['PESO_VECTOR']],
+        config['K_RRF'],
+    )
+
+    resultados = []
+    for doc, puntaje in fusionados[:k]:
+        doc.puntaje = puntaje
+        resultados.append(doc)
+    return resultados
+
+
+def _fragmentos_vectoriales(usuario, consulta, k):
+    try:
+        vector = generar_embedding_consulta(consulta)
+        return buscar_fragmentos_similares(usuario, vector, k=k) if vector else []
+    except Exception as e:
+        print(f"Error en búsqueda vectorial (fragmentos): {e}")
+        return []
+
+
+def _fusionar_fragmentos(textuales, vectoriales, k):
+    config = settings.RECUPERACION
+    fusionados = fusionar_rrf(
+        [textuales, vectoriales],
+        [config['PESO_TEXTO'], config['PESO_VECTOR']],
+        config['K_RRF'],
+    )
+    resultados = []
+    for fragmento, puntaje in fusionados[:k]:
+        fragmento.puntaje = puntaje
+        resultados.append(fragmento)
+    return resultados
+
+
+def recuperar_fragmentos(usuario, consulta, k=None):
+    """
+    Igual que recuperar(), pero devuelve los K fragmentos más relevantes (con .puntaje).
+    Siempre con cualquier_palabra: son preguntas del chat, no sintaxis de buscador.
+    """
+    k = k or settings.FRAGMENTOS['CANDIDATOS']
+    futuro_texto = _executor.submit(_en_hilo, buscar_fragmentos_texto, usuario, consulta, k, True)
+    vectoriales = _fragmentos_vectoriales(usuario, consulta, k)
+    return _fusionar_fragmentos(futuro_texto.result(), vectoriales, k)
+
+
+def contexto_rag(usuario, pregunta, presupuesto_tokens=None):
+    """ (texto de contexto para el prompt, documentos citados) con los mejores fragmentos """
+    return armar_contexto(recuperar_fragmentos(usuario, pregunta), presupuesto_tokens)
+
+
+async def contexto_rag_async(usuario, pregunta, presupuesto_tokens=None):
+    """
+    Versión async de contexto_rag (chat_api, ChatConsumer). Las dos búsquedas van
+    en paralelo en el pool de hilos: el event loop queda libre y no se hace fila en
+    el hilo único de sync_to_async (el ORM async de Django 4.2 usa ese mismo hilo y
+    no soporta el SET LOCAL de la búsqueda vectorial dentro de una transacción).
+    """
+    loop = asyncio.get_running_loop()
+    k = settings.FRAGMENTOS['CANDIDATOS']
+    textuales, vectoriales = await asyncio.gather(
+        loop.run_in_executor(_executor, partial(_en_hilo, buscar_fragmentos_texto, usuario, pregunta, k, True)),
+        loop.run_in_executor(_executor, partial(_en_hilo, _fragmentos_vectoriales, usuario, pregunta, k)),
+    )
+    return armar_contexto(_fusionar_fragmentos(textuales, vectoriales, k), presupuesto_tokens)
@@ -0,0 +1,188 @@
+"""
+Subida directa navegador -> S3 (sin pasar los bytes por Django).
+
+1. preparar: la vista firma la subida y devuelve al navegador
+     - archivos chicos:  un POST prefirmado (generate_presigned_post), con el
+       tamaño exacto amarrado en la política (content-length-range)
+     - archivos grandes: un multipart upload con una URL prefirmada por parte
+   más un "ticket" firmado (django.core.signing) con bucket/key/tamaño/usuario.
+2. el navegador sube a S3.
+3. confirmar: con el ticket, cerramos el multipart (si aplica), verificamos con
+   head_object que el objeto existe y pesa lo declarado, y recién ahí se crea el
+   Documento y se encola procesar_archivo_ia.
+
+Requiere CORS en el bucket permitiendo POST/PUT desde el dominio del sitio (y
+exponer el header ETag para el multipart). Un multipart que falla al confirmar
+se aborta aquí; para los que el navegador nunca confirma, el bucket necesita
+una regla de ciclo de vida AbortIncompleteMultipartUpload (ej: 1 día) sobre
+SUBIDA_DIRECTA['PREFIJO'], o sus partes se siguen cobrando.
+"""
+import math
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection, transaction
+from django.utils.text import get_valid_filename
+
+from .clientes_aws import obtener_cliente
+from .models import Documento
+from .progreso import avisar
+from .tasks import procesar_archivo_ia
+
+SAL_TICKET = 'gestion.subida_directa'
+
+
+class SubidaInvalida(Exception):
+    """ Datos de la subida rechazados (tamaño, ticket, objeto faltante...) """
+
+
+def config_subida(clave):
+    return settings.SUBIDA_DIRECTA[clave]
+
+
+def nombre_base(nombre_archivo):
+    # El navegador puede mandar rutas ("C:\fakepath\x.pdf"): solo el nombre
+    return (nombre_archivo or '').split('/')[-1].split('\\')[-1]
+
+
+def key_nueva(nombre_archivo):
+    # Mismo prefijo que Documento.archivo (upload_to); el uuid evita choques de nombre
+    nombre = get_valid_filename(nombre_archivo) or 'archivo'
+    return f"{config_subida('PREFIJO')}{uuid.uuid4().hex}/{nombre}"
+
+
+def preparar_subida(usuario, nombre_archivo, tamano, tipo=None):
+    """ Firma la subida directa. Devuelve el dict que consume el JavaScript. """
+    try:
+        tamano = int(tamano)
+    except (TypeError, ValueError):
+        raise SubidaInvalida("Tamaño inválido")
+    if tamano <= 0 or tamano > config_subida('MAX_TAMANO'):
+        raise SubidaInvalida("Archivo vacío o demasiado grande")
+
+    nombre_archivo = nombre_base(nombre_archivo)
+    client_s3 = obtener_cliente('s3')
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    key = key_nueva(nombre_archivo)
+    tipo = tipo or 'application/octet-stream'
+    expira = config_subida('EXPIRA')
+    datos_ticket = {'bucket': bucket, 'key': key, 'tamano': tamano, 'usuario': usuario.id,
+                    'nombre': nombre_archivo}
+
+    if tamano <= config_subida('UMBRAL_MULTIPART'):
+        post = client_s3.generate_presigned_post(
+            Bucket=bucket,
+            Key=key,
+            Fields={'Content-Type': tipo},
+            Conditions=[
+                {'Content-Type': tipo},
+                # S3 rechaza el POST si el archivo no pesa exactamente lo declarado
+                ['content-length-range', tamano, tamano],
+            ],
+            ExpiresIn=expira,
+        )
+        respuesta = {'modo': 'post', 'url': post['url'], 'campos': post['fields']}
+    else:
+        multipart = client_s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=tipo)
+        upload_id = multipart['UploadId']
+        tamano_parte = config_subida('TAMANO_PARTE')
+        partes = [
+            {
+                'numero': numero,
+                'url': client_s3.generate_presigned_url(
+                    'upload_part',
+                    Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': numero},
+                    ExpiresIn=expira,
+                ),
+            }
+            for numero in range(1, math.ceil(tamano / tamano_parte) + 1)
+        ]
+        datos_ticket['upload_id'] = upload_id
+        respuesta = {'modo': 'multipart', 'tamano_parte': tamano_parte, 'partes': partes}
+
+    respuesta['ticket'] = signing.dumps(datos_ticket, salt=SAL_TICKET)
+    return respuesta
+
+
+def _leer_ticket(usuario, ticket):
+    try:
+        datos = signing.loads(ticket, salt=SAL_TICKET, max_age=config_subida('EXPIRA') * 2)
+    except signing.BadSignature:
+        raise SubidaInvalida("Ticket de subida inválido o vencido")
+    if datos['usuario'] != usuario.id:
+        raise SubidaInvalida("El ticket pertenece a otro usuario")
+    return datos
+
+
+def _bloquear_key(key):
+    """ Lock de Postgres por key hasta el fin de la transacción (las demás keys no esperan) """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [key])
+
+
+def _abortar_multipart(client_s3, bucket, key, upload_id):
+    try:
+        client_s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    except Exception as e:
+        print(f"Error abortando multipart ({key}): {e}")
+
+
+def confirmar_subida(usuario, ticket, titulo=None, partes=None):
+    """
+    Verifica el objeto subido y crea el Documento (encolando la IA al hacer commit).
+    'partes' = [{'numero': 1, 'etag': '"..."'}, ...] en el modo multipart.
+    """
+    datos = _leer_ticket(usuario, ticket)
+    with transaction.atomic():
+        # Confirmaciones simultáneas de la misma key (doble clic, reintento del
+        # navegador): la segunda espera aquí y devuelve el documento de la primera
+        _bloquear_key(datos['key'])
+        existente = Documento.objects.filter(archivo=datos['key'], usuario=usuario).first()
+        if existente:
+            return existente
+        return _crear_documento(usuario, datos, titulo, partes)
+
+
+def _crear_documento(usuario, datos, titulo, partes):
+    bucket, key = datos['bucket'], datos['key']
+    client_s3 = obtener_cliente('s3')
+    if datos.get('upload_id'):
+        if not partes:
+            raise SubidaInvalida("Faltan las partes del multipart")
+        try:
+            client_s3.complete_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=datos['upload_id'],
+                MultipartUpload={'Parts': [
+                    {'PartNumber': int(parte['numero']), 'ETag': parte['etag']}
+                    for parte in sorted(partes, key=lambda p: int(p['numero']))
+                ]},
+            )
+        except Exception as e:
+            print(f"Error completando multipart ({key}): {e}")
+            # Las partes ya subidas se cobran mientras el multipart siga abierto
+            _abortar_multipart(client_s3, bucket, key, datos['upload_id'])
+            raise SubidaInvalida("No se pudo completar la subida por partes")
+
+    try:
+        cabecera = client_s3.head_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        print(f"Objeto no encontrado en S3 ({key}): {e}")
+        raise SubidaInvalida("El archivo no llegó a S3")
+
+    if cabecera['ContentLength'] != datos['tamano']:
+        client_s3.delete_object(Bucket=bucket, Key=key)
+        raise SubidaInvalida("El archivo subido no coincide con el tamaño declarado")
+
+    documento = Documento(
+        usuario=usuario,
+        titulo=titulo or datos['nombre'],
+        estado='pendiente',
+    )
+    # Asignar el nombre (str) registra el objeto ya subido, sin volver a subirlo
+    documento.archivo = key
+    documento.save()
+
+    transaction.on_commit(lambda: procesar_archivo_ia.delay(documento.id))
+    transaction.on_commit(lambda: avisar(documento, 'en_cola'))
+    return documento
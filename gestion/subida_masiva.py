@@ -0,0 +1,158 @@
+"""
+Carga masiva: varios archivos o un ZIP en un solo POST (ej: el catálogo de un
+proveedor nuevo, cientos de fichas y fotos).
+
+- Los miembros del ZIP se leen en streaming (ZipFile.open) y van directo a S3
+  con upload_fileobj: nada se descomprime a disco. Varias subidas en paralelo.
+- El SHA-256 se calcula mientras se sube y queda en hash_contenido, así las
+  subidas futuras del mismo archivo se deduplican contra este.
+- Un solo bulk_create para todos los Documento del lote y, al hacer commit, un
+  group de Celery con un procesar_archivo_ia por documento (un viaje al broker).
+- Todos comparten Documento.lote: progreso_lote() resume sus estados.
+"""
+import hashlib
+import mimetypes
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from celery import group
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .clientes_aws import obtener_cliente
+from .models import Documento
+from .progreso import evento, notificar
+from .subida_directa import key_nueva, nombre_base
+from .tasks import procesar_archivo_ia
+
+
+class CargaInvalida(Exception):
+    """ Lote rechazado (vacío, demasiados archivos, ZIP dañado o demasiado grande) """
+
+
+class LectorConHash:
+    """ Stream de solo lectura que va calculando el SHA-256 de lo que boto3 lee """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def read(self, n=-1):
+        datos = self.stream.read(n)
+        self.sha256.update(datos)
+        return datos
+
+
+def _ignorar(info):
+    # Carpetas, basura de macOS y archivos ocultos que traen los ZIP
+    nombre = nombre_base(info.filename)
+    return info.is_dir() or info.filename.startswith('__MACOSX/') or not nombre or nombre.startswith('.')
+
+
+def _entradas(archivos, pila):
+    """ [(nombre, tamaño, abrir)] de todos los archivos del lote, con los ZIP abiertos """
+    entradas = []
+    for archivo in archivos:
+        if not archivo.name.lower().endswith('.zip'):
+            entradas.append((nombre_base(archivo.name), archivo.size, lambda a=archivo: a.open('rb')))
+            continue
+
+        try:
+            zip_ = pila.enter_context(zipfile.ZipFile(archivo))
+        except zipfile.BadZipFile:
+            raise CargaInvalida(f"ZIP dañado: {archivo.name}")
+        for info in zip_.infolist():
+            if _ignorar(info):
+                continue
+            if info.flag_bits & 0x1:
+                raise CargaInvalida(f"ZIP con contraseña no soportado: {archivo.name}")
+            # Tamaño declarado en el ZIP: ZipExtFile no entrega más que eso (CRC incluido)
+            entradas.append((nombre_base(info.filename), info.file_size, lambda z=zip_, i=info: z.open(i)))
+    return entradas
+
+
+def _validar(entradas):
+    config = settings.SUBIDA_MASIVA
+    if not entradas:
+        raise CargaInvalida("No llegó ningún archivo")
+    if len(entradas) > config['MAX_ARCHIVOS']:
+        raise CargaInvalida(f"Máximo {config['MAX_ARCHIVOS']} archivos por lote")
+    for nombre, tamano, _ in entradas:
+        if tamano > config['MAX_TAMANO_ARCHIVO']:
+            raise CargaInvalida(f"Archivo demasiado grande: {nombre}")
+    if sum(tamano for _, tamano, _ in entradas) > config['MAX_TAMANO_TOTAL']:
+        raise CargaInvalida("El lote descomprimido supera el tamaño máximo")
+
+
+def crear_lote(usuario, archivos):
+    """
+    Sube a S3 todos los archivos (y miembros de ZIP), crea sus Documento y encola
+    la IA. Devuelve {'lote', 'documentos', 'fallidos'}; los que no se pudieron
+    subir quedan en 'fallidos' y no detienen al resto.
+    """
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    client_s3 = obtener_cliente('s3')
+    lote = uuid.uuid4()
+    fallidos = []
+
+    def subir(entrada):
+        nombre, _, abrir = entrada
+        key = key_nueva(nombre)
+        try:
+            with abrir() as stream:
+                lector = LectorConHash(stream)
+                client_s3.upload_fileobj(
+                    lector, bucket, key,
+                    ExtraArgs={'ContentType': mimetypes.guess_type(nombre)[0] or 'application/octet-stream'},
+                )
+        except Exception as e:
+            print(f"Error subiendo {nombre} (lote {lote}): {e}")
+            fallidos.append(nombre)
+            return None
+        # El nombre (str) registra el objeto ya subido, sin volver a subirlo
+        return Documento(
+            usuario=usuario,
+            titulo=nombre[:200],
+            archivo=key,
+            estado='pendiente',
+            lote=lote,
+            hash_contenido=lector.sha256.hexdigest(),
+        )
+
+    with ExitStack() as pila:
+        entradas = _entradas(archivos, pila)
+        _validar(entradas)
+        with ThreadPoolExecutor(max_workers=settings.SUBIDA_MASIVA['HILOS_S3'],
+                                thread_name_prefix='subida_masiva') as executor:
+            documentos = [doc for doc in executor.map(subir, entradas) if doc]
+
+    with transaction.atomic():
+        # Postgres devuelve los ids en el mismo INSERT
+        Documento.objects.bulk_create(documentos, batch_size=500)
+        ids = [doc.id for doc in documentos]
+        if ids:
+            transaction.on_commit(lambda: group(procesar_archivo_ia.s(i) for i in ids).apply_async())
+            # Un solo mensaje con todo el lote: la página agrega las filas sin recargar
+            transaction.on_commit(lambda: notificar(usuario.id, [evento(doc, 'en_cola') for doc in documentos]))
+
+    print(f"--> [LOTE] {lote}: {len(ids)} documentos encolados, {len(fallidos)} fallidos")
+    return {'lote': lote, 'documentos': len(ids), 'fallidos': fallidos}
+
+
+def progreso_lote(usuario, lote):
+    """ Conteo por estado de los documentos del lote (una consulta). None si no existe. """
+    conteos = Documento.objects.filter(usuario=usuario, lote=lote).aggregate(
+        total=Count('id'),
+        **{estado: Count('id', filter=Q(estado=estado)) for estado, _ in Documento.OPCIONES_ESTADO},
+        # Ya procesados pero aún sin vector: todavía no aparecen en la búsqueda semántica
+        sin_embedding=Count('id', filter=Q(embedding_pendiente=True)),
+    )
+    if not conteos['total']:
+        return None
+    terminados = conteos['completado'] + conteos['error']
+    conteos['porcentaje'] = round(100 * terminados / conteos['total'])
+    conteos['terminado'] = terminados == conteos['total']
+    return conteos
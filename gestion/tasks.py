@@ -1,156 +1,478 @@
-from celery import shared_task
+from celery import shared_task, chain
 from django.conf import settings
-from .models import Documento
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import boto3
+from django.core.cache import cache
+from .models import Documento, LARGO_PREVIEW
+from .busqueda import actualizar_vector_texto
+from .clientes_aws import obtener_cliente
+from .embeddings import embeber_pendientes, espera_siguiente_lote
+from .cache_respuestas import invalidar_usuario
+from .fragmentos import crear_fragmentos
+from .extraccion import AcumuladorTexto, ExtractorPdf, imagen_s3, obtener_extractor, ocr_imagen
+from .progreso import EXT_VISION, avisar, evento, notificar
+from .miniaturas import ImagenIlegible, generar_versiones, imagenes_para_ia, tiene_versiones
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 import time
-import random
-import zipfile
-import xml.etree.ElementTree as ET
-import io
 
-# --- CONFIGURACIÓN ---
-MODO_LABORATORIO_BEDROCK = True 
+# ==============================================================================
+# PIPELINE DE INGESTA POR ETAPAS
+#
+#   procesar_archivo_ia (cola 'ingesta') arma el flujo según el tipo de archivo:
+#
+#   imágenes:  etapa_imagen (OCR + etiquetas en paralelo) -> etapa_finalizar
+#   pdf:       etapa_extraer_pdf -> (capa de texto local | Textract async -> revisar_textract_pdf)
+#                                -> etapa_finalizar
+#   resto:     etapa_extraer (registro de extractores) -> etapa_finalizar
+#
+#   etapa_finalizar corta el texto en fragmentos (DocumentoChunk), deja el documento
+#   con embedding_pendiente=True y programa un micro-lote: procesar_lote_embeddings
+#   embebe muchos documentos (y sus fragmentos) de una vez.
+#
+#   Cada etapa va a su propia cola (settings.CELERY_TASK_ROUTES), así un TXT no
+#   espera detrás del OCR de un PDF y cada cola escala con su propia concurrencia.
+#   Los resultados intermedios viajan entre etapas como dicts JSON:
+#   {'texto': ...}, {'tags': [...]}
+# ==============================================================================
+
+def _datos_archivo(doc):
+    """ (bucket, key, extensión) del archivo en S3 """
+    file_name = doc.archivo.name
+    # Truco: sacamos la extensión en minúsculas
+    ext = file_name.split('.')[-1].lower()
+    return settings.AWS_STORAGE_BUCKET_NAME, file_name, ext
+
+
+def _marcar_error(documento_id, e):
+    print(f"ERROR CRITICO (Documento {documento_id}): {e}")
+    Documento.objects.filter(id=documento_id).update(estado='error')
+    doc = Documento.objects.filter(id=documento_id).only('id', 'titulo', 'usuario_id').first()
+    if doc:
+        avisar(doc, 'error')
+
+
+def _combinar(resultados):
+    """ Une los resultados de las etapas anteriores (un dict o una lista de dicts) """
+    if isinstance(resultados, dict):
+        resultados = [resultados]
+    datos = {'texto': '', 'tags': []}
+    for resultado in resultados:
+        datos.update(resultado)
+    return datos
+
 
 @shared_task
 def procesar_archivo_ia(documento_id):
     print(f"--- [CELERY] Iniciando tarea para Documento ID: {documento_id} ---")
-    
+
     try:
         # 1. Buscar documento
         doc = Documento.objects.get(id=documento_id)
         doc.estado = 'procesando'
-        doc.save()
-
-        # 2. Configurar S3
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        file_name = doc.archivo.name
-        # Truco: sacamos la extensión en minúsculas
-        ext = file_name.split('.')[-1].lower()
-
-        # Clientes AWS
-        client_s3 = boto3.client('s3', region_name='us-east-1')
-        client_rek = boto3.client('rekognition', region_name='us-east-1')
-        client_textract = boto3.client('textract', region_name='us-east-1')
-        
-        tags_finales = []
-        texto_final = ""
-        embedding_final = None 
-
-        # ==============================================================================
-        # PASO A: EXTRACCIÓN DE TEXTO (LÓGICA MULTI-FORMATO)
-        # ==============================================================================
-        print(f"--> [IA] Iniciando extracción para formato: {ext}")
-        
-        try:
-            # --- CASO 1: TEXTO PLANO (.txt) ---
-            if ext == 'txt':
-                # Descargamos directo a memoria y leemos
-                obj = client_s3.get_object(Bucket=bucket_name, Key=file_name)
-                texto_final = obj['Body'].read().decode('utf-8')
-                print(f"--> [IA] TXT leído exitosamente.")
-
-            # --- CASO 2: WORD (.docx) ---
-            elif ext == 'docx':
-                # El .docx es en realidad un ZIP con XMLs adentro. Lo abrimos nativamente.
-                obj = client_s3.get_object(Bucket=bucket_name, Key=file_name)
-                buffer = io.BytesIO(obj['Body'].read())
-                
-                with zipfile.ZipFile(buffer) as z:
-                    xml_content = z.read('word/document.xml')
-                    tree = ET.fromstring(xml_content)
-                    
-                    # Namespace oficial de Word
-                    namespaces = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-                    textos = []
-                    # Buscamos todas las etiquetas de texto <w:t>
-                    for node in tree.iterfind('.//w:t', namespaces):
-                        if node.text:
-                            textos.append(node.text)
-                    texto_final = "\n".join(textos)
-                print(f"--> [IA] DOCX procesado exitosamente.")
-
-            # --- CASO 3: IMÁGENES (JPG, PNG) -> TEXTRACT SÍNCRONO ---
-            elif ext in ['jpg', 'jpeg', 'png', 'tiff', 'tif']:
-                response = client_textract.detect_document_text(
-                    Document={'S3Object': {'Bucket': bucket_name, 'Name': file_name}}
-                )
-                lineas = [item['Text'] for item in response['Blocks'] if item['BlockType'] == 'LINE']
-                texto_final = "\n".join(lineas)
-
-            # --- CASO 4: PDF -> TEXTRACT ASÍNCRONO ---
-            elif ext == 'pdf':
-                start = client_textract.start_document_text_detection(
-                    DocumentLocation={'S3Object': {'Bucket': bucket_name, 'Name': file_name}}
-                )
-                job_id = start['JobId']
-                print(f"--> [IA] Job PDF iniciado: {job_id}")
-
-                while True:
-                    status = client_textract.get_document_text_detection(JobId=job_id)
-                    if status['JobStatus'] in ['SUCCEEDED', 'FAILED']:
-                        if status['JobStatus'] == 'SUCCEEDED':
-                            lineas = [item['Text'] for item in status['Blocks'] if item['BlockType'] == 'LINE']
-                            texto_final = "\n".join(lineas)
-                        break
-                    time.sleep(2)
-
-            else:
-                texto_final = "Formato no soportado para extracción automática."
+        doc.save(update_fields=['estado'])
+
+        _, _, ext = _datos_archivo(doc)
+
+        # 2. Armar el pipeline según el formato
+        if ext == 'pdf':
+            etapa_extraer_pdf.apply_async((documento_id,), link_error=al_fallar(documento_id))
+        else:
+            primera_etapa = etapa_imagen if ext in EXT_VISION else etapa_extraer
+            chain(
+                primera_etapa.s(documento_id),
+                etapa_finalizar.s(documento_id),
+            ).apply_async(link_error=al_fallar(documento_id))
+
+        # Miniatura y vista previa: en paralelo, no dependen de la IA
+        if tiene_versiones(doc.archivo.name):
+            etapa_versiones.delay(documento_id)
+
+        return "PIPELINE_INICIADO"
+
+    except Exception as e:
+        _marcar_error(documento_id, e)
+        return "Error"
+
+
+def continuar_pipeline(documento_id, resultado):
+    """ Para etapas que terminan fuera de la cadena (ej: Textract asíncrono) """
+    etapa_finalizar.apply_async((resultado, documento_id), link_error=al_fallar(documento_id))
+
+
+@shared_task
+def pipeline_fallido(request, exc, traceback, documento_id):
+    """ Errback de las etapas: una excepción que la etapa no atrapó (o el worker murió) """
+    _marcar_error(documento_id, exc)
+
+
+def al_fallar(documento_id):
+    # Sin esto, un error antes del try de una etapa (DoesNotExist, la BD, un worker
+    # caído) deja el documento en 'procesando' para siempre
+    return pipeline_fallido.s(documento_id)
+
+
+# ==============================================================================
+# ETAPA 1: EXTRACCIÓN DE TEXTO (REGISTRO DE EXTRACTORES)  -> cola 'extraccion'
+#
+# El formato se resuelve en gestion/extraccion.py (por extensión o MIME):
+# txt, csv, docx, xlsx, pptx se leen aquí mismo en streaming; tiff va a Textract.
+# ==============================================================================
+@shared_task
+def etapa_extraer(documento_id):
+    doc = Documento.objects.get(id=documento_id)
+    bucket_name, file_name, ext = _datos_archivo(doc)
+    texto_final = ""
+
+    print(f"--> [IA] Iniciando extracción para formato: {ext}")
+    avisar(doc, 'extrayendo')
+
+    extractor = obtener_extractor(obtener_cliente('s3'), bucket_name, file_name)
+    if extractor is None:
+        return {'texto': "Formato no soportado para extracción automática."}
+
+    try:
+        with extractor:
+            texto_final = extractor.extraer()
+        print(f"--> [IA] {extractor.nombre} procesado exitosamente.")
+    except Exception as e:
+        print(f"Error extrayendo texto: {e}")
+        texto_final = f"Error de lectura: {str(e)}"
+
+    return {'texto': texto_final}
+
+
+# ==============================================================================
+# ETAPA 2: IMÁGENES (JPG, PNG) -> TEXTRACT + REKOGNITION EN PARALELO  -> cola 'vision'
+#
+# Las fotos que pasan el lado o los bytes de una API se reducen primero
+# (imagenes_para_ia) y van como bytes; las demás se leen directo de S3. Las dos llamadas son independientes: en vez de
+# sumar dos viajes de red, corren en hilos. Cada una tiene su propio timeout y
+# su propio manejo de error: si una falla o se demora, la otra se guarda igual.
+# ==============================================================================
+
+def _cliente_ia(servicio, timeout):
+    return obtener_cliente(servicio, read_timeout=timeout, retries={'max_attempts': 2, 'mode': 'standard'})
+
+
+def etiquetas_imagen(imagen, client_rek=None):
+    """ Etiquetas de Rekognition para una imagen ({'S3Object': ...} o {'Bytes': ...}) """
+    client_rek = client_rek or _cliente_ia('rekognition', settings.IA_IMAGEN['TIMEOUT_VISION'])
+    rek = client_rek.detect_labels(
+        Image=imagen,
+        MaxLabels=5,
+        MinConfidence=90
+    )
+    return [l['Name'] for l in rek['Labels']]
+
+
+def _esperar(futuro, timeout, nombre):
+    """ Resultado de una llamada o None si falló / se pasó del tiempo """
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturesTimeout:
+        print(f"Timeout {nombre} ({timeout:.1f}s)")
+    except Exception as e:
+        print(f"Error {nombre}: {e}")
+    return None
+
+
+@shared_task
+def etapa_imagen(documento_id):
+    doc = Documento.objects.get(id=documento_id)
+    bucket_name, file_name, _ = _datos_archivo(doc)
+    config = settings.IA_IMAGEN
+    avisar(doc, 'vision')
+
+    # Los clientes se piden aquí (no dentro de los hilos): quedan listos y cacheados
+    client_textract = _cliente_ia('textract', config['TIMEOUT_OCR'])
+    client_rek = _cliente_ia('rekognition', config['TIMEOUT_VISION'])
+
+    # Fotos grandes: una sola decodificación, reducidas y como bytes (menos latencia y
+    # sin pasarse de los límites de las APIs síncronas). Las que ya cumplen van desde S3.
+    try:
+        entradas = imagenes_para_ia(obtener_cliente('s3'), bucket_name, file_name)
+    except Exception as e:
+        print(f"Error preparando imagen para IA, va el original: {e}")
+        entradas = dict.fromkeys(('ocr', 'etiquetas'), imagen_s3(bucket_name, file_name))
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ia_imagen')
+    try:
+        futuro_ocr = executor.submit(ocr_imagen, entradas['ocr'], client_textract)
+        futuro_tags = executor.submit(etiquetas_imagen, entradas['etiquetas'], client_rek)
 
+        # El timeout de cada llamada corre desde el mismo instante (ambas ya partieron)
+        inicio = time.monotonic()
+        texto_final = _esperar(futuro_ocr, config['TIMEOUT_OCR'], 'Textract')
+        restante = max(0, config['TIMEOUT_VISION'] - (time.monotonic() - inicio))
+        tags_finales = _esperar(futuro_tags, restante, 'Rekognition')
+    finally:
+        # No esperamos a un hilo colgado: el resultado que sí llegó se guarda igual
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if texto_final is None:
+        texto_final = "Error de lectura: Textract no respondió"
+    return {'texto': texto_final, 'tags': tags_finales or []}
+
+
+# ==============================================================================
+# VERSIONES REDUCIDAS (miniatura + vista previa WebP)  -> cola 'vision'
+#
+# Fuera de la cadena de IA (corre en paralelo). Ver gestion/miniaturas.py
+# ==============================================================================
+@shared_task
+def etapa_versiones(documento_id):
+    doc = Documento.objects.only('id', 'archivo').get(id=documento_id)
+    bucket_name, file_name, _ = _datos_archivo(doc)
+    campos = settings.VERSIONES_IMAGEN['TAMANOS']
+
+    try:
+        claves = generar_versiones(obtener_cliente('s3'), bucket_name, file_name)
+    except ImagenIlegible as e:
+        # '' = no volver a intentarlo; las plantillas muestran el original
+        print(f"Imagen ilegible (Documento {documento_id}): {e}")
+        claves = dict.fromkeys(campos, '')
+    except Exception as e:
+        # Error de S3: queda en None y se reintenta la próxima vez que se muestre
+        print(f"Error generando versiones (Documento {documento_id}): {e}")
+        return "Error"
+
+    Documento.objects.filter(id=documento_id).update(**claves)
+    return "OK"
+
+
+def pedir_versiones(documentos):
+    """
+    Generación perezosa para filas anteriores a las versiones: encola las que
+    faltan de los documentos que se van a mostrar (como máximo una vez cada
+    REINTENTO_PEREZOSO segundos por documento).
+    """
+    espera = settings.VERSIONES_IMAGEN['REINTENTO_PEREZOSO']
+    for doc in documentos:
+        if doc.miniatura is not None or not tiene_versiones(doc.archivo.name):
+            continue
+        try:
+            encolar = cache.add(f"gestion:versiones:{doc.id}", 1, timeout=espera)
         except Exception as e:
-            print(f"Error extrayendo texto: {e}")
-            texto_final = f"Error de lectura: {str(e)}"
+            print(f"Error Redis (versiones): {e}")
+            return
+        if encolar:
+            etapa_versiones.delay(doc.id)
+
 
-        # ==============================================================================
-        # PASO B: ANÁLISIS VISUAL (Solo Imágenes)
-        # ==============================================================================
-        if ext in ['jpg', 'jpeg', 'png']:
-            try:
-                rek = client_rek.detect_labels(
-                    Image={'S3Object': {'Bucket': bucket_name, 'Name': file_name}},
-                    MaxLabels=5,
-                    MinConfidence=90
-                )
-                tags_finales = [l['Name'] for l in rek['Labels']]
-            except Exception as e:
-                print(f"Error Rekognition: {e}")
-
-        # ==============================================================================
-        # PASO C: GUARDAR
-        # ==============================================================================
-        
-        # Generar vector simulado para la demo
-        if MODO_LABORATORIO_BEDROCK:
-            embedding_final = [random.uniform(-1.0, 1.0) for _ in range(1536)]
-
-        doc.tags_ia = tags_finales
-        doc.texto_detectado = texto_final
-        doc.embedding = embedding_final
-        doc.estado = 'completado'
-        doc.save()
-
-        print(f"--- [CELERY] Tarea FINALIZADA OK ---")
+# ==============================================================================
+# ETAPA 3: GUARDAR  -> cola 'finalizacion'
+# ==============================================================================
+@shared_task
+def etapa_finalizar(resultados, documento_id):
+    try:
+        datos = _combinar(resultados)
+        doc = Documento.objects.get(id=documento_id)
+        guardar_resultado(doc, datos['texto'], datos['tags'])
+        programar_lote_embeddings()
+        # La IA terminó (ya aparece en la búsqueda por texto); falta su lote de embeddings
+        avisar(doc, 'embedding', tags=doc.tags_ia, texto=doc.texto_preview[:100])
+
+        print(f"--- [CELERY] Documento {documento_id} FINALIZADO OK ---")
         return "OK"
 
     except Exception as e:
-        print(f"ERROR CRITICO: {e}")
+        _marcar_error(documento_id, e)
         return "Error"
 
-    # --- NOTIFICACIÓN WEBSOCKET (NUEVO) ---
-        channel_layer = get_channel_layer()
-        
-        # Enviamos el mensaje al grupo del usuario dueño del documento
-        async_to_sync(channel_layer.group_send)(
-            f"user_{doc.usuario.id}",  # Nombre del grupo (mismo que en consumers.py)
-            {
-                "type": "doc.status",  # Esto busca el método 'doc_status' en el consumer
-                "data": {
-                    "doc_id": doc.id,
-                    "tags": doc.tags_ia,
-                    "texto_preview": doc.texto_detectado[:100] if doc.texto_detectado else "..."
-                }
-            }
-        )
-        return f"Documento {doc_id} procesado y notificado."
+
+def guardar_resultado(doc, texto_final, tags_finales):
+    """ Guarda el resultado de la IA en el documento (el embedding llega después, por lote) """
+    doc.tags_ia = tags_finales
+    doc.texto_detectado = texto_final
+    doc.texto_preview = texto_final[:LARGO_PREVIEW]
+    doc.embedding = None
+    doc.embedding_pendiente = True
+    doc.embedding_intentos = 0
+    doc.embedding_reintento = None
+    doc.textract_job_id = None
+    doc.estado = 'completado'
+    doc.save()
+    actualizar_vector_texto(doc.id)
+    crear_fragmentos(doc)
+    # Las respuestas del chat guardadas para este usuario ya no consideran este documento
+    invalidar_usuario(doc.usuario_id)
+
+
+# ==============================================================================
+# ETAPA 4: EMBEDDINGS POR MICRO-LOTES  -> cola 'embeddings'
+#
+#   Cada documento finalizado llama a programar_lote_embeddings(). La primera
+#   llamada toma una marca en Redis y agenda procesar_lote_embeddings con
+#   ESPERA_LOTE segundos de countdown; las demás ven la marca y no agendan nada.
+#   Así, una ingesta masiva genera pocos lotes grandes en vez de N tareas.
+#   La marca solo evita tareas de más: cada lote reclama sus filas con SKIP
+#   LOCKED (embeddings.reclamar_pendientes), y mientras quede algo pendiente
+#   agenda el siguiente, aunque sea para cuando venza un reintento.
+# ==============================================================================
+CLAVE_LOTE_EMBEDDINGS = 'gestion:lote_embeddings'
+# Despertador para cuando solo quedan documentos esperando su reintento: guarda
+# la hora agendada, así no se agendan varios ni se retiene la marca de arriba.
+CLAVE_REINTENTO_EMBEDDINGS = 'gestion:reintento_embeddings'
+
+
+def programar_lote_embeddings(espera=None):
+    config = settings.EMBEDDINGS
+    espera = config['ESPERA_LOTE'] if espera is None else espera
+    try:
+        # La marca expira sola por si el worker muere en medio del lote
+        programar = cache.add(CLAVE_LOTE_EMBEDDINGS, 1, timeout=espera + config['TIMEOUT_LOTE'])
+    except Exception as e:
+        print(f"Error Redis (lote embeddings): {e}")
+        programar = True
+    if programar:
+        procesar_lote_embeddings.apply_async(countdown=espera)
+
+
+def programar_reintento_embeddings(espera):
+    """ Agenda un lote para cuando venza el primer reintento, salvo que ya haya uno antes """
+    hora = time.time() + espera
+    try:
+        agendado = cache.get(CLAVE_REINTENTO_EMBEDDINGS)
+        if agendado is not None and time.time() < agendado <= hora:
+            return
+        cache.set(CLAVE_REINTENTO_EMBEDDINGS, hora, timeout=int(espera) + settings.EMBEDDINGS['TIMEOUT_LOTE'])
+    except Exception as e:
+        print(f"Error Redis (reintento embeddings): {e}")
+    procesar_lote_embeddings.apply_async(countdown=espera)
+
+
+@shared_task
+def procesar_lote_embeddings():
+    listos = tomados = 0
+    try:
+        listos, tomados, usuarios = embeber_pendientes()
+        for usuario_id, completos in usuarios.items():
+            # Con los vectores nuevos la búsqueda del chat puede encontrar otros fragmentos
+            invalidar_usuario(usuario_id)
+            notificar(usuario_id, [evento(doc, 'listo') for doc in completos])
+    finally:
+        # Se suelta la marca al final: lo que llegó durante el lote se ve en la consulta de abajo
+        cache.delete(CLAVE_LOTE_EMBEDDINGS)
+
+    # Mientras quede algo pendiente hay un lote agendado, aunque este no haya completado nada
+    espera = espera_siguiente_lote(tomados)
+    if espera is not None and espera <= settings.EMBEDDINGS['ESPERA_LOTE']:
+        programar_lote_embeddings(espera=espera)
+    elif espera is not None:
+        programar_reintento_embeddings(espera)
+    return f"{listos}/{tomados}"
+
+
+# ==============================================================================
+# PDF -> CAPA DE TEXTO LOCAL, O TEXTRACT ASÍNCRONO (máquina de estados, sin dormir en el worker)
+#
+#   etapa_extraer_pdf    --(PDF nativo)---> lee la capa de texto y sigue el pipeline
+#                        --(escaneado)----> inicia job, guarda JobId en Documento.textract_job_id
+#   revisar_textract_pdf --(IN_PROGRESS)--> se reprograma con countdown
+#                        --(SUCCEEDED)----> junta todas las páginas y sigue el pipeline
+#   Notificación SNS (opcional) -> vista textract_notificacion -> revisar_textract_pdf
+# ==============================================================================
+
+@shared_task
+def etapa_extraer_pdf(documento_id):
+    doc = Documento.objects.get(id=documento_id)
+    bucket_name, file_name, _ = _datos_archivo(doc)
+    avisar(doc, 'extrayendo')
+    try:
+        with ExtractorPdf(obtener_cliente('s3'), bucket_name, file_name) as extractor:
+            if extractor.es_local():
+                texto_final = extractor.extraer()
+                print(f"--> [IA] PDF con capa de texto: leído sin Textract")
+                continuar_pipeline(documento_id, {'texto': texto_final})
+                return "OK_LOCAL"
+
+        client_textract = obtener_cliente('textract')
+        job_id = iniciar_textract_pdf(client_textract, doc)
+        print(f"--> [IA] Job PDF iniciado: {job_id}")
+        return "PENDIENTE_TEXTRACT"
+    except Exception as e:
+        print(f"Error extrayendo texto: {e}")
+        continuar_pipeline(documento_id, {'texto': f"Error de lectura: {str(e)}"})
+        return "Error"
+
+
+def iniciar_textract_pdf(client_textract, doc):
+    parametros = {
+        'DocumentLocation': {'S3Object': {'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Name': doc.archivo.name}},
+        # JobTag = id del documento, así la notificación SNS sabe a quién pertenece
+        'JobTag': str(doc.id),
+    }
+    config = settings.TEXTRACT_PDF
+    if config['SNS_TOPIC_ARN'] and config['SNS_ROLE_ARN']:
+        parametros['NotificationChannel'] = {
+            'SNSTopicArn': config['SNS_TOPIC_ARN'],
+            'RoleArn': config['SNS_ROLE_ARN'],
+        }
+
+    start = client_textract.start_document_text_detection(**parametros)
+    job_id = start['JobId']
+
+    doc.textract_job_id = job_id
+    doc.save(update_fields=['textract_job_id'])
+
+    revisar_textract_pdf.apply_async((doc.id,), countdown=config['ESPERA_INICIAL'], link_error=al_fallar(doc.id))
+    return job_id
+
+
+def recolectar_lineas_textract(client_textract, job_id, primera_pagina):
+    """ Junta las líneas de TODAS las páginas de resultados (NextToken), hasta MAX_CARACTERES """
+    acumulador = AcumuladorTexto()
+    respuesta = primera_pagina
+    while True:
+        for item in respuesta.get('Blocks', []):
+            if item['BlockType'] == 'LINE' and not acumulador.agregar(item['Text']):
+                return acumulador.texto()  # tope alcanzado: no pedimos más páginas
+        token = respuesta.get('NextToken')
+        if not token:
+            return acumulador.texto()
+        respuesta = client_textract.get_document_text_detection(JobId=job_id, NextToken=token)
+
+
+@shared_task(bind=True, max_retries=None)
+def revisar_textract_pdf(self, documento_id):
+    """ Revisa UNA vez el job de Textract; si no terminó, se reprograma y suelta el worker """
+    doc = Documento.objects.filter(id=documento_id).first()
+    if not doc or not doc.textract_job_id:
+        return "SIN_JOB"  # Ya lo recolectó otra revisión (o la notificación SNS)
+
+    job_id = doc.textract_job_id
+    config = settings.TEXTRACT_PDF
+    client_textract = obtener_cliente('textract')
+
+    try:
+        status = client_textract.get_document_text_detection(JobId=job_id)
+    except Exception as e:
+        print(f"Error consultando Textract ({job_id}): {e}")
+        status = {'JobStatus': 'IN_PROGRESS'}  # error de red: reintentamos más tarde
+
+    if status['JobStatus'] == 'IN_PROGRESS':
+        if self.request.retries >= config['MAX_REVISIONES']:
+            Documento.objects.filter(id=documento_id, textract_job_id=job_id).update(
+                textract_job_id=None, estado='error'
+            )
+            print(f"--> [IA] Job PDF {job_id} excedió el tiempo máximo")
+            return "TIMEOUT"
+        # Backoff exponencial: 5s, 10s, 20s... hasta ESPERA_MAXIMA
+        espera = min(config['ESPERA_MAXIMA'], config['ESPERA_INICIAL'] * 2 ** self.request.retries)
+        raise self.retry(countdown=espera)
+
+    # Solo una revisión puede "reclamar" el job (la otra puede venir por SNS)
+    reclamado = Documento.objects.filter(id=documento_id, textract_job_id=job_id).update(textract_job_id=None)
+    if not reclamado:
+        return "SIN_JOB"
+
+    if status['JobStatus'] != 'SUCCEEDED':
+        print(f"--> [IA] Job PDF {job_id} terminó con estado {status['JobStatus']}")
+        texto_final = f"Error de lectura: Textract {status['JobStatus']}"
+    else:
+        try:
+            texto_final = recolectar_lineas_textract(client_textract, job_id, status)
+        except Exception as e:
+            print(f"Error recolectando resultados Textract: {e}")
+            texto_final = f"Error de lectura: {str(e)}"
+
+    continuar_pipeline(documento_id, {'texto': texto_final})
+    return "OK"
@@ -1,3 +1,1153 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import random
+import tempfile
+import zipfile
+from contextlib import ExitStack
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from celery.exceptions import Retry
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from pypdf import PdfWriter
+
+from . import progreso, urls_firmadas, views
+from .benchmark import comparar, uso_cache
+from .cache import CacheDosNiveles
+from .clientes_aws import clientes_falsos
+from .consumers import ChatConsumer
+from .deduplicacion import buscar_original, hash_archivo
+from .embeddings import BackendLocal, BackendTitan, ControlTasa, embeber_pendientes, generar_embeddings
+from .extraccion import AcumuladorTexto, ExtractorCsv, ExtractorXlsx, obtener_extractor
+from .fakes_aws import BedrockFalso, S3Falso, TextractFalso
+from .fragmentos import armar_contexto, crear_fragmentos, fragmentar
+from .management.commands.reprocesar import Checkpoint, Command as Reprocesar
+from .miniaturas import imagenes_para_ia
+from .models import Documento, DocumentoChunk
+from .paginacion import paginar_por_id, paginar_resultados
+from .recuperacion import fusionar_rrf
+from .subida_directa import SubidaInvalida, confirmar_subida, preparar_subida
+from .subida_masiva import CargaInvalida, _entradas, _validar, crear_lote
+from .tasks import al_fallar, iniciar_textract_pdf, revisar_textract_pdf
+
+
+def doc_falso(id, **atributos):
+    """ Documento mínimo para las funciones que solo miran atributos """
+    return SimpleNamespace(id=id, **atributos)
+
+
+BUCKET = settings.AWS_STORAGE_BUCKET_NAME
+
+# Embeddings sin red ni esperas: backend local y un control de tasa que no duerme
+SIN_ESPERA = dict(settings.EMBEDDINGS, BACKEND='local', TASA_INICIAL=10_000, TASA_MINIMA=1_000, TASA_MAXIMA=100_000)
+
+
+def zip_en_memoria(partes):
+    """ Un archivo de Office mínimo: {nombre_en_el_zip: xml} """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        for nombre, xml in partes.items():
+            z.writestr(nombre, xml)
+    return buffer.getvalue()
+
+
+def docx_en_memoria(parrafos):
+    """ Un .docx mínimo: solo word/document.xml con un <w:t> por párrafo """
+    cuerpo = ''.join(f'<w:p><w:r><w:t>{texto}</w:t></w:r></w:p>' for texto in parrafos)
+    return zip_en_memoria({'word/document.xml': (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{cuerpo}</w:body></w:document>'
+    )})
+
+
+class ConsultaFalsa:
+    """ Lo justo de un QuerySet para paginar_por_id: filter(id__lt), order_by('-id') y cortes """
+
+    def __init__(self, filas):
+        self.filas = list(filas)
+
+    def filter(self, id__lt):
+        return ConsultaFalsa(f for f in self.filas if f.id < id__lt)
+
+    def order_by(self, campo):
+        assert campo == '-id'
+        return ConsultaFalsa(sorted(self.filas, key=lambda f: -f.id))
+
+    def __getitem__(self, corte):
+        return self.filas[corte]
+
+
+class FusionRrfTests(SimpleTestCase):
+
+    def test_suma_puntajes_de_ambas_listas(self):
+        textuales = [doc_falso(1, rank=0.9), doc_falso(2, rank=0.5)]
+        vectoriales = [doc_falso(2, distancia=0.1), doc_falso(3, distancia=0.4)]
+
+        fusionados = fusionar_rrf([textuales, vectoriales], [1.0, 1.0], 60)
+
+        puntajes = {doc.id: puntaje for doc, puntaje in fusionados}
+        self.assertAlmostEqual(puntajes[1], 1 / 61)
+        self.assertAlmostEqual(puntajes[2], 1 / 62 + 1 / 61)
+        self.assertAlmostEqual(puntajes[3], 1 / 62)
+        self.assertEqual([doc.id for doc, _ in fusionados], [2, 1, 3])
+
+    def test_documento_repetido_conserva_rank_y_distancia(self):
+        fusionados = fusionar_rrf(
+            [[doc_falso(7, rank=0.3)], [doc_falso(7, distancia=0.2)]], [1.0, 1.0], 60
+        )
+
+        self.assertEqual(len(fusionados), 1)
+        doc, _ = fusionados[0]
+        self.assertEqual(doc.rank, 0.3)
+        self.assertEqual(doc.distancia, 0.2)
+
+    def test_pesos_cambian_el_orden(self):
+        fusionados = fusionar_rrf([[doc_falso(1)], [doc_falso(2)]], [0.5, 2.0], 60)
+
+        self.assertEqual([doc.id for doc, _ in fusionados], [2, 1])
+
+    def test_empate_desempata_por_id_descendente(self):
+        fusionados = fusionar_rrf([[doc_falso(1)], [doc_falso(2)]], [1.0, 1.0], 60)
+
+        self.assertEqual([doc.id for doc, _ in fusionados], [2, 1])
+
+    def test_listas_vacias(self):
+        self.assertEqual(fusionar_rrf([[], []], [1.0, 1.0], 60), [])
+
+
+class PaginacionPorIdTests(SimpleTestCase):
+
+    def setUp(self):
+        self.consulta = ConsultaFalsa(doc_falso(i) for i in range(1, 8))
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        vistos, cursor = [], None
+        for _ in range(10):
+            filas, cursor = paginar_por_id(self.consulta, cursor, 3)
+            vistos += [f.id for f in filas]
+            if cursor is None:
+                break
+
+        self.assertEqual(vistos, [7, 6, 5, 4, 3, 2, 1])
+
+    def test_ultima_pagina_exacta_no_tiene_siguiente(self):
+        filas, cursor = paginar_por_id(ConsultaFalsa(doc_falso(i) for i in (1, 2, 3)), None, 3)
+
+        self.assertEqual([f.id for f in filas], [3, 2, 1])
+        self.assertIsNone(cursor)
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        filas, cursor = paginar_por_id(self.consulta, 'abc', 3)
+
+        self.assertEqual([f.id for f in filas], [7, 6, 5])
+        self.assertEqual(cursor, '5')
+
+
+@override_settings(RECUPERACION=dict(settings.RECUPERACION, MAX_RESULTADOS=6))
+class PaginacionResultadosTests(SimpleTestCase):
+
+    def setUp(self):
+        # Orden de relevancia: puntaje desc y, en empate, id desc
+        self.resultados = [
+            doc_falso(9, puntaje=0.9), doc_falso(8, puntaje=0.5), doc_falso(4, puntaje=0.5),
+            doc_falso(7, puntaje=0.3), doc_falso(2, puntaje=0.2), doc_falso(1, puntaje=0.1),
+        ]
+        self.pedidos = []
+
+    def buscar(self, k):
+        self.pedidos.append(k)
+        return self.resultados[:k]
+
+    def test_recorre_las_paginas_con_empates(self):
+        vistos, cursor = [], None
+        while True:
+            pagina, cursor = paginar_resultados(self.buscar, cursor, 2)
+            vistos += [r.id for r in pagina]
+            if cursor is None:
+                break
+
+        self.assertEqual(vistos, [9, 8, 4, 7, 2, 1])
+
+    def test_siempre_pide_el_mismo_tope_de_candidatos(self):
+        _, cursor = paginar_resultados(self.buscar, None, 2)
+        paginar_resultados(self.buscar, cursor, 2)
+        paginar_resultados(self.buscar, '0.0001:1', 2)
+
+        self.assertEqual(self.pedidos, [6, 6, 6])
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        pagina, cursor = paginar_resultados(self.buscar, 'basura', 2)
+
+        self.assertEqual([r.id for r in pagina], [9, 8])
+        self.assertEqual(cursor, '0.5:8')
+
+
+# ==============================================================================
+# PDF -> TEXTRACT ASÍNCRONO (sin dormir en el worker)
+# ==============================================================================
+class TextractPdfTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('ana', password='clave')
+        self.doc = Documento.objects.create(usuario=usuario, titulo='escaneado.pdf',
+                                            archivo='documentos_perfumeria/escaneado.pdf', estado='procesando')
+        self.continuar = mock.patch('gestion.tasks.continuar_pipeline').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _iniciar(self, textract):
+        with mock.patch.object(revisar_textract_pdf, 'apply_async') as revisar:
+            job_id = iniciar_textract_pdf(textract, self.doc)
+        revisar.assert_called_once()
+        return job_id
+
+    def _revisar(self, textract):
+        with clientes_falsos(textract=textract):
+            return revisar_textract_pdf(self.doc.id)
+
+    def test_inicia_job_y_guarda_su_id(self):
+        textract = TextractFalso()
+        job_id = self._iniciar(textract)
+
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.textract_job_id, job_id)
+        parametros = textract.jobs[job_id]['parametros']
+        self.assertEqual(parametros['JobTag'], str(self.doc.id))
+        self.assertEqual(parametros['DocumentLocation']['S3Object']['Name'], self.doc.archivo.name)
+
+    def test_en_curso_se_reprograma_y_luego_junta_todas_las_paginas(self):
+        textract = TextractFalso(revisiones_en_curso=1, lineas_por_pagina=2)
+        self._iniciar(textract)
+        with self.assertRaises(Retry):
+            self._revisar(textract)
+        self.continuar.assert_not_called()
+
+        self.assertEqual(self._revisar(textract), "OK")
+
+        texto = self.continuar.call_args.args[1]['texto']
+        self.assertEqual(texto.split('\n'), textract.lineas)
+        # Estado + página siguiente (NextToken), después de la revisión en curso
+        self.assertEqual(textract.contar('get_document_text_detection'), 3)
+        self.doc.refresh_from_db()
+        self.assertIsNone(self.doc.textract_job_id)
+
+    def test_una_sola_revision_reclama_el_job(self):
+        textract = TextractFalso(revisiones_en_curso=0)
+        self._iniciar(textract)
+        self.assertEqual(self._revisar(textract), "OK")
+        # La notificación SNS llega después: ya no hay job que recolectar
+        self.assertEqual(self._revisar(textract), "SIN_JOB")
+        self.continuar.assert_called_once()
+
+    def test_job_fallido_sigue_con_error_de_lectura(self):
+        textract = TextractFalso(revisiones_en_curso=0, estado_final='FAILED')
+        self._iniciar(textract)
+        self._revisar(textract)
+
+        self.continuar.assert_called_once_with(self.doc.id, {'texto': "Error de lectura: Textract FAILED"})
+
+
+# ==============================================================================
+# PIPELINE: una etapa que revienta no deja el documento en 'procesando'
+# ==============================================================================
+class PipelineFallidoTests(TestCase):
+
+    def test_errback_marca_el_documento_con_error(self):
+        usuario = User.objects.create_user('ana', password='clave')
+        doc = Documento.objects.create(usuario=usuario, titulo='a.txt', archivo='a.txt', estado='procesando')
+
+        errback = al_fallar(doc.id)
+        errback.apply(args=(None, RuntimeError('worker caído'), None))
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.estado, 'error')
+
+
+# ==============================================================================
+# EXTRACCIÓN (registro de extractores, bloques desde S3, tope de caracteres)
+# ==============================================================================
+NS_EXCEL = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_DRAWING = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+
+@override_settings(EXTRACCION=dict(settings.EXTRACCION, TAMANO_BLOQUE=3))
+class ExtraccionTests(SimpleTestCase):
+
+    def _extraer(self, nombre, datos):
+        s3 = S3Falso({(BUCKET, nombre): datos})
+        with obtener_extractor(s3, BUCKET, nombre) as extractor:
+            self.assertTrue(extractor.es_local())
+            return extractor.extraer()
+
+    def test_txt_no_rompe_caracteres_partidos_entre_bloques(self):
+        # 'ñ' y '€' ocupan 2 y 3 bytes: con bloques de 3 bytes quedan cortados
+        texto = "año € niño\nsegunda línea"
+
+        self.assertEqual(self._extraer('a.txt', texto.encode('utf-8')), texto)
+
+    def test_txt_se_corta_en_el_tope(self):
+        with override_settings(EXTRACCION=dict(settings.EXTRACCION, TAMANO_BLOQUE=3, MAX_CARACTERES=10)):
+            self.assertEqual(self._extraer('a.txt', b'x' * 100), 'x' * 10)
+
+    def test_txt_invalido_se_reemplaza(self):
+        self.assertEqual(self._extraer('a.txt', b'ok \xff fin'), 'ok \ufffd fin')
+
+    def test_docx_lee_todos_los_parrafos(self):
+        datos = docx_en_memoria(['Hola', 'Perfume 50ml', 'Chao'])
+
+        self.assertEqual(self._extraer('a.docx', datos), 'Hola\nPerfume 50ml\nChao')
+
+    def test_docx_respeta_el_tope(self):
+        datos = docx_en_memoria(['abcdef', 'ghijkl', 'mnopqr'])
+        with override_settings(EXTRACCION=dict(settings.EXTRACCION, MAX_CARACTERES=10)):
+            self.assertEqual(self._extraer('a.docx', datos), 'abcdef\nghi')
+
+    def test_csv_detecta_el_separador(self):
+        datos = "sku;nombre;precio\n001;Perfume Floral;19990\n002;;4990\n".encode('utf-8')
+
+        self.assertEqual(
+            self._extraer('lista.csv', datos),
+            "sku\tnombre\tprecio\n001\tPerfume Floral\t19990\n002\t4990",
+        )
+
+    def test_xlsx_resuelve_textos_compartidos_y_en_linea(self):
+        compartidos = (
+            f'<sst xmlns="{NS_EXCEL}">'
+            '<si><t>Producto</t></si>'
+            '<si><r><t>Perfume </t></r><r><t>Floral</t></r></si>'
+            '</sst>'
+        )
+        hoja = (
+            f'<worksheet xmlns="{NS_EXCEL}"><sheetData>'
+            '<row><c t="s"><v>0</v></c><c t="inlineStr"><is><t>Precio</t></is></c></row>'
+            '<row><c t="s"><v>1</v></c><c><v>19990</v></c></row>'
+            '</sheetData></worksheet>'
+        )
+        datos = zip_en_memoria({'xl/sharedStrings.xml': compartidos, 'xl/worksheets/sheet1.xml': hoja})
+
+        self.assertEqual(self._extraer('a.xlsx', datos), "Producto\tPrecio\nPerfume Floral\t19990")
+
+    def test_pptx_respeta_el_orden_numerico_de_diapositivas(self):
+        def diapositiva(texto):
+            return f'<p:sld xmlns:p="p" xmlns:a="{NS_DRAWING}"><a:t>{texto}</a:t></p:sld>'
+
+        datos = zip_en_memoria({
+            'ppt/slides/slide10.xml': diapositiva('diez'),
+            'ppt/slides/slide2.xml': diapositiva('dos'),
+            'ppt/slides/slide1.xml': diapositiva('uno'),
+        })
+
+        self.assertEqual(self._extraer('a.pptx', datos), 'uno\ndos\ndiez')
+
+    def test_registro_por_extension_y_por_mime(self):
+        s3 = S3Falso()
+
+        self.assertIsInstance(obtener_extractor(s3, BUCKET, 'Ventas.XLSX'), ExtractorXlsx)
+        self.assertIsInstance(obtener_extractor(s3, BUCKET, 'sin_extension', 'text/csv'), ExtractorCsv)
+        self.assertIsNone(obtener_extractor(s3, BUCKET, 'programa.exe'))
+
+    def test_pdf_sin_capa_de_texto_va_a_textract(self):
+        escritor = PdfWriter()
+        escritor.add_blank_page(width=200, height=200)
+        buffer = io.BytesIO()
+        escritor.write(buffer)
+        s3 = S3Falso({(BUCKET, 'escaneado.pdf'): buffer.getvalue()})
+
+        with obtener_extractor(s3, BUCKET, 'escaneado.pdf') as extractor:
+            self.assertFalse(extractor.es_local())
+
+    def test_acumulador_marca_truncado(self):
+        acumulador = AcumuladorTexto(limite=5, separador='')
+
+        self.assertTrue(acumulador.agregar('abc'))
+        self.assertFalse(acumulador.agregar('defg'))
+        self.assertEqual(acumulador.texto(), 'abcde')
+        self.assertTrue(acumulador.truncado)
+
+
+# ==============================================================================
+# DEDUPLICACIÓN POR CONTENIDO
+# ==============================================================================
+class HashSubidaHandlerTests(SimpleTestCase):
+
+    def test_calcula_el_hash_mientras_llega_el_archivo(self):
+        contenido = b'lista de precios\n' * 10_000
+        request = RequestFactory().post('/subir/', {
+            'archivo': SimpleUploadedFile('precios.txt', contenido),
+        })
+
+        request.FILES  # parsea el multipart con settings.FILE_UPLOAD_HANDLERS
+
+        self.assertEqual(request.hashes_subida['archivo'], hashlib.sha256(contenido).hexdigest())
+        self.assertEqual(hash_archivo(request, 'archivo'), hashlib.sha256(contenido).hexdigest())
+        self.assertEqual(request.FILES['archivo'].read(), contenido)  # el archivo llega intacto
+
+    def test_sin_handler_lo_calcula_desde_el_archivo(self):
+        request = RequestFactory().post('/subir/')
+        request._files = {'archivo': SimpleUploadedFile('a.txt', b'hola')}
+
+        self.assertEqual(hash_archivo(request, 'archivo'), hashlib.sha256(b'hola').hexdigest())
+
+
+class BuscarOriginalTests(TestCase):
+
+    HASH = 'a' * 64
+
+    def setUp(self):
+        self.ana = User.objects.create_user('ana', password='clave')
+        self.beto = User.objects.create_user('beto', password='clave')
+
+    def _documento(self, usuario, **campos):
+        datos = dict(titulo='precios.pdf', archivo='documentos_perfumeria/precios.pdf',
+                     hash_contenido=self.HASH, estado='completado', texto_detectado='Precio: 100',
+                     embedding=[0.1] * 1536)
+        datos.update(campos)
+        return Documento.objects.create(usuario=usuario, **datos)
+
+    def test_encuentra_el_primer_original_del_mismo_usuario(self):
+        original = self._documento(self.ana)
+        duplicado = self._documento(self.ana)
+        duplicado.duplicado_de = original
+        duplicado.save()
+
+        self.assertEqual(buscar_original(self.ana, self.HASH), original)
+
+    def test_nunca_usa_documentos_de_otro_usuario(self):
+        self._documento(self.beto)
+
+        self.assertIsNone(buscar_original(self.ana, self.HASH))
+
+    def test_ignora_originales_sin_embedding_sin_terminar_o_con_error(self):
+        self._documento(self.ana, embedding=None)
+        self._documento(self.ana, estado='procesando')
+        self._documento(self.ana, texto_detectado='Error de lectura: Textract FAILED')
+
+        self.assertIsNone(buscar_original(self.ana, self.HASH))
+        self.assertIsNone(buscar_original(self.ana, None))
+
+
+# ==============================================================================
+# EMBEDDINGS: control de tasa y micro-lotes con Bedrock simulado
+# ==============================================================================
+class ControlTasaTests(SimpleTestCase):
+
+    def test_sube_de_a_poco_y_baja_a_la_mitad(self):
+        control = ControlTasa(dict(settings.EMBEDDINGS, TASA_INICIAL=4.0, INCREMENTO_TASA=0.5, FACTOR_BAJA=0.5,
+                                   TASA_MINIMA=1.0, TASA_MAXIMA=5.0))
+        control.exito()
+        self.assertEqual(control.tasa, 4.5)
+        control.limitado()
+        self.assertEqual(control.tasa, 2.25)
+        for _ in range(5):
+            control.limitado()
+        self.assertEqual(control.tasa, 1.0)
+        for _ in range(20):
+            control.exito()
+        self.assertEqual(control.tasa, 5.0)
+        self.assertEqual(control.limitaciones, 6)
+
+    def test_throttling_se_reintenta_y_baja_la_tasa(self):
+        bedrock = BedrockFalso(dimensiones=8, limitar_cada=3)
+        control = ControlTasa(SIN_ESPERA)
+        with clientes_falsos(bedrock_runtime=bedrock):
+            vectores = generar_embeddings(['uno', 'dos', 'tres', 'uno'], BackendTitan(), control=control)
+
+        self.assertTrue(all(len(vector) == 8 for vector in vectores))
+        self.assertEqual(vectores[0], vectores[3])
+        self.assertEqual(len({tuple(vector) for vector in vectores}), 3)
+        # Textos repetidos se piden una vez; cada tercera llamada se limitó y se repitió
+        self.assertEqual(bedrock.contar('invoke_model'), 4)
+        self.assertEqual(control.limitaciones, 1)
+        self.assertLess(control.tasa, SIN_ESPERA['TASA_INICIAL'] + 3 * SIN_ESPERA['INCREMENTO_TASA'])
+
+    def test_limitado_siempre_se_descarta_tras_los_reintentos(self):
+        bedrock = BedrockFalso(dimensiones=8, limitar_cada=1)
+        with clientes_falsos(bedrock_runtime=bedrock):
+            vectores = generar_embeddings(['uno'], BackendTitan(), control=ControlTasa(SIN_ESPERA))
+
+        self.assertEqual(vectores, [None])
+        self.assertEqual(bedrock.contar('invoke_model'), settings.EMBEDDINGS['REINTENTOS'] + 1)
+
+    def test_backend_local_es_determinista_y_normalizado(self):
+        with override_settings(EMBEDDINGS=dict(SIN_ESPERA, DIMENSIONES=16)):
+            backend = BackendLocal()
+            vector = backend.embeber('Perfume floral')
+
+        self.assertEqual(vector, backend.embeber('Perfume floral'))
+        self.assertNotEqual(vector, backend.embeber('Perfume cítrico'))
+        self.assertAlmostEqual(sum(x * x for x in vector), 1.0)
+
+
+def resumen_lote(resultado):
+    """ (listos, tomados, {usuario_id: [ids completos]}) para comparar sin instancias """
+    listos, tomados, usuarios = resultado
+    return listos, tomados, {usuario_id: [doc.id for doc in docs] for usuario_id, docs in usuarios.items()}
+
+
+@override_settings(EMBEDDINGS=SIN_ESPERA)
+class MicroLoteEmbeddingsTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('ana', password='clave')
+        self.doc = Documento.objects.create(usuario=usuario, titulo='factura.pdf', archivo='documentos_perfumeria/f.pdf',
+                                            estado='completado', texto_detectado='Total a pagar', tags_ia=['factura'])
+        Documento.objects.filter(id=self.doc.id).update(embedding_pendiente=True)
+        # Cada prueba con su propio control de tasa (el del proceso recuerda throttlings)
+        mock.patch('gestion.embeddings.control_tasa', side_effect=lambda: ControlTasa(SIN_ESPERA)).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_lote_completo_deja_el_documento_listo(self):
+        with clientes_falsos(bedrock_runtime=BedrockFalso()):
+            self.assertEqual(resumen_lote(embeber_pendientes(backend=BackendTitan())), (1, 1, {self.doc.usuario_id: [self.doc.id]}))
+
+        self.doc.refresh_from_db()
+        self.assertFalse(self.doc.embedding_pendiente)
+        self.assertEqual(len(self.doc.embedding), settings.EMBEDDINGS['DIMENSIONES'])
+        self.assertEqual(self.doc.embedding_intentos, 0)
+
+    def test_sin_backend_usa_el_de_settings(self):
+        self.assertEqual(resumen_lote(embeber_pendientes()), (1, 1, {self.doc.usuario_id: [self.doc.id]}))
+
+        self.doc.refresh_from_db()
+        esperado = BackendLocal().embeber('factura.pdf\nfactura\nTotal a pagar')
+        self.assertLess(max(abs(a - b) for a, b in zip(self.doc.embedding, esperado)), 1e-6)
+
+    def test_fallo_cuenta_el_intento_y_espera_antes_de_reintentar(self):
+        with clientes_falsos(bedrock_runtime=BedrockFalso(limitar_cada=1)):
+            self.assertEqual(embeber_pendientes(backend=BackendTitan()), (0, 1, {}))
+            # En espera de su reintento: el lote siguiente no lo toma
+            self.assertEqual(embeber_pendientes(backend=BackendTitan()), (0, 0, {}))
+
+        self.doc.refresh_from_db()
+        self.assertTrue(self.doc.embedding_pendiente)
+        self.assertEqual(self.doc.embedding_intentos, 1)
+        self.assertGreater(self.doc.embedding_reintento, timezone.now())
+
+    def test_tras_max_intentos_sale_de_la_cola(self):
+        Documento.objects.filter(id=self.doc.id).update(embedding_intentos=settings.EMBEDDINGS['MAX_INTENTOS'] - 1)
+        with clientes_falsos(bedrock_runtime=BedrockFalso(limitar_cada=1)):
+            embeber_pendientes(backend=BackendTitan())
+
+        self.doc.refresh_from_db()
+        self.assertFalse(self.doc.embedding_pendiente)
+        self.assertIsNone(self.doc.embedding)
+
+
+# ==============================================================================
+# FRAGMENTOS PARA EL CHAT RAG
+# ==============================================================================
+def fragmento_falso(documento, inicio, fin, texto_completo):
+    return SimpleNamespace(documento_id=documento.id, documento=documento,
+                           inicio=inicio, fin=fin, texto=texto_completo[inicio:fin])
+
+
+class FragmentarTests(SimpleTestCase):
+
+    def test_cubre_todo_el_texto_con_solapamiento(self):
+        texto = ' '.join(f'palabra{i}' for i in range(300))
+        rangos = fragmentar(texto, tamano=200, solapamiento=40, maximo=100)
+
+        self.assertEqual(rangos[0][0], 0)
+        self.assertEqual(rangos[-1][1], len(texto))
+        for (_, fin), (inicio, _) in zip(rangos, rangos[1:]):
+            self.assertLess(inicio, fin)               # se solapan
+            self.assertGreaterEqual(inicio, fin - 40)  # ...no más de SOLAPAMIENTO
+            self.assertEqual(texto[inicio - 1], ' ')   # y el siguiente parte en una palabra
+
+    def test_prefiere_cortar_en_parrafos(self):
+        texto = 'a' * 120 + '\n\n' + 'b' * 120
+        rangos = fragmentar(texto, tamano=200, solapamiento=0, maximo=10)
+
+        self.assertEqual(texto[rangos[0][0]:rangos[0][1]], 'a' * 120 + '\n\n')
+
+    def test_respeta_el_maximo_y_salta_lo_vacio(self):
+        self.assertEqual(len(fragmentar('x ' * 1000, tamano=100, solapamiento=0, maximo=3)), 3)
+        self.assertEqual(fragmentar('   ', tamano=100, solapamiento=0, maximo=3), [])
+
+
+class ArmarContextoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.texto = ''.join(f'[{i:02d}]' for i in range(40))  # 160 caracteres, 4 por marca
+        self.doc = SimpleNamespace(id=1, titulo='contrato.pdf')
+
+    def _fragmento(self, inicio, fin):
+        return fragmento_falso(self.doc, inicio, fin, self.texto)
+
+    def test_no_repite_lo_solapado_y_respeta_el_orden_del_texto(self):
+        contexto, usados = armar_contexto([self._fragmento(40, 80), self._fragmento(20, 60)], presupuesto_tokens=1000)
+
+        self.assertEqual(usados, [self.doc])
+        self.assertEqual(contexto, "\n- DOC 'contrato.pdf':\n" + self.texto[20:40] + "\n" + self.texto[40:80])
+
+    def test_fragmento_posterior_que_contiene_a_uno_elegido_no_lo_duplica(self):
+        contexto, _ = armar_contexto([self._fragmento(40, 60), self._fragmento(0, 120)], presupuesto_tokens=1000)
+
+        self.assertEqual(contexto.count(self.texto[40:60]), 1)
+        for marca in ('[00]', '[14]', '[15]', '[29]'):
+            self.assertEqual(contexto.count(marca), 1)
+
+    def test_salto_entre_piezas_se_marca(self):
+        contexto, _ = armar_contexto([self._fragmento(0, 20), self._fragmento(100, 120)], presupuesto_tokens=1000)
+
+        self.assertIn(self.texto[0:20] + '\n[...]\n' + self.texto[100:120], contexto)
+
+    def test_presupuesto_de_tokens(self):
+        # 40 caracteres = 10 tokens; el segundo no cabe, el tercero (más corto) sí
+        fragmentos = [self._fragmento(0, 40), self._fragmento(80, 120), self._fragmento(140, 148)]
+        contexto, _ = armar_contexto(fragmentos, presupuesto_tokens=12)
+
+        self.assertIn(self.texto[0:40], contexto)
+        self.assertNotIn(self.texto[80:120], contexto)
+        self.assertIn(self.texto[140:148], contexto)
+
+
+@override_settings(EMBEDDINGS=SIN_ESPERA)
+class FragmentosEmbeddingTests(TestCase):
+
+    def test_documento_con_vector_solo_pide_los_fragmentos(self):
+        usuario = User.objects.create_user('ana', password='clave')
+        doc = Documento.objects.create(usuario=usuario, titulo='contrato.pdf', archivo='documentos_perfumeria/c.pdf',
+                                       estado='completado', texto_detectado='Cláusula primera. ' * 200,
+                                       embedding=[0.5] * 1536)
+        total = crear_fragmentos(doc)
+        Documento.objects.filter(id=doc.id).update(embedding_pendiente=True)
+
+        with mock.patch('gestion.embeddings.generar_embeddings', wraps=generar_embeddings) as generar:
+            self.assertEqual(resumen_lote(embeber_pendientes()), (1, 1, {usuario.id: [doc.id]}))
+
+        self.assertEqual(len(generar.call_args.args[0]), total)
+        doc.refresh_from_db()
+        self.assertFalse(doc.embedding_pendiente)
+        self.assertEqual(list(doc.embedding[:3]), [0.5] * 3)
+        self.assertFalse(DocumentoChunk.objects.filter(documento=doc, embedding__isnull=True).exists())
+
+
+# ==============================================================================
+# CHAT POR WEBSOCKET
+# ==============================================================================
+EN_MEMORIA = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=EN_MEMORIA)
+class ChatConsumerTests(SimpleTestCase):
+
+    def _conectar(self, usuario):
+        async def conectar():
+            comunicador = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+            comunicador.scope['user'] = usuario
+            with mock.patch('channels.layers.InMemoryChannelLayer.group_add') as group_add:
+                conectado, _ = await comunicador.connect()
+                await comunicador.disconnect()
+            return conectado, group_add.called
+        return async_to_sync(conectar)()
+
+    def test_anonimo_se_rechaza_sin_unirse_a_ningun_grupo(self):
+        self.assertEqual(self._conectar(AnonymousUser()), (False, False))
+
+    def test_usuario_logueado_entra_a_su_grupo(self):
+        usuario = SimpleNamespace(id=7, is_authenticated=True)
+        self.assertEqual(self._conectar(usuario), (True, True))
+
+
+# ==============================================================================
+# MÉTRICAS DE CACHÉ DEL CHAT
+# ==============================================================================
+class MetricasChatTests(SimpleTestCase):
+
+    def _pedir(self, es_staff):
+        request = RequestFactory().get('/api/chat/metricas/')
+        request.user = SimpleNamespace(is_authenticated=True, is_staff=es_staff)
+        with mock.patch('gestion.cache_respuestas.metricas', return_value={'aciertos': 3, 'fallos': 1}):
+            return views.metricas_chat(request)
+
+    def test_incluye_la_cache_de_embeddings_de_consultas(self):
+        estadisticas = {'hits_local': 5, 'hits_redis': 1, 'misses': 2, 'tasa_acierto': 0.75}
+        with mock.patch.object(views.cache_consultas, 'estadisticas', return_value=estadisticas):
+            respuesta = self._pedir(es_staff=True)
+
+        self.assertEqual(json.loads(respuesta.content),
+                         {'aciertos': 3, 'fallos': 1, 'embeddings_consultas': estadisticas})
+
+    def test_solo_staff(self):
+        self.assertEqual(self._pedir(es_staff=False).status_code, 403)
+
+
+# ==============================================================================
+# SUBIDA DIRECTA (preparar -> el navegador sube a S3 -> confirmar)
+# ==============================================================================
+@override_settings(SUBIDA_DIRECTA=dict(settings.SUBIDA_DIRECTA, UMBRAL_MULTIPART=10, TAMANO_PARTE=6))
+class SubidaDirectaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='clave')
+        self.s3 = S3Falso()
+        falsos = clientes_falsos(s3=self.s3)
+        falsos.__enter__()
+        self.addCleanup(falsos.__exit__, None, None, None)
+        # Sin Celery: solo se revisa que se encole
+        self.procesar = mock.patch('gestion.subida_directa.procesar_archivo_ia').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _subir_post(self, datos, declarado=None):
+        respuesta = preparar_subida(self.usuario, 'C:\\fakepath\\factura.pdf', declarado or len(datos))
+        self.assertEqual(respuesta['modo'], 'post')
+        self.s3.subir_post(respuesta['url'], respuesta['campos'], datos)
+        return respuesta
+
+    def test_post_confirmado_crea_documento_y_encola(self):
+        respuesta = self._subir_post(b'0123456789')
+        with self.captureOnCommitCallbacks(execute=True):
+            documento = confirmar_subida(self.usuario, respuesta['ticket'])
+
+        self.assertEqual(documento.titulo, 'factura.pdf')
+        self.assertEqual(documento.estado, 'pendiente')
+        self.assertTrue(documento.archivo.name.startswith(settings.SUBIDA_DIRECTA['PREFIJO']))
+        self.procesar.delay.assert_called_once_with(documento.id)
+
+    def test_confirmacion_repetida_devuelve_el_mismo_documento(self):
+        respuesta = self._subir_post(b'0123456789')
+        primero = confirmar_subida(self.usuario, respuesta['ticket'])
+        segundo = confirmar_subida(self.usuario, respuesta['ticket'])
+
+        self.assertEqual(primero.id, segundo.id)
+        self.assertEqual(Documento.objects.count(), 1)
+        self.assertEqual(self.s3.contar('head_object'), 1)
+
+    def test_tamano_distinto_se_rechaza_y_se_borra(self):
+        respuesta = self._subir_post(b'01234', declarado=8)
+
+        with self.assertRaisesMessage(SubidaInvalida, "tamaño declarado"):
+            confirmar_subida(self.usuario, respuesta['ticket'])
+        self.assertFalse(Documento.objects.exists())
+        self.assertEqual(self.s3.objetos, {})
+
+    def test_archivo_que_no_llego_a_s3(self):
+        respuesta = preparar_subida(self.usuario, 'factura.pdf', 8)
+
+        with self.assertRaisesMessage(SubidaInvalida, "no llegó"):
+            confirmar_subida(self.usuario, respuesta['ticket'])
+
+    def test_ticket_de_otro_usuario(self):
+        respuesta = self._subir_post(b'0123456789')
+        otro = User.objects.create_user('beto', password='clave')
+
+        with self.assertRaisesMessage(SubidaInvalida, "otro usuario"):
+            confirmar_subida(otro, respuesta['ticket'])
+
+    def _subir_partes(self, datos):
+        respuesta = preparar_subida(self.usuario, 'catalogo.pdf', len(datos))
+        self.assertEqual(respuesta['modo'], 'multipart')
+        upload_id, = self.s3.multipart
+        key = self.s3.multipart[upload_id]['key']
+        tamano = respuesta['tamano_parte']
+        partes = [
+            {'numero': parte['numero'],
+             'etag': self.s3.upload_part(Bucket=BUCKET, Key=key, UploadId=upload_id, PartNumber=parte['numero'],
+                                         Body=datos[(parte['numero'] - 1) * tamano:parte['numero'] * tamano])['ETag']}
+            for parte in respuesta['partes']
+        ]
+        return respuesta, key, partes
+
+    def test_multipart_confirmado_junta_las_partes(self):
+        datos = b'abcdefghijklmnopq'
+        respuesta, key, partes = self._subir_partes(datos)
+        self.assertEqual(len(partes), 3)
+
+        documento = confirmar_subida(self.usuario, respuesta['ticket'], partes=list(reversed(partes)))
+        self.assertEqual(documento.archivo.name, key)
+        self.assertEqual(self.s3.objetos[(BUCKET, key)], datos)
+
+    def test_multipart_fallido_se_aborta(self):
+        respuesta, key, partes = self._subir_partes(b'abcdefghijklmnopq')
+        partes[0]['etag'] = '"otro"'
+
+        with self.assertRaisesMessage(SubidaInvalida, "por partes"):
+            confirmar_subida(self.usuario, respuesta['ticket'], partes=partes)
+        self.assertEqual(self.s3.contar('abort_multipart_upload'), 1)
+        self.assertEqual(self.s3.multipart, {})
+        self.assertFalse(Documento.objects.exists())
+
+
+# ==============================================================================
+# CARGA MASIVA (varios archivos o un ZIP)
+# ==============================================================================
+LIMITES_CHICOS = dict(settings.SUBIDA_MASIVA, MAX_ARCHIVOS=3, MAX_TAMANO_ARCHIVO=1000, MAX_TAMANO_TOTAL=1500)
+
+
+def zip_subido(nombre, miembros):
+    return SimpleUploadedFile(nombre, zip_en_memoria(miembros), content_type='application/zip')
+
+
+@override_settings(SUBIDA_MASIVA=LIMITES_CHICOS)
+class LimitesCargaMasivaTests(SimpleTestCase):
+
+    def _validar(self, archivos):
+        with ExitStack() as pila:
+            entradas = _entradas(archivos, pila)
+            _validar(entradas)
+            return [(nombre, tamano) for nombre, tamano, _ in entradas]
+
+    def test_zip_se_expande_e_ignora_carpetas_y_basura(self):
+        archivos = [
+            zip_subido('catalogo.zip', {'fichas/a.txt': 'hola', '__MACOSX/fichas/._a.txt': 'x', '.DS_Store': 'x'}),
+            SimpleUploadedFile('b.txt', b'chau'),
+        ]
+        self.assertEqual(self._validar(archivos), [('a.txt', 4), ('b.txt', 4)])
+
+    def test_cuenta_los_archivos_de_dentro_del_zip(self):
+        archivos = [zip_subido('catalogo.zip', {f'{i}.txt': 'x' for i in range(4)})]
+        with self.assertRaisesMessage(CargaInvalida, "Máximo 3 archivos"):
+            self._validar(archivos)
+
+    def test_miembro_que_descomprimido_supera_el_maximo(self):
+        # 2000 ceros se comprimen a unos pocos bytes: cuenta el tamaño declarado
+        archivos = [zip_subido('bomba.zip', {'ceros.txt': '0' * 2000})]
+        with self.assertRaisesMessage(CargaInvalida, "demasiado grande: ceros.txt"):
+            self._validar(archivos)
+
+    def test_total_descomprimido(self):
+        archivos = [zip_subido('catalogo.zip', {'a.txt': '0' * 800, 'b.txt': '0' * 800})]
+        with self.assertRaisesMessage(CargaInvalida, "tamaño máximo"):
+            self._validar(archivos)
+
+    def test_zip_con_contrasena_o_danado(self):
+        # zipfile no escribe ZIP cifrados: se prende el bit en el directorio central
+        datos = bytearray(zip_en_memoria({'secreto.txt': 'x'}))
+        datos[datos.index(b'PK\x01\x02') + 8] |= 0x1
+        with self.assertRaisesMessage(CargaInvalida, "contraseña"):
+            self._validar([SimpleUploadedFile('secreto.zip', bytes(datos))])
+        with self.assertRaisesMessage(CargaInvalida, "dañado"):
+            self._validar([SimpleUploadedFile('roto.zip', b'no soy un zip')])
+
+    def test_lote_vacio(self):
+        with self.assertRaisesMessage(CargaInvalida, "ningún archivo"):
+            self._validar([zip_subido('vacio.zip', {'carpeta/': ''})])
+
+
+class CrearLoteTests(TestCase):
+
+    def test_sube_en_streaming_con_hash_y_encola_un_group(self):
+        usuario = User.objects.create_user('ana', password='clave')
+        s3 = S3Falso()
+        archivos = [zip_subido('catalogo.zip', {'a.txt': 'hola', 'b.txt': 'chau'})]
+
+        with clientes_falsos(s3=s3), mock.patch('gestion.subida_masiva.group') as grupo, \
+                self.captureOnCommitCallbacks(execute=True):
+            resultado = crear_lote(usuario, archivos)
+
+        self.assertEqual((resultado['documentos'], resultado['fallidos']), (2, []))
+        documentos = Documento.objects.filter(lote=resultado['lote']).order_by('titulo')
+        self.assertEqual([doc.hash_contenido for doc in documentos],
+                         [hashlib.sha256(b'hola').hexdigest(), hashlib.sha256(b'chau').hexdigest()])
+        self.assertEqual(s3.objetos[(BUCKET, documentos[0].archivo.name)], b'hola')
+        grupo.return_value.apply_async.assert_called_once_with()
+
+
+# ==============================================================================
+# URLS PREFIRMADAS CACHEADAS
+# ==============================================================================
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UrlFirmadaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.s3 = S3Falso()
+        falsos = clientes_falsos(s3=self.s3)
+        falsos.__enter__()
+        self.addCleanup(falsos.__exit__, None, None, None)
+        cache_nueva = CacheDosNiveles(prefijo=f'url-{self.id()}', ttl=3600, max_local=10)
+        mock.patch.object(urls_firmadas, 'cache_urls', cache_nueva).start()
+        self.ahora = 1_000_000.0
+        mock.patch('gestion.urls_firmadas.time.time', side_effect=lambda: self.ahora).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_reutiliza_la_firma_vigente(self):
+        primera = urls_firmadas.url_firmada('documentos_perfumeria/a.jpg')
+        self.ahora += 60
+        self.assertEqual(urls_firmadas.url_firmada('documentos_perfumeria/a.jpg'), primera)
+        self.assertEqual(self.s3.contar('generate_presigned_url'), 1)
+        self.assertIn('ResponseCacheControl=', primera)
+
+    def test_vuelve_a_firmar_cuando_queda_menos_que_el_margen(self):
+        config = settings.URLS_FIRMADAS
+        urls_firmadas.url_firmada('documentos_perfumeria/a.jpg')
+
+        self.ahora += config['EXPIRA'] - config['MARGEN'] - 1
+        urls_firmadas.url_firmada('documentos_perfumeria/a.jpg')
+        self.assertEqual(self.s3.contar('generate_presigned_url'), 1)
+
+        # La copia local sigue ahí, pero la firma ya no alcanzaría a durar MARGEN
+        self.ahora += 2
+        urls_firmadas.url_firmada('documentos_perfumeria/a.jpg')
+        self.assertEqual(self.s3.contar('generate_presigned_url'), 2)
+
+    def test_la_descarga_es_otra_entrada(self):
+        key = 'documentos_perfumeria/factura.pdf'
+        vista = urls_firmadas.url_firmada(key)
+        descarga = urls_firmadas.url_firmada(key, urls_firmadas.disposicion_adjunto(key))
+
+        self.assertNotEqual(vista, descarga)
+        self.assertIn('ResponseContentDisposition=attachment; filename="factura.pdf"', descarga)
+
+
+# ==============================================================================
+# IMÁGENES ANTES DE TEXTRACT / REKOGNITION
+# ==============================================================================
+def imagen_en_memoria(ancho, alto, formato='JPEG', ruido=True):
+    """ Con ruido la imagen no se comprime (pesa como una foto); sin ruido, blanca de 1 bit """
+    if ruido:
+        imagen = Image.frombytes('RGB', (ancho, alto), random.Random(0).randbytes(ancho * alto * 3))
+    else:
+        imagen = Image.new('1', (ancho, alto), 1)
+    salida = io.BytesIO()
+    imagen.save(salida, formato)
+    return salida.getvalue()
+
+
+LIMITES_IA = dict(settings.IA_IMAGEN, LADO_MAXIMO_OCR=400, LADO_MAXIMO_ETIQUETAS=200)
+
+
+@override_settings(IA_IMAGEN=LIMITES_IA)
+class ImagenesParaIaTests(SimpleTestCase):
+
+    def _preparar(self, datos, key='documentos_perfumeria/foto.jpg'):
+        self.s3 = S3Falso({(BUCKET, key): datos})
+        self.original = {'S3Object': {'Bucket': BUCKET, 'Name': key}}
+        return imagenes_para_ia(self.s3, BUCKET, key)
+
+    def _lados(self, entrada):
+        return Image.open(io.BytesIO(entrada['Bytes'])).size
+
+    def test_dentro_de_los_limites_va_el_original_sin_descargarlo(self):
+        entradas = self._preparar(imagen_en_memoria(150, 100))
+
+        self.assertEqual(entradas, {'ocr': self.original, 'etiquetas': self.original})
+        self.assertEqual(self.s3.contar('get_object'), 1)  # solo la cabecera
+
+    def test_reduce_solo_para_la_api_cuyo_lado_se_pasa(self):
+        entradas = self._preparar(imagen_en_memoria(300, 150))
+
+        self.assertEqual(entradas['ocr'], self.original)
+        self.assertEqual(self._lados(entradas['etiquetas']), (200, 100))
+
+    def test_foto_grande_se_reduce_para_las_dos(self):
+        entradas = self._preparar(imagen_en_memoria(800, 600))
+
+        self.assertEqual(self._lados(entradas['ocr']), (400, 300))
+        self.assertEqual(self._lados(entradas['etiquetas']), (200, 150))
+
+    def test_pasarse_de_bytes_obliga_a_reducir(self):
+        # Una foto en PNG: el lado está bien, pero pesa más que el límite de bytes
+        datos = imagen_en_memoria(150, 100, 'PNG')
+        with override_settings(IA_IMAGEN=dict(LIMITES_IA, MAX_BYTES_OCR=len(datos) - 1)):
+            entradas = self._preparar(datos, key='documentos_perfumeria/foto.png')
+
+        self.assertEqual(self._lados(entradas['ocr']), (150, 100))
+        self.assertLess(len(entradas['ocr']['Bytes']), len(datos))
+        self.assertEqual(entradas['etiquetas'], self.original)
+
+    def test_si_el_jpeg_pesa_mas_que_el_original_queda_el_original(self):
+        # Un PNG plano de 1 bit pesa cientos de bytes; su JPEG reducido, miles
+        entradas = self._preparar(imagen_en_memoria(800, 600, 'PNG', ruido=False), key='documentos_perfumeria/plano.png')
+
+        self.assertEqual(entradas, {'ocr': self.original, 'etiquetas': self.original})
+
+    def test_jpeg_reducido_que_no_entra_en_el_limite(self):
+        with override_settings(IA_IMAGEN=dict(LIMITES_IA, MAX_BYTES_ETIQUETAS=100)):
+            entradas = self._preparar(imagen_en_memoria(800, 600))
+
+        self.assertIn('Bytes', entradas['ocr'])
+        self.assertEqual(entradas['etiquetas'], self.original)
+
+    def test_archivo_ilegible_va_como_original(self):
+        entradas = self._preparar(b'no soy una imagen')
+
+        self.assertEqual(entradas, {'ocr': self.original, 'etiquetas': self.original})
+
+
+# ==============================================================================
+# PROGRESO DE LA INGESTA (delta o snapshot al reconectar)
+# ==============================================================================
+EN_MEMORIA_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'progreso'}}
+
+
+@override_settings(CACHES=EN_MEMORIA_CACHE, CHANNEL_LAYERS=EN_MEMORIA,
+                   PROGRESO=dict(settings.PROGRESO, MAX_DELTA=3))
+class ResincronizarTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(progreso.cache.clear)
+        self.snapshot = mock.patch('gestion.progreso.snapshot', return_value={'type': 'progreso_snapshot'}).start()
+        self.addCleanup(mock.patch.stopall)
+        self.doc = doc_falso(10, titulo='factura.pdf', usuario_id=1)
+
+    def _notificar(self, *etapas):
+        progreso.notificar(1, [progreso.evento(self.doc, etapa) for etapa in etapas])
+
+    def test_delta_con_el_ultimo_evento_de_cada_documento(self):
+        self._notificar('en_cola')
+        otro = doc_falso(11, titulo='foto.jpg', usuario_id=1)
+        progreso.notificar(1, [progreso.evento(otro, 'vision')])
+        self._notificar('extrayendo', 'embedding')
+
+        mensaje = progreso.resincronizar(1, desde=1)
+
+        self.assertEqual(mensaje['type'], 'progreso')
+        self.assertEqual(mensaje['seq'], 4)
+        self.assertEqual([(e['doc_id'], e['etapa'], e['seq']) for e in mensaje['eventos']],
+                         [(11, 'vision', 2), (10, 'embedding', 4)])
+        self.snapshot.assert_not_called()
+
+    def test_al_dia_recibe_un_delta_vacio(self):
+        self._notificar('en_cola')
+        self.assertEqual(progreso.resincronizar(1, desde=1), {'type': 'progreso', 'seq': 1, 'eventos': []})
+
+    def test_sin_secuencia_o_hueco_grande_recibe_snapshot(self):
+        self._notificar('en_cola', 'extrayendo', 'embedding', 'listo')
+
+        self.assertEqual(progreso.resincronizar(1, desde=None)['type'], 'progreso_snapshot')
+        self.assertEqual(progreso.resincronizar(1, desde=0)['type'], 'progreso_snapshot')  # 4 > MAX_DELTA
+        self.assertEqual(progreso.resincronizar(1, desde=1)['type'], 'progreso')
+
+    def test_secuencia_del_futuro_recibe_snapshot(self):
+        # Redis se reinició: el navegador vio más de lo que hay
+        self._notificar('en_cola')
+        self.assertEqual(progreso.resincronizar(1, desde=7)['type'], 'progreso_snapshot')
+
+    def test_evento_expirado_recibe_snapshot(self):
+        self._notificar('en_cola', 'extrayendo')
+        progreso.cache.delete(progreso._clave_evento(1, 2))
+
+        self.assertEqual(progreso.resincronizar(1, desde=0)['type'], 'progreso_snapshot')
+
+
+@override_settings(CACHES=EN_MEMORIA_CACHE)
+class SnapshotProgresoTests(TestCase):
+
+    def test_etapa_deducida_de_la_base_de_datos(self):
+        usuario = User.objects.create_user('ana', password='clave')
+        crear = lambda titulo, **campos: Documento.objects.create(
+            usuario=usuario, titulo=titulo, archivo=f'documentos_perfumeria/{titulo}', **campos)
+        crear('a.pdf', estado='pendiente')
+        crear('b.jpg', estado='procesando')
+        crear('c.pdf', estado='completado', embedding_pendiente=True)
+        crear('d.pdf', estado='completado')
+        progreso.cache.set(progreso._clave_seq(usuario.id), 9)
+        self.addCleanup(progreso.cache.clear)
+
+        mensaje = progreso.resincronizar(usuario.id, desde=None)
+
+        self.assertEqual((mensaje['type'], mensaje['seq']), ('progreso_snapshot', 9))
+        self.assertEqual([(e['titulo'], e['etapa']) for e in mensaje['eventos']],
+                         [('d.pdf', 'listo'), ('c.pdf', 'embedding'), ('b.jpg', 'vision'), ('a.pdf', 'en_cola')])
+
+
+# ==============================================================================
+# REPROCESO MASIVO RETOMABLE (manage.py reprocesar)
+# ==============================================================================
+class CheckpointTests(SimpleTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = Path(directorio.name) / 'reprocesar_embeddings.json'
+        self.parametros = {'modo': 'embeddings', 'backend': 'titan'}
+
+    def test_guarda_y_retoma(self):
+        self.assertFalse(Checkpoint(self.ruta, self.parametros).cargar())
+        checkpoint = Checkpoint(self.ruta, self.parametros)
+        checkpoint.ultimo_id, checkpoint.procesados = 42, 7
+        checkpoint.guardar()
+
+        retomado = Checkpoint(self.ruta, self.parametros)
+        self.assertTrue(retomado.cargar())
+        self.assertEqual((retomado.ultimo_id, retomado.procesados, retomado.terminado), (42, 7, False))
+        self.assertEqual([p.name for p in self.ruta.parent.iterdir()], [self.ruta.name])  # sin .tmp
+
+    def test_no_retoma_una_corrida_con_otros_parametros(self):
+        Checkpoint(self.ruta, self.parametros).guardar()
+
+        otro_modelo = Checkpoint(self.ruta, dict(self.parametros, backend='local'))
+        with self.assertRaisesMessage(CommandError, "otros parámetros"):
+            otro_modelo.cargar()
+
+
+@override_settings(EMBEDDINGS=SIN_ESPERA)
+class ReprocesarTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = str(Path(directorio.name) / 'reprocesar.json')
+        usuario = User.objects.create_user('ana', password='clave')
+        self.ids = [
+            Documento.objects.create(usuario=usuario, titulo=f'{i}.pdf', archivo=f'documentos_perfumeria/{i}.pdf',
+                                     estado='completado', texto_detectado='texto').id
+            for i in range(5)
+        ]
+        self.lotes = []
+
+    def _reprocesar(self, interrumpir_en=None):
+        def embeber(comando, docs, backend, concurrencia):
+            if len(self.lotes) == interrumpir_en:
+                raise KeyboardInterrupt
+            self.lotes.append([doc.id for doc in docs])
+
+        salida = io.StringIO()
+        with mock.patch.object(Reprocesar, '_embeber', autospec=True, side_effect=embeber):
+            call_command('reprocesar', '--modo', 'embeddings', '--lote', '2', '--checkpoint', self.ruta, stdout=salida)
+        return salida.getvalue()
+
+    def test_interrumpido_sigue_desde_el_ultimo_lote_terminado(self):
+        self.assertIn("Interrumpido", self._reprocesar(interrumpir_en=1))
+        self.assertEqual(self.lotes, [self.ids[:2]])
+
+        self.assertIn(f"Retomando desde el id {self.ids[1]}", self._reprocesar())
+        self.assertEqual(self.lotes, [self.ids[:2], self.ids[2:4], self.ids[4:]])
+
+        self.assertIn("ya terminó", self._reprocesar())
+        self.assertEqual(len(self.lotes), 3)
+
+
+# ==============================================================================
+# BENCHMARK OFFLINE (manage.py benchmark)
+# ==============================================================================
+class BenchmarkTests(SimpleTestCase):
+
+    def test_bedrock_falso_da_un_vector_por_texto(self):
+        bedrock = BedrockFalso(dimensiones=8)
+
+        def vector(texto):
+            respuesta = bedrock.invoke_model(body=json.dumps({'inputText': texto}))
+            return json.loads(respuesta['body'].read())['embedding']
+
+        self.assertEqual(vector('perfume rojo'), vector('perfume rojo'))
+        self.assertNotEqual(vector('perfume rojo'), vector('factura'))
+
+    def test_uso_de_cache_solo_de_la_corrida(self):
+        antes = {'hits_local': 5, 'hits_redis': 1, 'misses': 4, 'errores_redis': 0, 'entradas_local': 9}
+        despues = {'hits_local': 11, 'hits_redis': 3, 'misses': 6, 'errores_redis': 1, 'entradas_local': 12}
+
+        self.assertEqual(uso_cache(antes, despues),
+                         {'hits_local': 6, 'hits_redis': 2, 'misses': 2, 'errores_redis': 1, 'tasa_acierto': 0.8})
+
+    def test_comparar_informa_solo_lo_que_empeoro_mas_que_la_tolerancia(self):
+        def corrida(docs_por_segundo, p95_ms):
+            return {'ingesta': {'pdf': {'docs_por_segundo': docs_por_segundo, 'p95_ms': p95_ms}}}
+
+        regresiones = comparar(corrida(10.0, 100.0), corrida(7.0, 110.0), tolerancia=0.2)
+
+        self.assertEqual(regresiones, [{'metrica': 'ingesta.pdf.docs_por_segundo', 'antes': 10.0, 'ahora': 7.0,
+                                        'cambio': -0.3}])
@@ -0,0 +1,70 @@
+"""
+URLs prefirmadas de S3 cacheadas.
+
+Con AWS_QUERYSTRING_AUTH cada archivo.url calcula una firma SigV4 nueva: una
+lista de 500 tarjetas son más de mil firmas por render, y como la URL cambia
+cada vez el navegador vuelve a bajar todas las imágenes.
+
+Aquí la URL firmada se guarda (CacheDosNiveles) por (key, Content-Disposition)
+y se reutiliza mientras le quede al menos MARGEN de validez. La misma URL en
+cada render + Cache-Control en la respuesta de S3 = el navegador usa su caché.
+
+S3UrlsCacheadas (settings.DEFAULT_FILE_STORAGE) hace que todos los
+doc.archivo.url de las plantillas pasen por aquí sin tocarlas.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from .cache import CacheDosNiveles
+from .clientes_aws import obtener_cliente
+
+cache_urls = CacheDosNiveles(
+    prefijo='url',
+    # Nunca más que la firma, descontando lo que debe durarle al navegador
+    ttl=settings.URLS_FIRMADAS['EXPIRA'] - settings.URLS_FIRMADAS['MARGEN'],
+    max_local=settings.URLS_FIRMADAS['MAX_LOCAL'],
+)
+
+
+def disposicion_adjunto(key):
+    """ Content-Disposition que fuerza la descarga con el nombre original """
+    return f'attachment; filename="{key.split("/")[-1]}"'
+
+
+def _firmar(key, disposicion):
+    params = {
+        'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
+        'Key': key,
+        'ResponseCacheControl': settings.URLS_FIRMADAS['CACHE_CONTROL'],
+    }
+    if disposicion:
+        params['ResponseContentDisposition'] = disposicion
+    return obtener_cliente('s3').generate_presigned_url(
+        'get_object', Params=params, ExpiresIn=settings.URLS_FIRMADAS['EXPIRA'],
+    )
+
+
+def url_firmada(key, disposicion=None):
+    """ URL prefirmada de GET para el objeto, reutilizada mientras siga vigente """
+    clave = hashlib.sha256(f"{key}\n{disposicion or ''}".encode('utf-8')).hexdigest()
+    entrada = cache_urls.get(clave)
+    # La copia local puede durar más que la de Redis: se revisa la expiración real de la firma
+    if entrada and entrada['expira'] - time.time() > settings.URLS_FIRMADAS['MARGEN']:
+        return entrada['url']
+
+    url = _firmar(key, disposicion)
+    cache_urls.set(clave, {'url': url, 'expira': time.time() + settings.URLS_FIRMADAS['EXPIRA']})
+    return url
+
+
+class S3UrlsCacheadas(S3Boto3Storage):
+    """ S3Boto3Storage cuyo url() por defecto sale de la caché de URLs firmadas """
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if parameters or expire or http_method or not self.querystring_auth:
+            return super().url(name, parameters, expire, http_method)
+        return url_firmada(self._normalize_name(clean_name(name)))
@@ -2,77 +2,62 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .forms import DocumentoForm
 from .models import Documento
-from .tasks import procesar_archivo_ia 
-from django.db.models import Q
+from .progreso import avisar
+from .tasks import al_fallar, pedir_versiones, procesar_archivo_ia, revisar_textract_pdf
 from django.conf import settings
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction # Importante para la estabilidad de Celery
-import time
+from asgiref.sync import sync_to_async
+import asyncio
 import random        
-import boto3
 import json      
+import hmac
+import urllib.request
+from urllib.parse import urlparse
 
-# --- IMPORTS NUEVOS PARA BÚSQUEDA VECTORIAL ---
-from pgvector.django import L2Distance
+# --- IMPORTS PARA BÚSQUEDA HÍBRIDA (TEXTO + VECTORIAL) ---
+from .recuperacion import contexto_rag_async, recuperar
+from .paginacion import paginar_por_id, paginar_resultados
+from .deduplicacion import buscar_original, guardar_duplicado, hash_archivo
+from .subida_directa import SubidaInvalida, confirmar_subida, preparar_subida
+from .urls_firmadas import disposicion_adjunto, url_firmada
+from .subida_masiva import CargaInvalida, crear_lote, progreso_lote as resumen_lote
 
-# --- CONFIGURACIÓN DEL CHATBOT ---
-USA_BEDROCK = False 
+# --- CONFIGURACIÓN DEL CHATBOT (ver gestion/chat.py) ---
+from .chat import generar_respuesta
+from . import cache_respuestas
+from .embeddings import cache_consultas
 
-# Configuración Cliente Bedrock (Para generar embeddings de búsqueda)
-try:
-    bedrock_client = boto3.client('bedrock-runtime', region_name='us-east-1')
-except:
-    bedrock_client = None
-
-def generar_embedding_consulta(texto):
-    """ Convierte la búsqueda del usuario en un Vector usando Titan """
-    if not bedrock_client: return None
-    try:
-        body = json.dumps({"inputText": texto})
-        response = bedrock_client.invoke_model(
-            body=body,
-            modelId="amazon.titan-embed-text-v1",
-            accept="application/json",
-            contentType="application/json"
-        )
-        response_body = json.loads(response.get("body").read())
-        return response_body.get("embedding")
-    except Exception as e:
-        print(f"Error generando vector consulta: {e}")
-        return None
 
 @login_required
 def lista_documentos(request):
     query = request.GET.get('q')
-    
-    # 1. Filtro base de privacidad
-    documentos = Documento.objects.filter(usuario=request.user)
+    cursor = request.GET.get('cursor')
+    tamano = settings.DOCUMENTOS_POR_PAGINA
 
     if query:
-        # --- A) INTENTO DE BÚSQUEDA VECTORIAL (Inteligente) ---
-        vector_busqueda = generar_embedding_consulta(query)
-        
-        if vector_busqueda:
-            # Si Bedrock funcionó, ordenamos por similitud semántica
-            # (El más parecido tiene menor distancia)
-            documentos = documentos.annotate(
-                distancia=L2Distance('embedding', vector_busqueda)
-            ).order_by('distancia')
-        else:
-            # --- B) FALLBACK: BÚSQUEDA CLÁSICA (Si falla la IA) ---
-            documentos = documentos.filter(
-                Q(tags_ia__icontains=query) |  
-                Q(texto_detectado__icontains=query) |
-                Q(titulo__icontains=query)
-            ).order_by('-id')
+        # Búsqueda híbrida: full-text (GIN) + semántica (HNSW) fusionadas por relevancia.
+        # Si Bedrock no responde, queda solo la parte full-text.
+        documentos, siguiente_cursor = paginar_resultados(
+            lambda k: recuperar(request.user, query, k=k, ligero=True),
+            cursor, tamano,
+        )
     else:
-        # Si no hay búsqueda, orden normal
-        documentos = documentos.order_by('-id')
+        # Si no hay búsqueda, orden normal (paginado por -id)
+        documentos, siguiente_cursor = paginar_por_id(
+            Documento.objects.para_listado().filter(usuario=request.user),
+            cursor, tamano,
+        )
+
+    # Imágenes antiguas sin miniatura: se generan ahora, esta vez se muestra el original
+    pedir_versiones(documentos)
 
     context = {
         'documentos': documentos,
-        'query': query
+        'query': query,
+        'siguiente_cursor': siguiente_cursor,
     }
     return render(request, 'gestion/lista_documentos.html', context)
 
@@ -88,37 +73,126 @@ def subir_archivo_view(request):
             if not documento.titulo:
                 documento.titulo = request.FILES['archivo'].name
             
+            documento.hash_contenido = hash_archivo(request, 'archivo')
+
+            # Archivo idéntico ya procesado: copiamos su resultado, sin S3 ni IA
+            original = buscar_original(request.user, documento.hash_contenido) if settings.DEDUPLICACION['ACTIVA'] else None
+            if original:
+                guardar_duplicado(documento, original)
+                return redirect('subir_archivo')
+
             documento.estado = 'pendiente'
             documento.save() 
 
             # USAMOS TRANSACTION PARA EVITAR ERRORES DE CARRERA
             transaction.on_commit(lambda: procesar_archivo_ia.delay(documento.id))
+            transaction.on_commit(lambda: avisar(documento, 'en_cola'))
 
             return redirect('subir_archivo') 
     else:
         form = DocumentoForm()
 
-    mis_documentos = Documento.objects.filter(usuario=request.user).order_by('-id')
+    mis_documentos, siguiente_cursor = paginar_por_id(
+        Documento.objects.para_listado().filter(usuario=request.user),
+        request.GET.get('cursor'),
+        settings.DOCUMENTOS_POR_PAGINA,
+    )
 
     return render(request, 'gestion/subir_archivo.html', {
         'form': form, 
-        'mis_documentos': mis_documentos
+        'mis_documentos': mis_documentos,
+        'siguiente_cursor': siguiente_cursor,
     })
 
+# ==============================================================================
+#  SUBIDA DIRECTA NAVEGADOR -> S3 (ver gestion/subida_directa.py)
+# ==============================================================================
+@login_required
+def subida_preparar(request):
+    """ Firma la subida: POST prefirmado o multipart con URLs por parte """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    data = json.loads(request.body)
+    try:
+        return JsonResponse(preparar_subida(request.user, data.get('nombre', ''), data.get('tamano'), data.get('tipo')))
+    except SubidaInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@login_required
+def subida_confirmar(request):
+    """ El navegador terminó de subir: verificamos en S3 y creamos el Documento """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    data = json.loads(request.body)
+    try:
+        documento = confirmar_subida(request.user, data.get('ticket', ''), data.get('titulo'), data.get('partes'))
+    except SubidaInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'doc_id': documento.id, 'estado': documento.estado})
+
+
+# ==============================================================================
+#  CARGA MASIVA: VARIOS ARCHIVOS O ZIP (ver gestion/subida_masiva.py)
+# ==============================================================================
+@login_required
+def subida_masiva(request):
+    """ Campo 'archivos' (múltiple): sube todo, crea los documentos y encola la IA """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    try:
+        resultado = crear_lote(request.user, request.FILES.getlist('archivos'))
+    except CargaInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    resultado['progreso'] = reverse('progreso_lote', args=[resultado['lote']])
+    resultado['lote'] = str(resultado['lote'])
+    return JsonResponse(resultado)
+
+
+@login_required
+def progreso_lote(request, lote):
+    """ Avance del lote: cuántos documentos hay en cada estado """
+    progreso = resumen_lote(request.user, lote)
+    if progreso is None:
+        return JsonResponse({'error': 'Lote no encontrado'}, status=404)
+    return JsonResponse(progreso)
+
+
 def eliminar_documento(request, documento_id):
     documento = get_object_or_404(Documento, id=documento_id)
     # Seguridad extra: solo borrar si es del usuario
     if documento.usuario == request.user:
         documento.delete()
+        cache_respuestas.invalidar_usuario(request.user.id)
     return redirect('subir_archivo')
 
 
 # ==============================================================================
-#  API DEL CHATBOT (CEREBRO RAG) - SIN CAMBIOS
+#  API DEL CHATBOT (CEREBRO RAG) - VISTA ASYNC
+#
+#  Bajo Daphne una vista sync ocupa un hilo mientras espera a Postgres y a
+#  Bedrock. Esta es async: la búsqueda y la llamada al modelo corren en pools
+#  de hilos acotados, con timeouts, y el event loop sigue atendiendo requests.
 # ==============================================================================
-@csrf_exempt
-def chat_api(request):
-    if request.method == 'POST':
+
+# Preguntas en curso por usuario (en este proceso)
+_chats_en_curso = {}
+
+
+async def chat_api(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    usuario = await sync_to_async(_usuario_autenticado)(request)
+    if usuario is None:
+        return JsonResponse({'error': 'No autenticado'}, status=401)
+
+    config = settings.CHAT
+    if _chats_en_curso.get(usuario.id, 0) >= config['MAX_POR_USUARIO']:
+        return JsonResponse({'error': 'Espera a que termine tu pregunta anterior'}, status=429)
+
+    _chats_en_curso[usuario.id] = _chats_en_curso.get(usuario.id, 0) + 1
+    try:
         data = json.loads(request.body)
         pregunta = data.get('pregunta', '').lower()
         
@@ -128,79 +202,62 @@ def chat_api(request):
             'docs': []
         }
 
-        # PASO 1: RETRIEVAL
-        palabras = pregunta.split()
-        q_obj = Q()
-        for p in palabras:
-            if len(p) > 3:
-                q_obj |= Q(texto_detectado__icontains=p) | Q(tags_ia__icontains=p)
-        
-        docs_contexto = Documento.objects.filter(q_obj, usuario=request.user).order_by('-id')[:3]
-        
-        texto_contexto = ""
-        for d in docs_contexto:
-            texto_contexto += f"\n- DOC '{d.titulo}': {d.texto_detectado[:800]}..."
+        # PASO 0: ¿ya respondimos una pregunta parecida? (caché semántica por usuario)
+        consulta = await sync_to_async(cache_respuestas.buscar, thread_sensitive=False)(usuario.id, pregunta)
+        if consulta.respuesta:
+            return JsonResponse(consulta.respuesta)
+
+        # PASO 1: RETRIEVAL (los mejores fragmentos, hasta el presupuesto de tokens)
+        cacheable = True
+        try:
+            texto_contexto, docs_contexto = await asyncio.wait_for(
+                contexto_rag_async(usuario, pregunta), config['TIMEOUT_RECUPERACION']
+            )
+        except asyncio.TimeoutError:
+            print(f"Timeout recuperación chat ({config['TIMEOUT_RECUPERACION']}s)")
+            texto_contexto, docs_contexto = "", []
+            cacheable = False
 
         # PASO 2: GENERACIÓN
-        if USA_BEDROCK and bedrock_client:
-            try:
-                prompt = f"""Eres un asistente de Retail. Responde usando SOLO este contexto:
-                {texto_contexto}
-                
-                Pregunta: {pregunta}
-                """
-
-                body = json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 300,
-                    "messages": [{"role": "user", "content": prompt}]
-                })
-
-                response = bedrock_client.invoke_model(
-                    body=body, 
-                    modelId="anthropic.claude-3-haiku-20240307-v1:0",
-                    accept='application/json', contentType='application/json'
-                )
-                
-                resp_body = json.loads(response.get('body').read())
-                response_data['texto'] = resp_body['content'][0]['text']
-                response_data['acciones'] = [{'label': 'Ver Fuentes', 'action': 'show_sources'}]
-
-            except Exception as e:
-                print(f"Error Bedrock: {e}")
-                response_data['texto'] = "Error conectando con el cerebro IA."
-
-        else:
-            # MODO SIMULACIÓN
-            time.sleep(1)
-            
-            if 'factura' in pregunta or 'vence' in pregunta:
-                response_data['texto'] = (
-                    "⚠️ **(Simulación)** Alerta de Tesorería Detectada.\n"
-                    "El sistema RAG encontró una factura próxima a vencer en tus documentos."
-                )
-                if docs_contexto:
-                    response_data['texto'] += f"\nFuente: {docs_contexto[0].titulo}"
-                
-                response_data['acciones'] = [
-                    {'label': '📧 Notificar Contabilidad', 'action': 'notify'},
-                    {'label': '💰 Bloquear SAP', 'action': 'block'}
-                ]
-            
-            elif 'rot' in pregunta or 'calidad' in pregunta:
-                response_data['texto'] = "🔍 **(Simulación)** Reporte de Calidad: Se detectaron productos dañados en las imágenes analizadas."
-                response_data['acciones'] = [{'label': 'Generar Reclamo', 'action': 'claim'}]
-            
-            else:
-                response_data['texto'] = "Modo Laboratorio: No tengo acceso a Bedrock aún, pero busqué en tu base de datos."
-                if docs_contexto:
-                    response_data['texto'] += f"\nEncontré estos documentos relacionados: {[d.titulo for d in docs_contexto]}"
-                else:
-                    response_data['texto'] += "\nNo encontré documentos que coincidan con tu búsqueda."
+        try:
+            response_data['texto'], response_data['acciones'] = await asyncio.wait_for(
+                generar_respuesta(pregunta, texto_contexto, docs_contexto), config['TIMEOUT_GENERACION']
+            )
+        except asyncio.TimeoutError:
+            print(f"Timeout Bedrock chat ({config['TIMEOUT_GENERACION']}s)")
+            return JsonResponse({'error': 'El cerebro IA tardó demasiado en responder.'}, status=504)
+        except Exception as e:
+            print(f"Error Bedrock: {e}")
+            response_data['texto'] = "Error conectando con el cerebro IA."
+            cacheable = False
 
+        response_data['docs'] = [d.titulo for d in docs_contexto]
+        if cacheable:
+            await sync_to_async(cache_respuestas.guardar, thread_sensitive=False)(
+                consulta, pregunta, response_data
+            )
         return JsonResponse(response_data)
-    
-    return JsonResponse({'error': 'Método no permitido'}, status=405)
+    finally:
+        _chats_en_curso[usuario.id] -= 1
+        if not _chats_en_curso[usuario.id]:
+            del _chats_en_curso[usuario.id]
+
+
+# csrf_exempt de Django 4.2 envuelve la vista en una función sync: se marca a mano
+chat_api.csrf_exempt = True
+
+
+@login_required
+def metricas_chat(request):
+    """ Tasa de acierto de la caché semántica del chat y de la de embeddings de consultas (solo staff) """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Solo staff'}, status=403)
+    return JsonResponse({**cache_respuestas.metricas(), 'embeddings_consultas': cache_consultas.estadisticas()})
+
+
+def _usuario_autenticado(request):
+    # request.user es lazy y consulta la sesión/BD: se evalúa fuera del event loop
+    return request.user if request.user.is_authenticated else None
 
 
 def visualizar_documento(request, documento_id):
@@ -209,7 +266,9 @@ def visualizar_documento(request, documento_id):
     if doc.usuario != request.user:
          return redirect('subir_archivo')
 
-    es_imagen = doc.archivo.name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))
+    pedir_versiones([doc])
+    # Con vista previa WebP también se pueden mostrar los TIFF
+    es_imagen = doc.archivo.name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')) or bool(doc.vista_previa)
     return render(request, 'gestion/visualizar.html', {'doc': doc, 'es_imagen': es_imagen})
 
 def descargar_documento(request, documento_id):
@@ -217,21 +276,49 @@ def descargar_documento(request, documento_id):
     if doc.usuario != request.user:
          return redirect('subir_archivo')
          
-    client = boto3.client('s3', 
-                          aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                          region_name='us-east-1')
     try:
-        url_descarga = client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': settings.AWS_STORAGE_BUCKET_NAME,
-                'Key': doc.archivo.name,
-                'ResponseContentDisposition': f'attachment; filename="{doc.archivo.name.split("/")[-1]}"'
-            },
-            ExpiresIn=3600
-        )
+        url_descarga = url_firmada(doc.archivo.name, disposicion_adjunto(doc.archivo.name))
         return redirect(url_descarga)
     except Exception as e:
         print(f"Error descarga: {e}")
         return redirect(doc.archivo.url)
+
+
+# ==============================================================================
+#  NOTIFICACIÓN SNS DE TEXTRACT (PDF terminado)
+# ==============================================================================
+@csrf_exempt
+def textract_notificacion(request):
+    """
+    Textract publica en SNS cuando termina un job y SNS hace POST aquí.
+    No confiamos en el contenido: solo adelantamos la revisión del job,
+    que vuelve a consultar el estado real a Textract.
+    """
+    token = settings.TEXTRACT_PDF['WEBHOOK_TOKEN']
+    if not token or not hmac.compare_digest(request.GET.get('token', ''), token):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    try:
+        mensaje_sns = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+
+    # 1. Alta de la suscripción: SNS pide visitar una URL de confirmación
+    if mensaje_sns.get('Type') == 'SubscriptionConfirmation':
+        url = urlparse(mensaje_sns.get('SubscribeURL', ''))
+        if url.scheme == 'https' and url.hostname and url.hostname.endswith('.amazonaws.com'):
+            urllib.request.urlopen(url.geturl(), timeout=5).close()
+            return JsonResponse({'ok': True})
+        return JsonResponse({'error': 'SubscribeURL inválida'}, status=400)
+
+    # 2. Job terminado: JobTag trae el id del documento
+    try:
+        datos = json.loads(mensaje_sns.get('Message', '{}'))
+        documento_id = int(datos['JobTag'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Mensaje sin JobTag'}, status=400)
+
+    revisar_textract_pdf.apply_async((documento_id,), link_error=al_fallar(documento_id))
+    return JsonResponse({'ok': True})
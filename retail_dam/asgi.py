@@ -15,8 +15,14 @@ import gestion.routing  # Importamos las rutas que creamos en el paso 4
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'retail_dam.settings')
 
+django_asgi_app = get_asgi_application()
+
+# Clientes AWS (S3, Bedrock...) creados al arrancar, no en la primera request
+from gestion.clientes_aws import precalentar_clientes
+precalentar_clientes()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             gestion.routing.websocket_urlpatterns
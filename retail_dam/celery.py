@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Establecer el módulo de configuración de Django por defecto
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'retail_dam.settings')
@@ -11,6 +12,17 @@ app = Celery('retail_dam')
 # - namespace='CELERY' significa que todas las claves de conf. relacionadas con celery
 #   deben tener el prefijo 'CELERY_'.
 app.config_from_object('django.conf:settings', namespace='CELERY')
+# (Las colas del pipeline de ingesta y su concurrencia están en settings:
+#  CELERY_TASK_ROUTES y CELERY_CONCURRENCIA_COLAS)
 
 # Cargar tareas de todos los módulos de aplicaciones de Django registrados.
 app.autodiscover_tasks()
+
+
+# Cada proceso hijo del worker (prefork) crea sus propios clientes AWS:
+# los heredados del padre compartirían sockets entre procesos.
+@worker_process_init.connect
+def iniciar_clientes_aws(**kwargs):
+    from gestion.clientes_aws import reiniciar_clientes, precalentar_clientes
+    reiniciar_clientes()
+    precalentar_clientes()
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'storages',
     'channels',
     'gestion',
@@ -157,12 +158,41 @@ AWS_S3_ADDRESSING_STYLE = "virtual"
 
 
 # esto le dice a django: usa s3 para todo lo que suban los usuarios
-DEFAULT_FILE_STORAGE ='storages.backends.s3boto3.S3Boto3Storage'
+# (S3Boto3Storage con las URLs firmadas cacheadas, ver gestion/urls_firmadas.py)
+DEFAULT_FILE_STORAGE = 'gestion.urls_firmadas.S3UrlsCacheadas'
+
+# URLs firmadas de archivo.url y descargas: se reutilizan en vez de firmar en cada render
+URLS_FIRMADAS = {
+    'EXPIRA': 6 * 3600,                        # validez de la firma (segundos)
+    'MARGEN': 3600,                            # toda URL entregada sigue válida al menos esto
+    'MAX_LOCAL': 5000,
+    'CACHE_CONTROL': 'private, max-age=86400', # que el navegador guarde las imágenes
+}
+AWS_QUERYSTRING_EXPIRE = URLS_FIRMADAS['EXPIRA']
 
 #opcional : para que no soescriba archivos con el mismo nombre
 AWS_S3_FILE_OVERWRITE = False
 
 
+# Subida directa navegador -> S3 con URLs prefirmadas (gestion/subida_directa.py)
+SUBIDA_DIRECTA = {
+    'PREFIJO': 'documentos_perfumeria/',       # mismo upload_to de Documento.archivo
+    'MAX_TAMANO': 5 * 1024 ** 3,               # 5 GB
+    'UMBRAL_MULTIPART': 100 * 1024 * 1024,     # sobre esto: multipart por partes
+    'TAMANO_PARTE': 16 * 1024 * 1024,          # S3 exige >= 5 MB (salvo la última)
+    'EXPIRA': 3600,                            # segundos de validez de las URLs firmadas
+}
+
+# Carga masiva: varios archivos o un ZIP en un solo POST (gestion/subida_masiva.py)
+SUBIDA_MASIVA = {
+    'MAX_ARCHIVOS': 500,                       # por lote (contando los de dentro de los ZIP)
+    'MAX_TAMANO_ARCHIVO': 200 * 1024 * 1024,   # descomprimido, por archivo
+    'MAX_TAMANO_TOTAL': 2 * 1024 ** 3,         # descomprimido, todo el lote (ZIP bombs)
+    'HILOS_S3': 8,                             # subidas a S3 en paralelo
+}
+# Django corta en 100 archivos por request; la carga masiva permite más
+DATA_UPLOAD_MAX_NUMBER_FILES = SUBIDA_MASIVA['MAX_ARCHIVOS']
+
 
 #--- configuracion de archivos estaticos (css, js, imagenes) ----
 STATIC_URL = '/static/'
@@ -185,6 +215,32 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'America/Santiago'
 
+# Pipeline de ingesta: cada etapa tiene su propia cola (ver gestion/tasks.py)
+CELERY_TASK_ROUTES = {
+    'gestion.tasks.procesar_archivo_ia': {'queue': 'ingesta'},
+    'gestion.tasks.etapa_extraer': {'queue': 'extraccion'},
+    'gestion.tasks.etapa_extraer_pdf': {'queue': 'extraccion'},
+    'gestion.tasks.revisar_textract_pdf': {'queue': 'extraccion'},
+    'gestion.tasks.etapa_imagen': {'queue': 'vision'},
+    'gestion.tasks.etapa_versiones': {'queue': 'vision'},
+    'gestion.tasks.procesar_lote_embeddings': {'queue': 'embeddings'},
+    'gestion.tasks.etapa_finalizar': {'queue': 'finalizacion'},
+}
+
+# Concurrencia por cola. Cada worker atiende una cola y la declara con la
+# variable de entorno CELERY_COLA (ver docker-compose.yml):
+#   CELERY_COLA=extraccion celery -A retail_dam worker -Q extraccion
+CELERY_CONCURRENCIA_COLAS = {
+    'ingesta': 2,
+    'extraccion': 4,
+    'vision': 2,
+    'embeddings': 1,
+    'finalizacion': 2,
+}
+CELERY_WORKER_CONCURRENCY = CELERY_CONCURRENCIA_COLAS.get(os.getenv('CELERY_COLA'))
+# Las etapas de OCR son largas: cada proceso toma una tarea a la vez
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 
 # --- SEGURIDAD CSRF PARA AWS ---
 # Esto permite que el Logout funcione desde tu IP pública
@@ -209,3 +265,218 @@ CHANNEL_LAYERS = {
         },
     },
 }
+
+# Progreso de la ingesta por WebSocket (gestion/progreso.py)
+PROGRESO = {
+    'INTERVALO_ENVIO': 0.5,    # segundos: los eventos de ese lapso van juntos en un mensaje
+    'TTL_EVENTOS': 3600,       # cuánto se guardan para entregarlos al reconectar
+    'MAX_DELTA': 500,          # si se perdió más que esto, se manda el snapshot
+    'MAX_SNAPSHOT': 50,        # documentos en el snapshot (los más recientes)
+}
+
+
+# --- BÚSQUEDA VECTORIAL (pgvector) ---
+# METRICA: 'l2', 'coseno' o 'producto_interno'. Debe existir un índice con el mismo
+# opclass (ver: python manage.py indice_vectorial), si no Postgres recorre toda la tabla.
+BUSQUEDA_VECTORIAL = {
+    'METRICA': 'l2',
+    'TOP_K': 50,                 # máximo de resultados por búsqueda
+    'DISTANCIA_MAXIMA': None,    # corte opcional (None = sin corte)
+    'EF_SEARCH': 100,            # HNSW: candidatos explorados por consulta
+    'PROBES': 10,                # IVFFlat: listas revisadas por consulta
+    'ESCANEO_ITERATIVO': 'relaxed_order',  # solo se aplica con pgvector >= 0.8 (None = desactivado)
+}
+
+
+# --- CACHÉ (Usando el mismo Redis de Celery/Channels, base de datos 1) ---
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://redis:6379/1",
+    }
+}
+
+# --- EMBEDDINGS ---
+# Backend: 'titan' (Bedrock) o 'local' (vector determinístico, sin red: solo pruebas y benchmark)
+EMBEDDINGS = {
+    'BACKEND': os.getenv('EMBEDDINGS_BACKEND', 'titan'),
+    'DIMENSIONES': 1536,
+    # Micro-lotes de ingesta
+    'TAMANO_LOTE': 64,              # documentos por lote (un solo bulk_update)
+    'ESPERA_LOTE': 2,               # segundos que se juntan documentos antes de lanzar el lote
+    'TIMEOUT_LOTE': 300,            # la marca de "lote agendado" y el reclamo de sus filas expiran pasado esto
+    'MAX_CARACTERES_TEXTO': 20_000, # Titan v1 acepta ~8k tokens
+    # Concurrencia y control de tasa adaptativo (llamadas por segundo, por worker)
+    'CONCURRENCIA': 4,
+    'TASA_INICIAL': 5.0,
+    'TASA_MINIMA': 0.5,
+    'TASA_MAXIMA': 20.0,
+    'INCREMENTO_TASA': 0.5,         # + por cada llamada exitosa
+    'FACTOR_BAJA': 0.5,             # x por cada throttling
+    'REINTENTOS': 4,                # reintentos de un texto limitado por Bedrock
+    # Documentos a los que les falta algún vector tras un lote
+    'MAX_INTENTOS': 6,              # lotes fallidos antes de sacarlo de la cola
+    'ESPERA_REINTENTO': 60,         # segundos antes del 2º intento; se duplica en cada fallo
+    'ESPERA_REINTENTO_MAXIMA': 3600,
+}
+
+# Caché de embeddings de consultas: LRU local + Redis compartido
+CACHE_EMBEDDINGS = {
+    'TTL': 60 * 60 * 24 * 7,  # 7 días (el vector de un texto no cambia mientras no cambie el modelo)
+    'MAX_LOCAL': 2000,        # entradas en memoria por proceso (~12 KB cada una)
+}
+
+# --- BÚSQUEDA FULL-TEXT (tsvector + GIN) ---
+BUSQUEDA_TEXTO = {
+    'CONFIG': 'spanish',          # diccionario de Postgres (stemming en español)
+    'TOP_K': 50,
+    'MAX_CARACTERES': 200000,     # OCR indexado por documento (tsvector tiene límite de 1 MB)
+}
+
+# --- RECUPERACIÓN HÍBRIDA (buscador + chatbot) ---
+RECUPERACION = {
+    'TOP_K': 50,          # resultados finales
+    'CANDIDATOS': 50,     # candidatos por cada motor antes de fusionar
+    'K_RRF': 60,          # constante de Reciprocal Rank Fusion
+    'PESO_TEXTO': 1.0,
+    'PESO_VECTOR': 1.0,
+    'HILOS': 16,          # consultas simultáneas por proceso (full-text + las dos del chat async)
+    'MAX_RESULTADOS': 150,  # tope de resultados paginables del buscador (candidatos pedidos en cada página)
+}
+
+# --- CHATBOT RAG (gestion/chat.py) ---
+CHAT = {
+    'MODELO': 'anthropic.claude-3-haiku-20240307-v1:0',
+    'MAX_TOKENS': 300,
+    'HILOS_BEDROCK': 32,           # respuestas en streaming simultáneas por proceso
+    'PAUSA_SIMULACION': 0.03,      # segundos entre palabras en modo laboratorio
+    # chat_api (vista async)
+    'TIMEOUT_RECUPERACION': 5,     # segundos para encontrar los fragmentos
+    'TIMEOUT_GENERACION': 30,      # segundos para la respuesta de Bedrock (y read_timeout de su cliente)
+    'MAX_POR_USUARIO': 2,          # preguntas en curso por usuario y por proceso (más -> 429)
+}
+
+# Caché semántica de respuestas del chat, por usuario (gestion/cache_respuestas.py)
+CACHE_RESPUESTAS = {
+    'UMBRAL_SIMILITUD': 0.95,      # coseno mínimo entre preguntas para reutilizar la respuesta
+    'MAX_POR_USUARIO': 50,         # respuestas guardadas por usuario (LRU)
+    'TTL': 60 * 60 * 24,           # 1 día
+    'MAX_LOCAL': 100,              # usuarios en memoria por proceso (50 x ~6 KB de vector + respuesta c/u)
+}
+
+# --- FRAGMENTOS (chunks) PARA EL CHAT RAG ---
+FRAGMENTOS = {
+    'TAMANO': 1200,                # caracteres por fragmento (~300 tokens)
+    'SOLAPAMIENTO': 200,           # caracteres compartidos con el fragmento vecino
+    'MAX_POR_DOCUMENTO': 400,      # tope de fragmentos por documento
+    'CARACTERES_POR_TOKEN': 4,     # estimación para el presupuesto del prompt
+    'CANDIDATOS': 20,              # fragmentos por motor (texto / vector) antes de fusionar
+    'PRESUPUESTO_TOKENS': 1500,    # tamaño máximo del contexto que va al prompt
+    'LOTE_EXISTENTES': 200,        # documentos por lote en 'manage.py fragmentar_existentes'
+}
+
+# Tarjetas por página en el buscador y en la página de subida (paginación por cursor)
+DOCUMENTOS_POR_PAGINA = 30
+
+# --- TEXTRACT ASÍNCRONO (PDFs) ---
+# El worker no espera: revisa el job y se reprograma (backoff) hasta que termine.
+# Con SNS configurado, Textract avisa al terminar vía /api/textract/notificacion/?token=...
+TEXTRACT_PDF = {
+    'ESPERA_INICIAL': 5,        # segundos hasta la primera revisión
+    'ESPERA_MAXIMA': 60,        # tope del backoff entre revisiones
+    'MAX_REVISIONES': 120,      # luego de esto el documento queda en 'error'
+    'SNS_TOPIC_ARN': os.getenv('TEXTRACT_SNS_TOPIC_ARN'),
+    'SNS_ROLE_ARN': os.getenv('TEXTRACT_SNS_ROLE_ARN'),
+    'WEBHOOK_TOKEN': os.getenv('TEXTRACT_WEBHOOK_TOKEN'),
+}
+
+# --- IA SOBRE IMÁGENES (Textract + Rekognition en paralelo) ---
+# Timeouts por llamada (segundos): si una se demora, la otra se guarda igual
+IA_IMAGEN = {
+    'TIMEOUT_OCR': 20,
+    'TIMEOUT_VISION': 10,
+    # Antes de la IA las fotos que pasan el lado o los bytes de cada API se reducen
+    # y se mandan como bytes (gestion/miniaturas.py); las demás van como el original en S3
+    'BYTES_CABECERA': 64 * 1024,              # lo que se baja para leer el ancho y alto
+    'LADO_MAXIMO_OCR': 2560,                  # suficiente para el texto chico de las etiquetas
+    'LADO_MAXIMO_ETIQUETAS': 1280,
+    'CALIDAD_JPEG': 90,
+    'MAX_BYTES_OCR': 10 * 1024 * 1024,        # límites de Image.Bytes de Textract / Rekognition
+    'MAX_BYTES_ETIQUETAS': 5 * 1024 * 1024,
+}
+
+# --- VERSIONES REDUCIDAS DE IMÁGENES (WebP, gestion/miniaturas.py) ---
+# Las tarjetas y el visor muestran estas en vez del original de varios MB
+VERSIONES_IMAGEN = {
+    'PREFIJO': 'versiones/',
+    'TAMANOS': {                 # campo de Documento -> lado máximo en píxeles
+        'miniatura': 320,        # tarjetas de 140 px (x2 para pantallas retina)
+        'vista_previa': 1600,    # visualizar_documento
+    },
+    'CALIDAD': 80,
+    'REINTENTO_PEREZOSO': 600,   # segundos antes de volver a encolar una fila antigua sin versiones
+}
+
+# --- CLIENTES AWS (boto3) ---
+# Un cliente por servicio y por proceso (gestion/clientes_aws.py), con esta config de botocore
+AWS_CLIENTES = {
+    'region_name': AWS_S3_REGION_NAME,
+    'max_pool_connections': 25,   # conexiones keep-alive por cliente (>= hilos que lo usan)
+    'connect_timeout': 5,
+    'read_timeout': 60,
+    'retries': {'max_attempts': 3, 'mode': 'standard'},
+}
+# Se crean al arrancar cada worker de Celery y el servidor ASGI
+AWS_CLIENTES_PRECALENTAR = ['s3', 'textract', 'rekognition', 'bedrock-runtime']
+
+# --- EXTRACCIÓN DE TEXTO (streaming) ---
+EXTRACCION = {
+    'MAX_CARACTERES': 2_000_000,              # tope de texto guardado por documento
+    'SPOOL_MAX_MEMORIA': 8 * 1024 * 1024,     # sobre esto el archivo bajado pasa a disco
+    'TAMANO_BLOQUE': 64 * 1024,               # bytes por lectura desde S3
+    # PDF: si las primeras páginas traen capa de texto se leen local (sin Textract)
+    'PDF_PAGINAS_MUESTRA': 3,
+    'PDF_MIN_CARACTERES_PAGINA': 50,          # menos que esto = escaneado -> Textract
+}
+
+# --- DEDUPLICACIÓN POR CONTENIDO (SHA-256) ---
+# Archivos idénticos copian el resultado de IA del original (gestion/deduplicacion.py)
+DEDUPLICACION = {
+    'ACTIVA': True,
+    'REUSAR_OBJETO_S3': True,   # el duplicado apunta al mismo objeto de S3 (no se sube otra vez)
+}
+
+# El primer handler calcula el hash mientras llega el archivo; los otros son los de Django
+FILE_UPLOAD_HANDLERS = [
+    'gestion.deduplicacion.HashSubidaHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# --- REPROCESO MASIVO (manage.py reprocesar) ---
+REPROCESO = {
+    'CHUNK_SIZE': 2000,                  # filas por ida al cursor de servidor (.iterator)
+    'LOTE_EMBEDDINGS': 64,               # documentos por bulk_update (modo embeddings)
+    'LOTE_PIPELINE': 50,                 # documentos en vuelo a la vez en Celery (modo pipeline)
+    'ESPERA_PIPELINE': 5,                # segundos entre revisiones de un lote en Celery
+    'TIMEOUT_LOTE_PIPELINE': 30 * 60,    # pasado esto se sigue con el siguiente lote igual
+    'DIRECTORIO_CHECKPOINT': BASE_DIR,   # reprocesar_<modo>.json: el último id terminado
+}
+
+# --- BENCHMARKS OFFLINE (manage.py benchmark, gestion/benchmark.py) ---
+# AWS se simula en el proceso; corre en una base de pruebas desechable y con prefijo propio en Redis
+BENCHMARK = {
+    'TAMANOS': [10_000, 100_000, 1_000_000],   # documentos sintéticos del usuario de prueba
+    'DOCS_POR_TIPO': 20,                       # archivos por tipo en la prueba de ingesta
+    'REPETICIONES': 30,                        # mediciones por escenario de búsqueda/chat
+    'CALENTAMIENTO': 3,                        # llamadas descartadas antes de medir
+    'LOTE_INSERCION': 2000,                    # filas por bulk_create al poblar
+    # Segundos por llamada de cada doble (o [mínimo, máximo] para una espera al azar)
+    'LATENCIAS': {
+        's3': [0.01, 0.04],
+        'textract': [0.4, 1.2],
+        'rekognition': [0.2, 0.6],
+        'bedrock': [0.05, 0.15],
+    },
+    'TOLERANCIA': 0.20,                        # --comparar: peor que esto (20%) cuenta como regresión
+}
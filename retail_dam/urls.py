@@ -29,11 +29,17 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
   # ruta principal: si entran a la raiz, van a subir archivos
     path('', subir_archivo_view, name='subir_archivo'),
+    path('api/subida/preparar/', views.subida_preparar, name='subida_preparar'),
+    path('api/subida/confirmar/', views.subida_confirmar, name='subida_confirmar'),
+    path('api/subida/masiva/', views.subida_masiva, name='subida_masiva'),
+    path('api/lote/<uuid:lote>/', views.progreso_lote, name='progreso_lote'),
     path('eliminar/<int:documento_id>/', views.eliminar_documento, name='eliminar_documento'),
     path('buscar/', views.lista_documentos, name='lista_documentos'),
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/metricas/', views.metricas_chat, name='metricas_chat'),
     path('ver/<int:documento_id>/', views.visualizar_documento, name='visualizar_documento'),
     path('descargar/<int:documento_id>/', views.descargar_documento, name='descargar_documento'),    
+    path('api/textract/notificacion/', views.textract_notificacion, name='textract_notificacion'),
     
 ]
 